@@ -2,9 +2,14 @@ import streamlit as st
 import requests
 import pandas as pd
 import json
+import threading
+import uuid
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from streamlit.runtime.scriptrunner import add_script_run_ctx
+from urllib3.util.retry import Retry
 
 # Set page config
 st.set_page_config(
@@ -63,6 +68,284 @@ st.markdown("<p style='text-align: center;'>Get personalized food recommendation
 API_URL = "http://127.0.0.1:4000"  # Change this to your actual API endpoint when deployed
 RECOMMENDATIONS_ENDPOINT = f"{API_URL}/api/v1/recommendations"
 DAILY_MEAL_ENDPOINT = f"{API_URL}/api/v1/dailyMeal"
+# every browser session is its own user, with its own history on the API
+if "user_id" not in st.session_state:
+    st.session_state.user_id = f"fit-ai-{uuid.uuid4().hex}"
+# (connect, read) seconds, a stuck API must not freeze the page
+REQUEST_TIMEOUT = (3.05, 10)
+# responses are memoized per user and slider values for this many seconds
+CACHE_TTL = 300
+
+# Mock data structure matching the API response, used when the API is unreachable
+MOCK_RECOMMENDATIONS = [
+    {
+        "type": "Breakfast",
+        "food": {
+            "name": "Oatmeal with Berries",
+            "calories": 250,
+            "fat": 5,
+            "carbo": 40,
+            "nutrient_density": 1.4
+        }
+    },
+    {
+        "type": "Breakfast",
+        "food": {
+            "name": "Greek Yogurt with Honey",
+            "calories": 180,
+            "fat": 3,
+            "carbo": 25,
+            "nutrient_density": 1.2
+        }
+    },
+    # Add mock data for other meal types...
+    {
+        "type": "Lunch/Dinner",
+        "food": {
+            "name": "Grilled Chicken Salad",
+            "calories": 350,
+            "fat": 12,
+            "carbo": 20,
+            "nutrient_density": 0.9
+        }
+    },
+    {
+        "type": "Lunch/Dinner",
+        "food": {
+            "name": "Salmon with Vegetables",
+            "calories": 420,
+            "fat": 18,
+            "carbo": 15,
+            "nutrient_density": 0.8
+        }
+    },
+    {
+        "type": "Snack",
+        "food": {
+            "name": "Mixed Nuts",
+            "calories": 170,
+            "fat": 14,
+            "carbo": 6,
+            "nutrient_density": 0.5
+        }
+    },
+    {
+        "type": "Snack",
+        "food": {
+            "name": "Apple with Peanut Butter",
+            "calories": 200,
+            "fat": 8,
+            "carbo": 25,
+            "nutrient_density": 0.7
+        }
+    },
+    {
+        "type": "Drink",
+        "food": {
+            "name": "Green Smoothie",
+            "calories": 150,
+            "fat": 2,
+            "carbo": 30,
+            "nutrient_density": 1.1
+        }
+    },
+    {
+        "type": "Drink",
+        "food": {
+            "name": "Protein Shake",
+            "calories": 220,
+            "fat": 5,
+            "carbo": 15,
+            "nutrient_density": 1.0
+        }
+    },
+    {
+        "type": "Carbs",
+        "food": {
+            "name": "Brown Rice",
+            "calories": 180,
+            "fat": 1,
+            "carbo": 38,
+            "nutrient_density": 1.3
+        }
+    },
+    {
+        "type": "Carbs",
+        "food": {
+            "name": "Sweet Potato",
+            "calories": 150,
+            "fat": 0,
+            "carbo": 35,
+            "nutrient_density": 1.4
+        }
+    }
+]
+
+MOCK_DAILY_MEALS = [
+    {
+        "type": "Breakfast",
+        "food": {
+            "name": "Avocado Toast with Egg",
+            "calories": 320,
+            "fat": 18,
+            "carbo": 28,
+            "nutrient_density": 1.7
+        }
+    },
+    {
+        "type": "Lunch/Dinner",
+        "food": {
+            "name": "Quinoa Bowl with Vegetables",
+            "calories": 450,
+            "fat": 15,
+            "carbo": 60,
+            "nutrient_density": 1.9
+        }
+    },
+    {
+        "type": "Snack",
+        "food": {
+            "name": "Greek Yogurt with Berries",
+            "calories": 180,
+            "fat": 5,
+            "carbo": 20,
+            "nutrient_density": 1.5
+        }
+    },
+    {
+        "type": "Drink",
+        "food": {
+            "name": "Green Smoothie with Protein",
+            "calories": 220,
+            "fat": 3,
+            "carbo": 25,
+            "nutrient_density": 1.8
+        }
+    },
+    {
+        "type": "Carbs",
+        "food": {
+            "name": "Sweet Potato",
+            "calories": 180,
+            "fat": 0,
+            "carbo": 42,
+            "nutrient_density": 2.1
+        }
+    }
+]
+
+class ApiError(Exception):
+    pass
+
+@st.cache_resource
+def http_session():
+    # one pooled keep-alive session per server process, shared by every rerun
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                  # only the GET, the API records every recommendation POST in the user's history
+                  allowed_methods=frozenset(["GET"]))
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=16, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _api_data(response):
+    if response.status_code != 200:
+        raise ApiError(f"API Error: {response.status_code}")
+    body = response.json()
+    if not body.get("success"):
+        raise ApiError(f"API Error: {body.get('error')}")
+    return body["data"]["data"]
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_recommendations(user_id, calories, fat, proteins, carbohydrate):
+    payload = {
+        "userid": user_id,
+        "calories": calories,
+        "fat": fat,
+        "proteins": proteins,
+        "carbohydrate": carbohydrate
+    }
+    return _api_data(http_session().post(RECOMMENDATIONS_ENDPOINT, json=payload, timeout=REQUEST_TIMEOUT))
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def fetch_daily_meal():
+    return _api_data(http_session().get(DAILY_MEAL_ENDPOINT, timeout=REQUEST_TIMEOUT))
+
+def fetch_concurrently(calls):
+    # {name: (function, args)} -> {name: (result, error)}, every call in its own thread
+    results = {}
+
+    def run(name, function, args):
+        try:
+            results[name] = (function(*args), None)
+        except Exception as e:
+            results[name] = (None, e)
+
+    threads = [threading.Thread(target=run, args=(name, function, args)) for name, (function, args) in calls.items()]
+    for thread in threads:
+        # lets the cached functions run outside the script thread
+        add_script_run_ctx(thread)
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+def _with_fallback(result, mock):
+    data, error = result
+    if isinstance(error, requests.exceptions.RequestException):
+        # Fallback mock data for development/testing
+        st.warning("⚠️ Using mock data - API connection failed")
+        return mock
+    if error is not None:
+        st.error(str(error))
+        return []
+    return data
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def nutrition_charts(data):
+    # figures only depend on the items shown, so slider reruns reuse them
+    df = pd.DataFrame(data)
+    composition = px.bar(df, 
+            x="Name", 
+            y=["Calories", "Fat", "Carbohydrates"],
+            title="Nutrient Composition by Food Item",
+            barmode="group")
+    density = px.bar(df, 
+            x="Name", 
+            y="Nutrient Density",
+            color="Type",
+            title="Nutrient Density by Food Item")
+
+    radars = []
+    for _, food in df.iterrows():
+        # Normalize values for radar chart
+        calories_norm = food["Calories"] / df["Calories"].max()
+        fat_norm = food["Fat"] / df["Fat"].max()
+        carbs_norm = food["Carbohydrates"] / df["Carbohydrates"].max()
+        density_norm = food["Nutrient Density"] / df["Nutrient Density"].max()
+        
+        # Create radar chart
+        fig = go.Figure()
+        
+        fig.add_trace(go.Scatterpolar(
+            r=[calories_norm, fat_norm, carbs_norm, density_norm, calories_norm],
+            theta=['Calories', 'Fat', 'Carbohydrates', 'Nutrient Density', 'Calories'],
+            fill='toself',
+            name=food["Name"]
+        ))
+        
+        fig.update_layout(
+            polar=dict(
+                radialaxis=dict(
+                    visible=True,
+                    range=[0, 1]
+                )),
+            showlegend=False,
+            title=food["Name"]
+        )
+        radars.append(fig)
+    return composition, density, radars
 
 # Sidebar
 st.sidebar.markdown("<h2 style='text-align: center;'>Nutrient Preferences</h2>", unsafe_allow_html=True)
@@ -98,134 +381,19 @@ with st.sidebar:
 tab1, tab2 = st.tabs(["Recommendations", "Nutrition Analysis"])
 
 with tab1:
+    if get_recommendations or get_daily_meal:
+        # Fetch in parallel; the daily meal is prefetched for the next click, recommendations only
+        # when asked for since the API records them in the user's history
+        calls = {"daily_meals": (fetch_daily_meal, ())}
+        if get_recommendations:
+            calls["recommendations"] = (fetch_recommendations,
+                                        (st.session_state.user_id, calories, fat, proteins, carbohydrate))
+        with st.spinner("Getting data from the API..."):
+            fetched = fetch_concurrently(calls)
+
     if get_recommendations:
         try:
-            # Show spinner while making API request
-            with st.spinner("Getting personalized recommendations..."):
-                # Prepare request payload
-                payload = {
-                    "calories": calories,
-                    "fat": fat,
-                    "proteins": proteins,
-                    "carbohydrate": carbohydrate
-                }
-                
-                # For local testing before API is ready
-                try:
-                    response = requests.post(RECOMMENDATIONS_ENDPOINT, json=payload)
-                    if response.status_code == 200:
-                        recommendations = response.json()["data"]["data"]
-                    else:
-                        st.error(f"API Error: {response.status_code}")
-                        recommendations = []
-                except requests.exceptions.RequestException:
-                    # Fallback mock data for development/testing
-                    st.warning("⚠️ Using mock data - API connection failed")
-                    
-                    # Mock data structure matching the API response
-                    recommendations = [
-                        {
-                            "type": "Breakfast",
-                            "food": {
-                                "name": "Oatmeal with Berries",
-                                "calories": 250,
-                                "fat": 5,
-                                "carbo": 40,
-                                "nutrient_density": 1.4
-                            }
-                        },
-                        {
-                            "type": "Breakfast",
-                            "food": {
-                                "name": "Greek Yogurt with Honey",
-                                "calories": 180,
-                                "fat": 3,
-                                "carbo": 25,
-                                "nutrient_density": 1.2
-                            }
-                        },
-                        # Add mock data for other meal types...
-                        {
-                            "type": "Lunch/Dinner",
-                            "food": {
-                                "name": "Grilled Chicken Salad",
-                                "calories": 350,
-                                "fat": 12,
-                                "carbo": 20,
-                                "nutrient_density": 0.9
-                            }
-                        },
-                        {
-                            "type": "Lunch/Dinner",
-                            "food": {
-                                "name": "Salmon with Vegetables",
-                                "calories": 420,
-                                "fat": 18,
-                                "carbo": 15,
-                                "nutrient_density": 0.8
-                            }
-                        },
-                        {
-                            "type": "Snack",
-                            "food": {
-                                "name": "Mixed Nuts",
-                                "calories": 170,
-                                "fat": 14,
-                                "carbo": 6,
-                                "nutrient_density": 0.5
-                            }
-                        },
-                        {
-                            "type": "Snack",
-                            "food": {
-                                "name": "Apple with Peanut Butter",
-                                "calories": 200,
-                                "fat": 8,
-                                "carbo": 25,
-                                "nutrient_density": 0.7
-                            }
-                        },
-                        {
-                            "type": "Drink",
-                            "food": {
-                                "name": "Green Smoothie",
-                                "calories": 150,
-                                "fat": 2,
-                                "carbo": 30,
-                                "nutrient_density": 1.1
-                            }
-                        },
-                        {
-                            "type": "Drink",
-                            "food": {
-                                "name": "Protein Shake",
-                                "calories": 220,
-                                "fat": 5,
-                                "carbo": 15,
-                                "nutrient_density": 1.0
-                            }
-                        },
-                        {
-                            "type": "Carbs",
-                            "food": {
-                                "name": "Brown Rice",
-                                "calories": 180,
-                                "fat": 1,
-                                "carbo": 38,
-                                "nutrient_density": 1.3
-                            }
-                        },
-                        {
-                            "type": "Carbs",
-                            "food": {
-                                "name": "Sweet Potato",
-                                "calories": 150,
-                                "fat": 0,
-                                "carbo": 35,
-                                "nutrient_density": 1.4
-                            }
-                        }
-                    ]
+            recommendations = _with_fallback(fetched["recommendations"], MOCK_RECOMMENDATIONS)
             
             # Group by meal type
             meal_types = {}
@@ -267,70 +435,7 @@ with tab1:
     
     if get_daily_meal:
         try:
-            with st.spinner("Getting optimal daily meal plan..."):
-                # Try to fetch from API
-                try:
-                    response = requests.get(DAILY_MEAL_ENDPOINT)
-                    if response.status_code == 200:
-                        daily_meals = response.json()["data"]["data"]
-                    else:
-                        st.error(f"API Error: {response.status_code}")
-                        daily_meals = []
-                except requests.exceptions.RequestException:
-                    # Fallback mock data
-                    st.warning("⚠️ Using mock data - API connection failed")
-                    daily_meals = [
-                        {
-                            "type": "Breakfast",
-                            "food": {
-                                "name": "Avocado Toast with Egg",
-                                "calories": 320,
-                                "fat": 18,
-                                "carbo": 28,
-                                "nutrient_density": 1.7
-                            }
-                        },
-                        {
-                            "type": "Lunch/Dinner",
-                            "food": {
-                                "name": "Quinoa Bowl with Vegetables",
-                                "calories": 450,
-                                "fat": 15,
-                                "carbo": 60,
-                                "nutrient_density": 1.9
-                            }
-                        },
-                        {
-                            "type": "Snack",
-                            "food": {
-                                "name": "Greek Yogurt with Berries",
-                                "calories": 180,
-                                "fat": 5,
-                                "carbo": 20,
-                                "nutrient_density": 1.5
-                            }
-                        },
-                        {
-                            "type": "Drink",
-                            "food": {
-                                "name": "Green Smoothie with Protein",
-                                "calories": 220,
-                                "fat": 3,
-                                "carbo": 25,
-                                "nutrient_density": 1.8
-                            }
-                        },
-                        {
-                            "type": "Carbs",
-                            "food": {
-                                "name": "Sweet Potato",
-                                "calories": 180,
-                                "fat": 0,
-                                "carbo": 42,
-                                "nutrient_density": 2.1
-                            }
-                        }
-                    ]
+            daily_meals = _with_fallback(fetched["daily_meals"], MOCK_DAILY_MEALS)
             
             st.markdown("<h2 class='sub-header'>Optimal Daily Meal Plan</h2>", unsafe_allow_html=True)
             st.markdown("<p>These are the top foods with highest nutrient density for each meal type:</p>", unsafe_allow_html=True)
@@ -403,34 +508,24 @@ with tab2:
                 })
         
         if data:
-            df = pd.DataFrame(data)
+            composition_fig, density_fig, radar_figs = nutrition_charts(data)
             
             # Create visualizations
             col1, col2 = st.columns(2)
             
             with col1:
                 st.markdown("<h3 style='text-align: center;'>Nutrient Composition</h3>", unsafe_allow_html=True)
-                fig = px.bar(df, 
-                        x="Name", 
-                        y=["Calories", "Fat", "Carbohydrates"],
-                        title="Nutrient Composition by Food Item",
-                        barmode="group")
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(composition_fig, use_container_width=True)
             
             with col2:
                 st.markdown("<h3 style='text-align: center;'>Nutrient Density Comparison</h3>", unsafe_allow_html=True)
-                fig = px.bar(df, 
-                        x="Name", 
-                        y="Nutrient Density",
-                        color="Type",
-                        title="Nutrient Density by Food Item")
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(density_fig, use_container_width=True)
             
             # Radar chart for each food item
             st.markdown("<h3 style='text-align: center;'>Nutrient Profile Radar Charts</h3>", unsafe_allow_html=True)
             
             # Create columns based on the number of food items (up to 3 per row)
-            num_items = len(df)
+            num_items = len(radar_figs)
             items_per_row = 3
             num_rows = (num_items + items_per_row - 1) // items_per_row
             
@@ -439,35 +534,8 @@ with tab2:
                 for i in range(items_per_row):
                     idx = row * items_per_row + i
                     if idx < num_items:
-                        food = df.iloc[idx]
                         with cols[i]:
-                            # Normalize values for radar chart
-                            calories_norm = food["Calories"] / df["Calories"].max()
-                            fat_norm = food["Fat"] / df["Fat"].max()
-                            carbs_norm = food["Carbohydrates"] / df["Carbohydrates"].max()
-                            density_norm = food["Nutrient Density"] / df["Nutrient Density"].max()
-                            
-                            # Create radar chart
-                            fig = go.Figure()
-                            
-                            fig.add_trace(go.Scatterpolar(
-                                r=[calories_norm, fat_norm, carbs_norm, density_norm, calories_norm],
-                                theta=['Calories', 'Fat', 'Carbohydrates', 'Nutrient Density', 'Calories'],
-                                fill='toself',
-                                name=food["Name"]
-                            ))
-                            
-                            fig.update_layout(
-                                polar=dict(
-                                    radialaxis=dict(
-                                        visible=True,
-                                        range=[0, 1]
-                                    )),
-                                showlegend=False,
-                                title=food["Name"]
-                            )
-                            
-                            st.plotly_chart(fig, use_container_width=True)
+                            st.plotly_chart(radar_figs[idx], use_container_width=True)
     else:
         st.info("Adjust your nutrition preferences and click 'Get Personalized Recommendations' or 'Get Optimal Daily Meal' to see the analysis.")
 
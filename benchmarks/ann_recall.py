@@ -0,0 +1,79 @@
+"""Recall-vs-latency report of the approximate index against exact search.
+
+    python -m benchmarks.ann_recall --replicate 1 10 100 --probes 1 2 4 8 --json ann.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.common import load_catalog, replicate_catalog, synthetic_queries
+from recommender.engine import RecommendationEngine
+
+
+def _timed_search(engine, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(engine.recommend(query, k))
+        latencies.append(time.perf_counter() - start)
+    return results, np.array(latencies) * 1e3
+
+
+def _recall(exact, approx):
+    hits = total = 0
+    for exact_result, approx_result in zip(exact, approx):
+        for (_, expected), (_, found) in zip(exact_result, approx_result):
+            hits += len(np.intersect1d(expected, found))
+            total += len(expected)
+    return hits / total if total else 1.0
+
+
+def _latency(ms):
+    return {'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)), 'p95_ms': float(np.percentile(ms, 95))}
+
+
+def run(replicates, lists, probes, n_queries, k):
+    df, scaler = load_catalog()
+    rows = []
+    for factor in replicates:
+        catalog = replicate_catalog(df, factor)
+        queries = synthetic_queries(df, scaler, n_queries)
+        exact_engine = RecommendationEngine.from_frame(catalog, scaler)
+        exact, exact_ms = _timed_search(exact_engine, queries, k)
+        rows.append({'catalog_size': len(catalog), 'backend': 'exact', 'probes': None,
+                     'recall': 1.0, 'build_s': 0.0, **_latency(exact_ms)})
+        start = time.perf_counter()
+        ivf_engine = RecommendationEngine.from_frame(catalog, scaler, index='ivf', lists=lists)
+        build_s = time.perf_counter() - start
+        for n_probes in probes:
+            ivf_engine.index.probes = n_probes
+            approx, approx_ms = _timed_search(ivf_engine, queries, k)
+            rows.append({'catalog_size': len(catalog), 'backend': 'ivf', 'probes': n_probes,
+                         'recall': _recall(exact, approx), 'build_s': build_s, **_latency(approx_ms)})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replicate', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--lists', type=int, default=0, help='inverted lists per meal type (0: sqrt of rows)')
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=5)
+    parser.add_argument('--json', help='write the report rows to this file')
+    args = parser.parse_args()
+
+    rows = run(args.replicate, args.lists, args.probes, args.queries, args.k)
+    print(f"{'catalog':>9} {'backend':>7} {'probes':>6} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in rows:
+        print(f"{row['catalog_size']:>9} {row['backend']:>7} {row['probes'] or '-':>6} "
+              f"{row['recall']:>7.3f} {row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""Latency and throughput benchmark of the recommendation API.
+
+Drives /api/v1/recommendations and /api/v1/dailyMeal in-process through the
+Flask test client or over HTTP, with a replayed or synthesized request stream::
+
+    python -m benchmarks.api_bench --scale 1 10 100 1000 --concurrency 1 8 --json bench.json
+    python -m benchmarks.api_bench --transport http --replay requests.jsonl
+    python -m benchmarks.api_bench --baseline bench.json --max-regression 0.2
+    python -m benchmarks.api_bench --scale 100 --concurrency 32 --microbatch --max-wait-us 200
+
+Every scenario (transport, catalog scale, concurrency) reports throughput and
+the mean, p50, p95 and p99 client-side latency of whole requests: routing,
+input checks, scaling, scoring, building the food items and serializing the
+JSON, plus the HTTP round trip with ``--transport http``. Building the scaled
+catalog is not timed, and neither /foods/similar nor /mealPlan is driven, so
+the neighbour graph is never scored.
+
+Replay files are JSON lines holding either a recommendation payload or a
+``{"method", "path", "body"}`` request; other lines are skipped. Scaling runs
+serve a catalog replicated N times with jittered copies of every row. With
+``--baseline`` the exit status is 1 when any scenario's p95 latency regresses
+by more than ``--max-regression``. ``--microbatch`` serves in-process with
+micro-batched scoring (see :mod:`recommender.batching`).
+"""
+import argparse
+import http.client
+import json
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.common import load_catalog, replicate_catalog, synthetic_nutrients
+from recommender import config
+from recommender.batching import MicroBatcher
+from recommender.cache import LRUCache
+from recommender.engine import RecommendationEngine
+from recommender.registry import CatalogSnapshot
+from recommender.responses import CatalogColumns
+from recommender.scaling import LinearScaler
+
+RECOMMENDATIONS = "/api/v1/recommendations"
+DAILY_MEAL = "/api/v1/dailyMeal"
+NUTRIENTS = ["calories", "fat", "proteins", "carbohydrate"]
+
+
+def load_replay(path):
+    stream, skipped = [], 0
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if isinstance(record, dict) and "path" in record:
+                stream.append((record.get("method", "GET").upper(), record["path"], record.get("body")))
+            elif isinstance(record, dict) and all(key in record for key in NUTRIENTS):
+                stream.append(("POST", RECOMMENDATIONS, dict(record, userid=record.get("userid", 0))))
+            else:
+                skipped += 1
+    return stream, skipped
+
+
+def synthesize(df, n, daily_ratio=0.1, seed=0):
+    """Recommendation payloads sampled around catalog rows, mixed with dailyMeal requests."""
+    rng = np.random.default_rng(seed)
+    stream = []
+    for i, values in enumerate(synthetic_nutrients(df, n, seed).tolist()):
+        if rng.random() < daily_ratio:
+            stream.append(("GET", DAILY_MEAL, None))
+        else:
+            stream.append(("POST", RECOMMENDATIONS, dict(zip(NUTRIENTS, values), userid=i)))
+    return stream
+
+
+class InProcessTransport:
+    name = "inprocess"
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def __call__(self, method, path, body):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, json=body)
+        return response.status_code, response.get_data()
+
+
+class HTTPTransport:
+    name = "http"
+
+    def __init__(self, url):
+        parsed = urllib.parse.urlsplit(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self._local = threading.local()
+
+    def __call__(self, method, path, body):
+        # one keep-alive connection per benchmark thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        payload = None if body is None else json.dumps(body)
+        headers = {"Content-Type": "application/json"} if payload is not None else {}
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            self._local.conn = None
+            conn.close()
+            raise
+
+
+def serve_locally(app):
+    """Start ``app`` on an ephemeral port in a background thread, returns its URL."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server
+
+
+def run_stream(transport, stream, concurrency):
+    latencies = np.empty(len(stream))
+    errors = 0
+    lock = threading.Lock()
+
+    def send(i):
+        nonlocal errors
+        method, path, body = stream[i]
+        start = time.perf_counter()
+        try:
+            status, data = transport(method, path, body)
+            failed = status != 200 or b'"success":false' in data.replace(b" ", b"")
+        except Exception:
+            failed = True
+        latencies[i] = time.perf_counter() - start
+        if failed:
+            with lock:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(len(stream))))
+    wall = time.perf_counter() - start
+    ms = latencies * 1e3
+    return {
+        "requests": len(stream),
+        "errors": errors,
+        "rps": len(stream) / wall,
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def serve_catalog(registry, df, scaler, factor, cache):
+    # the registry serves with the NumPy scaler, not the pickled scikit-learn one
+    scaler = LinearScaler.from_fitted(scaler)
+    catalog = replicate_catalog(df, factor)
+    engine = RecommendationEngine.from_frame(catalog, scaler, **config.index_options())
+    # the neighbour graph is only scored on a /foods/similar request, which the streams never send
+    snapshot = CatalogSnapshot(f"bench-x{factor}", scaler, CatalogColumns.from_frame(catalog), engine)
+    if not cache:
+        snapshot.cache = LRUCache(0)
+    registry.current = snapshot
+    return len(catalog)
+
+
+def compare(results, baseline, max_regression):
+    previous = {row["scenario"]: row for row in baseline}
+    regressions = []
+    for row in results:
+        before = previous.get(row["scenario"])
+        if before and row["p95_ms"] > before["p95_ms"] * (1 + max_regression):
+            regressions.append((row["scenario"], before["p95_ms"], row["p95_ms"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transport", choices=["inprocess", "http"], default="inprocess")
+    parser.add_argument("--url", help="benchmark a running server instead of starting one (http only)")
+    parser.add_argument("--replay", help="JSON lines file of requests to replay")
+    parser.add_argument("--requests", type=int, default=2000, help="synthesized requests per scenario")
+    parser.add_argument("--daily-ratio", type=float, default=0.1)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--scale", type=int, nargs="+", default=[1], help="catalog replication factors")
+    parser.add_argument("--cache", action="store_true", help="keep the recommendation cache enabled")
+    parser.add_argument("--microbatch", action="store_true", help="coalesce concurrent queries (in-process app)")
+    parser.add_argument("--max-batch", type=int, default=config.MICROBATCH_MAX_SIZE)
+    parser.add_argument("--max-wait-us", type=float, default=config.MICROBATCH_MAX_WAIT_US)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file of a previous run to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    df, scaler = load_catalog()
+    if args.replay:
+        stream, skipped = load_replay(args.replay)
+        print(f"replaying {len(stream)} requests from {args.replay} ({skipped} lines skipped)", file=sys.stderr)
+        if not stream:
+            parser.error(f"no replayable requests in {args.replay}")
+    else:
+        stream = synthesize(df, args.requests, args.daily_ratio)
+
+    if args.url:
+        transport, scales = HTTPTransport(args.url), [None]
+    else:
+        import deployment
+
+        if args.microbatch:
+            deployment.batcher = MicroBatcher(args.max_batch, args.max_wait_us)
+        transport = InProcessTransport(deployment.app)
+        if args.transport == "http":
+            transport = HTTPTransport(serve_locally(deployment.app)[0])
+        scales = args.scale
+
+    results = []
+    for factor in scales:
+        catalog_size = None
+        if factor is not None:
+            catalog_size = serve_catalog(deployment.registry, df, scaler, factor, args.cache)
+        run_stream(transport, stream[:args.warmup], 1)
+        for concurrency in args.concurrency:
+            row = {
+                "scenario": f"{transport.name}-x{factor or 'remote'}-c{concurrency}{'-mb' if args.microbatch else ''}",
+                "transport": transport.name,
+                "catalog_size": catalog_size,
+                "concurrency": concurrency,
+            }
+            row.update(run_stream(transport, stream, concurrency))
+            results.append(row)
+            print(f"{row['scenario']:>24} catalog={catalog_size} rps={row['rps']:.0f} "
+                  f"p50={row['p50_ms']:.2f}ms p95={row['p95_ms']:.2f}ms p99={row['p99_ms']:.2f}ms "
+                  f"errors={row['errors']}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=4)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        for scenario, before, after in regressions:
+            print(f"REGRESSION {scenario}: p95 {before:.2f}ms -> {after:.2f}ms", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Shared catalog loading and synthetic data for the benchmark scripts."""
+import numpy as np
+import pandas as pd
+import joblib
+
+from recommender import config
+from recommender.engine import NUMERIC_COLS, nutrient_density
+
+
+def load_catalog(dataset_path=config.DATASET_PATH, scaler_path=config.SCALER_PATH):
+    return pd.read_csv(dataset_path), joblib.load(scaler_path)
+
+
+def replicate_catalog(df, factor, noise=0.02, seed=0):
+    """Grow the catalog ``factor`` times with jittered copies of every row."""
+    if factor <= 1:
+        return df
+    rng = np.random.default_rng(seed)
+    big = pd.concat([df] * factor, ignore_index=True)
+    copies = np.repeat(np.arange(factor), len(df))
+    jitter = 1 + noise * rng.standard_normal((len(big), len(NUMERIC_COLS))) * (copies[:, None] > 0)
+    big[NUMERIC_COLS] = big[NUMERIC_COLS].to_numpy() * jitter
+    big['name'] = big['name'] + np.where(copies > 0, ' #' + copies.astype(str), '')
+    return big
+
+
+def synthetic_nutrients(df, n, seed=0):
+    """Calories, fat, proteins and carbohydrate of ``n`` requests sampled around catalog rows."""
+    rng = np.random.default_rng(seed)
+    raw = df[['calories', 'fat', 'proteins', 'carbohydrate']].to_numpy()
+    return raw[rng.integers(0, len(raw), n)] * rng.uniform(0.5, 1.5, (n, 4))
+
+
+def synthetic_queries(df, scaler, n, seed=0):
+    """Scaled query vectors sampled around catalog rows."""
+    raw = synthetic_nutrients(df, n, seed)
+    return scaler.transform(pd.DataFrame(np.column_stack([raw, nutrient_density(*raw.T)]), columns=NUMERIC_COLS))
@@ -0,0 +1,248 @@
+"""Offline evaluation of the engine's speed/accuracy modes against an exact baseline.
+
+Every mode answers the same requests as the exact reference, a float64 cosine
+over the scaled catalog with a stable sort, and is scored on:
+
+* ranking agreement: recall of the reference top ``k`` of every meal type and
+  the share of requests whose lists come back identical;
+* nutrient error: mean absolute error between the scaled request and the mean
+  of the foods recommended per meal type (as in Model.ipynb), and its change
+  against the reference;
+* latency per request, plus the share of cache hits for quantized modes.
+
+Modes are ``float32`` (the served exact index), ``ivf-p<probes>`` (approximate
+index), ``quantized-<grid>`` (nutrients snapped to the cache grid before
+scoring) and ``batch-<size>`` (requests scored together as the micro-batcher
+does, latency amortized over the batch). Requests are synthesized around
+catalog rows, held-out catalog rows excluded from their own results, or
+replayed from an api_bench JSON-lines file. Shards of the requests are
+evaluated in a process pool; latencies are only comparable between runs with
+the same ``--workers``::
+
+    python -m benchmarks.evaluate --replicate 1 10 --probes 1 4 16 --grids 0.001 0.01 0.1 --workers 4
+    python -m benchmarks.evaluate --source holdout --batch-sizes 8 64 --json eval.json
+    python -m benchmarks.evaluate --replay requests.jsonl
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.api_bench import RECOMMENDATIONS, load_replay
+from benchmarks.common import load_catalog, replicate_catalog, synthetic_nutrients
+from recommender.cache import quantize
+from recommender.engine import NUMERIC_COLS, RecommendationEngine, nutrient_density
+from recommender.index import top_k, unit_rows
+
+NUTRIENTS = ['calories', 'fat', 'proteins', 'carbohydrate']
+
+_worker = {}
+
+
+def replayed_nutrients(path):
+    """Nutrients of the recommendation requests, single and batched, of a replay file."""
+    stream, skipped = load_replay(path)
+    bodies = []
+    for method, route, body in stream:
+        if method == 'POST' and route == RECOMMENDATIONS and isinstance(body, dict):
+            bodies.append(body)
+        elif method == 'POST' and route == RECOMMENDATIONS + '/batch' and isinstance(body, list):
+            bodies.extend(user for user in body if isinstance(user, dict))
+    rows = [[float(body[key]) for key in NUTRIENTS] for body in bodies if all(key in body for key in NUTRIENTS)]
+    return np.array(rows, dtype=np.float64).reshape(-1, len(NUTRIENTS)), skipped
+
+
+def _features(raw):
+    return np.column_stack([raw, nutrient_density(*raw.T)])
+
+
+def _scale(scaler, features):
+    return scaler.transform(pd.DataFrame(features, columns=NUMERIC_COLS))
+
+
+def _init_worker(factor, lists, k):
+    df, scaler = load_catalog()
+    catalog = replicate_catalog(df, factor)
+    scaled = _scale(scaler, catalog[NUMERIC_COLS].to_numpy())
+    meal_types = catalog['Meal Type'].to_numpy()
+    _worker.update(
+        k=k, scaler=scaler, scaled=scaled, unit=unit_rows(scaled),
+        exact=RecommendationEngine(scaled, meal_types),
+        ivf=RecommendationEngine(scaled, meal_types, index='ivf', lists=lists),
+    )
+
+
+def _reference(queries, masks):
+    engine, k = _worker['exact'], _worker['k']
+    results = []
+    for query, mask in zip(unit_rows(queries), masks):
+        sims = _worker['unit'] @ query
+        result = []
+        for meal_type, rows in engine.meal_indices.items():
+            rows = rows if mask is None else rows[mask[rows]]
+            result.append((meal_type, rows[top_k(sims[rows], k)]))
+        results.append(result)
+    return results
+
+
+def _one_by_one(function, queries, masks):
+    results, latencies = [], np.empty(len(queries))
+    for i, (query, mask) in enumerate(zip(queries, masks)):
+        start = time.perf_counter()
+        results.append(function(query, mask))
+        latencies[i] = time.perf_counter() - start
+    return results, latencies
+
+
+def _batched(engine, queries, masks, size, k):
+    results, latencies = [], np.empty(len(queries))
+    for start in range(0, len(queries), size):
+        chunk = slice(start, start + size)
+        begin = time.perf_counter()
+        block = masks[chunk]
+        results.extend(engine.recommend_batch(queries[chunk], k, None if all(m is None for m in block) else block))
+        latencies[chunk] = (time.perf_counter() - begin) / len(block)
+    return results, latencies
+
+
+def _run_mode(mode, raw, queries, masks):
+    k = _worker['k']
+    kind, _, value = mode.partition('-')
+    if kind == 'exact64':
+        return _one_by_one(lambda query, mask: _reference(query[None], [mask])[0], queries, masks)
+    if kind == 'float32':
+        return _one_by_one(lambda query, mask: _worker['exact'].recommend(query, k, mask), queries, masks)
+    if kind == 'ivf':
+        _worker['ivf'].index.probes = int(value[1:])
+        return _one_by_one(lambda query, mask: _worker['ivf'].recommend(query, k, mask), queries, masks)
+    if kind == 'quantized':
+        snapped = np.array([quantize(row, float(value))[1] for row in raw])
+        quantized = _scale(_worker['scaler'], _features(snapped))
+        return _one_by_one(lambda query, mask: _worker['exact'].recommend(query, k, mask), quantized, masks)
+    if kind == 'batch':
+        return _batched(_worker['exact'], queries, masks, int(value), k)
+    raise ValueError(f"unknown mode {mode!r}")
+
+
+def _agreement(reference, results, queries):
+    """Per-request reference hits, reference size, identical flag and nutrient MAE of ``results``."""
+    scaled = _worker['scaled']
+    hits, totals, identical, mae = (np.zeros(len(results)) for _ in range(4))
+    for i, (expected_result, result, query) in enumerate(zip(reference, results, queries)):
+        identical[i] = True
+        errors = []
+        for (_, expected), (_, found) in zip(expected_result, result):
+            hits[i] += len(np.intersect1d(expected, found))
+            totals[i] += len(expected)
+            identical[i] = identical[i] and np.array_equal(expected, found)
+            if len(found):
+                errors.append(np.abs(query - scaled[found].mean(axis=0)).mean())
+        mae[i] = np.mean(errors) if errors else np.nan
+    return hits, totals, identical, mae
+
+
+def evaluate_shard(modes, raw, excluded):
+    """Agreement and latency arrays of every mode on a shard of requests, keyed by mode."""
+    size = len(_worker['scaled'])
+    masks = np.empty(len(raw), dtype=object)
+    for i, row in enumerate(excluded):
+        if row >= 0:
+            masks[i] = np.ones(size, dtype=bool)
+            masks[i][row] = False
+    queries = _scale(_worker['scaler'], _features(raw))
+    reference = _reference(queries, masks)
+    report = {}
+    for mode in modes:
+        results, latencies = _run_mode(mode, raw, queries, masks)
+        report[mode] = (*_agreement(reference, results, queries), latencies)
+    return report
+
+
+def _summary(mode, arrays, baseline_mae, raw):
+    hits, totals, identical, mae, latencies = arrays
+    ms = latencies * 1e3
+    row = {
+        'mode': mode,
+        'recall': float(hits.sum() / totals.sum()) if totals.sum() else 1.0,
+        'identical': float(identical.mean()),
+        'mae': float(np.nanmean(mae)),
+        'mae_delta': float(np.nanmean(mae) - baseline_mae),
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'hit_rate': None,
+    }
+    if mode.startswith('quantized-'):
+        # requests after the first with the same cache key would have been served from the cache
+        keys = {quantize(values, float(mode.partition('-')[2]))[0] for values in raw}
+        row['hit_rate'] = 1 - len(keys) / len(raw)
+    return row
+
+
+def run(factor, raw, excluded, modes, k=5, lists=0, workers=1):
+    shards = [shard for shard in np.array_split(np.arange(len(raw)), max(1, workers) * 2) if len(shard)]
+    modes = ['exact64'] + list(modes)
+    with ProcessPoolExecutor(max(1, workers), initializer=_init_worker, initargs=(factor, lists, k)) as pool:
+        reports = list(pool.map(evaluate_shard, [modes] * len(shards),
+                                [raw[shard] for shard in shards], [excluded[shard] for shard in shards]))
+    merged = {mode: [np.concatenate([report[mode][i] for report in reports]) for i in range(5)] for mode in modes}
+    baseline_mae = float(np.nanmean(merged['exact64'][3]))
+    return [_summary(mode, merged[mode], baseline_mae, raw) for mode in modes]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', choices=['synthetic', 'holdout'], default='synthetic')
+    parser.add_argument('--replay', help='JSON lines file of requests to evaluate instead')
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--replicate', type=int, nargs='+', default=[1])
+    parser.add_argument('--lists', type=int, default=0, help='inverted lists per meal type (0: sqrt of rows)')
+    parser.add_argument('--probes', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--grids', type=float, nargs='+', default=[0.001, 0.01, 0.1])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[8, 64])
+    parser.add_argument('-k', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='write the report rows to this file')
+    args = parser.parse_args()
+
+    df, _ = load_catalog()
+    if args.replay:
+        raw, skipped = replayed_nutrients(args.replay)
+        print(f"evaluating {len(raw)} requests from {args.replay} ({skipped} lines skipped)", file=sys.stderr)
+        if not len(raw):
+            parser.error(f"no recommendation requests in {args.replay}")
+        excluded = np.full(len(raw), -1)
+    elif args.source == 'holdout':
+        # catalog rows as targets, excluded from their own results like the notebook's test split
+        excluded = np.random.default_rng(args.seed).choice(len(df), min(args.queries, len(df)), replace=False)
+        raw = df[NUTRIENTS].to_numpy(dtype=np.float64)[excluded]
+    else:
+        raw = synthetic_nutrients(df, args.queries, args.seed)
+        excluded = np.full(len(raw), -1)
+
+    modes = (['float32'] + [f'ivf-p{probes}' for probes in args.probes]
+             + [f'quantized-{grid:g}' for grid in args.grids] + [f'batch-{size}' for size in args.batch_sizes])
+    rows = []
+    print(f"{'catalog':>9} {'mode':>16} {'recall':>7} {'same':>6} {'mae':>8} {'d mae':>9} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'hits':>6}")
+    for factor in args.replicate:
+        catalog_size = len(df) * max(1, factor)
+        for row in run(factor, raw, excluded, modes, args.k, args.lists, args.workers):
+            row['catalog_size'] = catalog_size
+            rows.append(row)
+            hit_rate = '-' if row['hit_rate'] is None else f"{row['hit_rate']:.3f}"
+            print(f"{catalog_size:>9} {row['mode']:>16} {row['recall']:>7.3f} {row['identical']:>6.3f} "
+                  f"{row['mae']:>8.5f} {row['mae_delta']:>+9.5f} {row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} "
+                  f"{hit_rate:>6}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
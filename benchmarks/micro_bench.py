@@ -0,0 +1,134 @@
+"""Latency, memory and recall of the micronutrient mode against the five-feature path.
+
+The micronutrient catalog is every classified food of the vitamin-rich sources,
+grown with jittered copies to the size of the replicated five-feature catalog.
+Requests target ``--targets`` features each. Jittered copies score almost alike,
+so next to recall against the exact ranking the report gives the score ratio:
+the exact similarity of the returned rows over that of the exact top ``k``.
+
+    python -m benchmarks.micro_bench --replicate 1 10 50 --targets 6 33 --json micro.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.common import load_catalog, replicate_catalog, synthetic_queries
+from recommender import config
+from recommender.engine import MEAL_TYPE_NAMES, RecommendationEngine
+from recommender.micronutrients import FEATURES, SOURCE_COLUMNS, MicronutrientIndex
+from recommender.pipeline import MEAL_KEYWORDS, KeywordMatcher
+
+
+def source_profiles():
+    frames = [pd.read_csv(path, usecols=['food'] + list(SOURCE_COLUMNS)) for path in config.MICRO_SOURCES.split(',')]
+    source = pd.concat(frames, ignore_index=True)
+    meal_types = KeywordMatcher(MEAL_KEYWORDS).classify(source['food'].astype(str))
+    keep = meal_types >= 0
+    values = source[list(SOURCE_COLUMNS)].apply(pd.to_numeric, errors='coerce').fillna(0.0).to_numpy(np.float32)
+    return values[keep], meal_types[keep]
+
+
+def replicate_profiles(values, meal_types, size, noise=0.02, seed=0):
+    rng = np.random.default_rng(seed)
+    picks = np.concatenate([np.arange(len(values)), rng.integers(0, len(values), max(0, size - len(values)))])
+    jitter = 1 + noise * rng.standard_normal((len(picks), values.shape[1])) * (np.arange(len(picks)) >= len(values))[:, None]
+    return (values[picks] * jitter).astype(np.float32), meal_types[picks]
+
+
+def synthetic_targets(values, n, features=6, seed=0):
+    """Requests targeting a few features of jittered catalog profiles, with random weights."""
+    rng = np.random.default_rng(seed)
+    requests = []
+    for row in rng.integers(0, len(values), n):
+        chosen = rng.choice(len(FEATURES), features, replace=False)
+        targets = {FEATURES[i]: float(values[row, i] * rng.uniform(0.8, 1.2)) for i in chosen}
+        weights = {FEATURES[i]: float(rng.uniform(0.5, 2.0)) for i in chosen}
+        requests.append((targets, weights))
+    return requests
+
+
+def _timed(function, queries):
+    latencies, results = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(function(query))
+        latencies.append(time.perf_counter() - start)
+    ms = np.array(latencies) * 1e3
+    return results, {'p50_ms': float(np.percentile(ms, 50)), 'p95_ms': float(np.percentile(ms, 95))}
+
+
+def _quality(index, requests, exact, approx):
+    """``(recall, score_ratio)`` of the ``approx`` results against the ``exact`` ones."""
+    hits = total = found_score = best_score = 0
+    for request, exact_result, approx_result in zip(requests, exact, approx):
+        target, weight = index.query(*request)
+        scores = dict(zip(index.rows, index.similarity(target, weight)))
+        for (_, expected, expected_scores), (_, found, _) in zip(exact_result, approx_result):
+            hits += len(np.intersect1d(expected, found))
+            total += len(expected)
+            found_score += sum(scores[row] for row in found)
+            best_score += expected_scores.sum()
+    return hits / total if total else 1.0, found_score / best_score if best_score else 1.0
+
+
+def run(replicates, targets, components, n_queries, k, rerank):
+    df, scaler = load_catalog()
+    values, meal_types = source_profiles()
+    rows = []
+    for factor in replicates:
+        catalog = replicate_catalog(df, factor)
+        engine = RecommendationEngine.from_frame(catalog, scaler)
+        queries = synthetic_queries(df, scaler, n_queries)
+        _, latency = _timed(lambda query: engine.recommend(query, k), queries)
+        rows.append({'catalog_size': len(catalog), 'mode': 'macros-5d', 'targets': engine.features.shape[1],
+                     'dims': engine.features.shape[1], 'recall': 1.0, 'score_ratio': 1.0,
+                     'bytes_per_row': engine.features.nbytes / len(catalog), **latency})
+
+        profiles, profile_types = replicate_profiles(values, meal_types, len(catalog))
+        exact_index = MicronutrientIndex(np.arange(len(profiles)), profiles, profile_types, MEAL_TYPE_NAMES, 'none')
+        indexes = [(f'micro-{projection}', n_components,
+                    MicronutrientIndex(np.arange(len(profiles)), profiles, profile_types, MEAL_TYPE_NAMES,
+                                       projection, n_components, rerank))
+                   for projection in ('pca', 'random') for n_components in components]
+        for n_targets in targets:
+            requests = synthetic_targets(profiles, n_queries, n_targets)
+            exact, latency = _timed(lambda request: exact_index.recommend(*request, k=k), requests)
+            rows.append({'catalog_size': len(profiles), 'mode': 'micro-exact', 'targets': n_targets,
+                         'dims': len(FEATURES), 'recall': 1.0, 'score_ratio': 1.0,
+                         'bytes_per_row': exact_index.nbytes() / len(profiles), **latency})
+            for mode, n_components, index in indexes:
+                approx, latency = _timed(lambda request: index.recommend(*request, k=k), requests)
+                recall, score_ratio = _quality(exact_index, requests, exact, approx)
+                rows.append({'catalog_size': len(profiles), 'mode': mode, 'targets': n_targets,
+                             'dims': n_components, 'recall': recall, 'score_ratio': score_ratio,
+                             'bytes_per_row': index.nbytes() / len(profiles), **latency})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--replicate', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--targets', type=int, nargs='+', default=[6, len(FEATURES)])
+    parser.add_argument('--components', type=int, nargs='+', default=[4, 8, 16])
+    parser.add_argument('--rerank', type=int, default=config.MICRO_RERANK)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=5)
+    parser.add_argument('--json', help='write the report rows to this file')
+    args = parser.parse_args()
+
+    rows = run(args.replicate, args.targets, args.components, args.queries, args.k, args.rerank)
+    print(f"{'catalog':>9} {'mode':>12} {'targets':>7} {'dims':>5} {'recall':>7} {'score':>7} {'B/row':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8}")
+    for row in rows:
+        print(f"{row['catalog_size']:>9} {row['mode']:>12} {row['targets']:>7} {row['dims']:>5} {row['recall']:>7.3f} "
+              f"{row['score_ratio']:>7.3f} {row['bytes_per_row']:>7.0f} {row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
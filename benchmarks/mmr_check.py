@@ -0,0 +1,101 @@
+"""Equivalence check of the batched MMR re-ranking against a plain Python MMR.
+
+Every synthetic request is answered by the engine with a ``(lambda, pool)``
+diversity setting and compared, meal type by meal type, with a one-candidate-
+at-a-time MMR in float64 over the same pool (the engine's plain top ``pool``).
+A differing pick only counts as a tie when its MMR score is within
+``--tolerance`` of the naive best, and ``lambda=1`` must give back the plain
+ranking exactly. Exits non-zero on any other difference::
+
+    python -m benchmarks.mmr_check --queries 500 --lambdas 0 0.3 0.7 1
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from benchmarks.common import load_catalog, synthetic_queries
+from recommender.engine import RecommendationEngine
+from recommender.index import unit_rows
+
+
+def naive_mmr(query, vectors, k, lambda_):
+    """Positions picked from the pool rows ``vectors``, most relevant first on ties."""
+    relevance = [float(np.dot(vector, query)) for vector in vectors]
+    picked = []
+    while len(picked) < min(k, len(vectors)):
+        best, best_score = None, -np.inf
+        for i, vector in enumerate(vectors):
+            if i in picked:
+                continue
+            redundancy = max((float(np.dot(vector, vectors[j])) for j in picked), default=0.0)
+            score = lambda_ * relevance[i] - (1 - lambda_) * redundancy
+            if score > best_score:
+                best, best_score = i, score
+        picked.append(best)
+    return picked
+
+
+def _score(query, vectors, picked, i, lambda_):
+    redundancy = max((float(np.dot(vectors[i], vectors[j])) for j in picked), default=0.0)
+    return lambda_ * float(np.dot(vectors[i], query)) - (1 - lambda_) * redundancy
+
+
+def compare(expected, found, query, vectors, lambda_, tolerance):
+    """'same', 'tie' or 'mismatch' for the engine picks ``found`` against the naive ``expected``."""
+    if list(expected) == list(found):
+        return 'same'
+    if len(expected) != len(found):
+        return 'mismatch'
+    for step, (want, got) in enumerate(zip(expected, found)):
+        if want != got:
+            picked = list(found[:step])
+            gap = _score(query, vectors, picked, want, lambda_) - _score(query, vectors, picked, got, lambda_)
+            # past the first differing pick the two sequences are no longer comparable
+            return 'tie' if gap <= tolerance else 'mismatch'
+    return 'same'
+
+
+def run(engine, queries, lambdas, k, pool, tolerance):
+    counts = {lambda_: {'same': 0, 'tie': 0, 'mismatch': 0} for lambda_ in lambdas}
+    units = unit_rows(queries).astype(np.float32).astype(np.float64)
+    for query, unit in zip(queries, units):
+        plain = engine.recommend(query, k)
+        pools = engine.recommend(query, pool)
+        for lambda_ in lambdas:
+            result = engine.recommend(query, k, diversity=(lambda_, pool))
+            for (meal_type, rows), (_, candidates), (_, top) in zip(result, pools, plain):
+                vectors = engine.vectors(candidates).astype(np.float64)
+                position = {row: i for i, row in enumerate(candidates)}
+                found = [position[row] for row in rows]
+                outcome = compare(naive_mmr(unit, vectors, k, lambda_), found, unit, vectors, lambda_, tolerance)
+                if lambda_ == 1 and not np.array_equal(rows, top):
+                    outcome = 'mismatch'
+                counts[lambda_][outcome] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--lambdas', type=float, nargs='+', default=[0.0, 0.3, 0.7, 1.0])
+    parser.add_argument('--pool', type=int, default=20)
+    parser.add_argument('-k', type=int, default=5)
+    parser.add_argument('--tolerance', type=float, default=1e-5, help='largest MMR score gap accepted as a tie')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    df, scaler = load_catalog()
+    engine = RecommendationEngine.from_frame(df, scaler)
+    queries = synthetic_queries(df, scaler, args.queries, args.seed)
+    counts = run(engine, queries, args.lambdas, args.k, args.pool, args.tolerance)
+
+    print(f"{'lambda':>6} {'same':>6} {'ties':>6} {'mismatches':>10}")
+    for lambda_, row in counts.items():
+        print(f"{lambda_:>6g} {row['same']:>6} {row['tie']:>6} {row['mismatch']:>10}")
+    if any(row['mismatch'] for row in counts.values()):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
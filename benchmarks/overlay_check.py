@@ -0,0 +1,182 @@
+"""Equivalence check of edited catalogs against a full rebuild.
+
+Random upserts (new foods and new values of existing names) and deletes go
+through a :class:`CatalogRegistry` with an in-memory edit log. After every
+round the published :class:`OverlaySnapshot` is compared with a
+:class:`CatalogSnapshot` built from scratch over its compacted columns, live
+rows mapped to their compacted positions:
+
+* recommendations of synthetic requests, with and without filters;
+* filter masks and name search results;
+* similar foods, against the rebuilt neighbour graph (float16 scores).
+
+Finally the registry compacts, and its patched neighbour graph is compared
+with a full build over the compacted catalog. Differing rows only pass as ties,
+when their scores agree within ``--tolerance``. Foods are drawn inside the
+scaler's range, so no refit is triggered. Exits non-zero on any mismatch::
+
+    python -m benchmarks.overlay_check --rounds 5 --edits 20
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from benchmarks.common import load_catalog, synthetic_queries
+from recommender import config
+from recommender.engine import RecommendationEngine
+from recommender.mutations import EditLog, compacted_columns
+from recommender.neighbours import NeighbourGraph
+from recommender.registry import CatalogRegistry, CatalogSnapshot
+
+
+def random_foods(snapshot, n, rng, names):
+    """``n`` upserted foods around live catalog rows, within the range of the snapshot's scaler."""
+    columns, scaler = snapshot.columns, snapshot.scaler
+    live = np.flatnonzero(getattr(snapshot, 'live', np.ones(len(columns), dtype=bool)))
+    foods = []
+    while len(foods) < n:
+        row = int(rng.choice(live))
+        values = columns.nutrients[row, :4] * rng.uniform(0.7, 1.0, 4)
+        density = (values[2] + values[3] - values[1]) / (values[0] + 1e-6)
+        features = np.append(values, density)
+        if ((features < scaler.data_min_) | (features > scaler.data_max_)).any():
+            continue
+        food = {'name': names.pop() if names else f"check food {rng.integers(1 << 30)}",
+                'type': snapshot.meal_type_names[int(columns.meal_types[row])]}
+        food.update(zip(['calories', 'fat', 'proteins', 'carbohydrate'], values.tolist()))
+        for col, (codes, categories) in columns.attributes.items():
+            food[col.lower()] = categories[int(codes[row])]
+        foods.append(food)
+    return foods
+
+
+def rebuilt(snapshot):
+    """A fresh snapshot of the live rows of ``snapshot`` and its row -> rebuilt row mapping."""
+    columns = compacted_columns(snapshot)
+    engine = RecommendationEngine(snapshot.scaler.transform(columns.nutrients), columns.meal_types,
+                                  snapshot.meal_type_names)
+    mapping = np.full(len(snapshot.live), -1)
+    mapping[snapshot.live] = np.arange(len(columns))
+    return CatalogSnapshot('rebuilt', snapshot.scaler, columns, engine, snapshot.meal_type_names), mapping
+
+
+def _same(rows, scores, expected_rows, expected_scores, tolerance):
+    if np.array_equal(rows, expected_rows):
+        return 'same'
+    if len(rows) == len(expected_rows) and np.allclose(scores, expected_scores, rtol=0, atol=tolerance):
+        return 'tie'
+    return 'mismatch'
+
+
+def compare(snapshot, reference, mapping, queries, filters, texts, rng, tolerance):
+    counts = {check: {'same': 0, 'tie': 0, 'mismatch': 0} for check in ('recommend', 'filters', 'names', 'similar')}
+    reference_features = reference.engine.features
+    for filter_ in filters:
+        mask = snapshot.filters.mask(filter_)
+        expected_mask = reference.filters.mask(filter_)
+        same = (mask is None and expected_mask is None) or (
+            mask is not None and expected_mask is not None and np.array_equal(mask[snapshot.live], expected_mask))
+        counts['filters']['same' if same else 'mismatch'] += 1
+        results = snapshot.engine.recommend_batch(queries, 5, None if mask is None else [mask] * len(queries))
+        expected = reference.engine.recommend_batch(queries, 5,
+                                                    None if expected_mask is None else [expected_mask] * len(queries))
+        for query, result, expected_result in zip(queries, results, expected):
+            unit = query / np.linalg.norm(query)
+            for (_, rows), (_, expected_rows) in zip(result, expected_result):
+                rows = mapping[rows]
+                counts['recommend'][_same(rows, reference_features[rows] @ unit, expected_rows,
+                                          reference_features[expected_rows] @ unit, tolerance)] += 1
+    for text in texts:
+        rows, scores, matches = snapshot.names.search(text)
+        expected_rows, expected_scores, expected_matches = reference.names.search(text)
+        same = (np.array_equal(mapping[rows], expected_rows) and np.allclose(scores, expected_scores)
+                and matches == expected_matches)
+        counts['names']['same' if same else 'mismatch'] += 1
+    for row in rng.choice(np.flatnonzero(snapshot.live), 50, replace=False):
+        for meal_type in snapshot.meal_type_names:
+            rows, scores = snapshot.neighbours.similar(row, meal_type, config.NEIGHBOURS_K)
+            expected_rows, expected_scores = reference.neighbours.similar(mapping[row], meal_type)
+            # the rebuilt graph rounds scores to float16
+            counts['similar'][_same(mapping[rows], scores, expected_rows, expected_scores, 1e-3)] += 1
+    return counts
+
+
+def compare_graphs(patched, full, tolerance):
+    """'same', 'tie' or 'mismatch' of a patched neighbour graph against a full build."""
+    if not np.array_equal(patched.indptr, full.indptr):
+        return 'mismatch'
+    scores = np.asarray(patched.scores, dtype=np.float64)
+    if np.abs(scores - np.asarray(full.scores, dtype=np.float64)).max(initial=0) > tolerance:
+        return 'mismatch'
+    return 'same' if np.array_equal(patched.indices, full.indices) else 'tie'
+
+
+def _report(title, counts):
+    print(title)
+    for check, row in counts.items():
+        print(f"  {check:>10} {row['same']:>6} same {row['tie']:>5} ties {row['mismatch']:>5} mismatches")
+    return sum(row['mismatch'] for row in counts.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--edits', type=int, default=20, help='foods upserted and names deleted per round')
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--tolerance', type=float, default=1e-6, help='largest score gap accepted as a tie')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    # compaction is triggered here, not by the registry's timer or row threshold
+    config.COMPACT_INTERVAL = 0
+    config.COMPACT_ROWS = 1 << 62
+    registry = CatalogRegistry(edits=EditLog())
+    registry.reload()
+    # built up front, so the compaction patches it rather than leaving the new graph to be scored lazily
+    registry.current.neighbours
+    rng = np.random.default_rng(args.seed)
+    df, scaler = load_catalog()
+    queries = synthetic_queries(df, scaler, args.queries, args.seed)
+    attributes = registry.current.filters.attributes()
+    # nutrient bounds are in kcal, the catalog's median calories are scaled
+    low, high = registry.current.nutrient_ranges[0]
+    filters = [None, {'max_calories': low + float(np.median(df['calories'])) * (high - low)}] + [
+        {attribute: values[0]} for attribute, values in attributes.items()]
+
+    mismatches = 0
+    for round_ in range(args.rounds):
+        names = list(registry.current.columns.names)
+        existing = [names[row] for row in rng.choice(np.flatnonzero(registry.current.live if round_ else
+                                                                    np.ones(len(names), dtype=bool)), args.edits)]
+        upserts = random_foods(registry.current, args.edits, rng, existing[:args.edits // 2])
+        registry.edit({'op': 'upsert', 'foods': upserts})
+        live = np.flatnonzero(registry.current.live)
+        deleted = sorted({registry.current.columns.names[row] for row in rng.choice(live, args.edits)})
+        registry.edit({'op': 'delete', 'names': deleted})
+
+        snapshot = registry.current
+        reference, mapping = rebuilt(snapshot)
+        texts = [snapshot.columns.names[row][:length] for row in rng.choice(np.flatnonzero(snapshot.live), 20)
+                 for length in (3, 8)] + [food['name'] for food in upserts[:5]]
+        counts = compare(snapshot, reference, mapping, queries, filters, texts, rng, args.tolerance)
+        mismatches += _report(f"round {round_ + 1}: {snapshot.version}, {len(reference.columns)} live foods", counts)
+
+    snapshot = registry.current
+    compacted = registry.compact()
+    full = NeighbourGraph.build(compacted.engine, config.NEIGHBOURS_K, config.NEIGHBOURS_MEMORY_MB)
+    # the graphs store float16 scores, ties are within its resolution
+    outcome = compare_graphs(compacted.neighbours, full, 1e-3)
+    print(f"compacted {compacted.version}: patched neighbour graph {outcome} against a full build")
+    mismatches += outcome == 'mismatch'
+    reference, mapping = rebuilt(snapshot)
+    same = (compacted.columns.names == reference.columns.names
+            and np.array_equal(compacted.columns.nutrients, reference.columns.nutrients))
+    print(f"compacted columns {'same' if same else 'mismatch'} as the rebuilt ones")
+    mismatches += not same
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Equivalence check of the streaming pipeline against the notebooks' in-memory steps.
+
+Two comparisons, exiting non-zero when either finds a difference:
+
+* classification: :class:`~recommender.pipeline.KeywordMatcher` against
+  ``categorize_complete_meal_type`` executed from data-preparation.ipynb
+  itself, over every name of every source;
+* output: :func:`recommender.pipeline.build`, run with small and large chunks
+  into a temporary directory, against the cells of Data_Preprocessing.ipynb
+  replayed in pandas on the whole sources at once (``MinMaxScaler``, medians,
+  levels, density, sort, ``calories > 0``). The reference applies the
+  pipeline's documented departures from the notebooks: names are stripped,
+  rows with missing nutrients dropped, unclassified rows dropped before
+  scaling, duplicates removed by name with the first one kept, and the sort
+  is stable. Values must agree within ``--tolerance``; rows may only swap
+  places where their densities tie.
+
+Run it with::
+
+    python -m benchmarks.pipeline_check --chunk-sizes 97 100000
+"""
+import argparse
+import ast
+import json
+import os
+import sys
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+from recommender.engine import NUMERIC_COLS
+from recommender.pipeline import (DEFAULT_SOURCES, MACRO_COLS, MEAL_KEYWORDS, OUTPUT_COLS, KeywordMatcher, _schema,
+                                  build)
+
+NOTEBOOK = 'data-preparation.ipynb'
+# LabelEncoder codes of the notebook's meal type labels, "ingrideint" rows are dropped
+LABELS = {'Breakfast': 0, 'Carbs': 1, 'Drink': 2, 'Lunch/Dinner': 3, 'Snack': 4, 'ingrideint': -1}
+
+
+def notebook_categorize(path=NOTEBOOK):
+    """``categorize_complete_meal_type`` as defined in the notebook, without running its other cells."""
+    with open(path) as f:
+        cells = json.load(f)['cells']
+    for cell in cells:
+        if cell['cell_type'] != 'code':
+            continue
+        for node in ast.parse(''.join(cell['source'])).body:
+            if isinstance(node, ast.FunctionDef) and node.name == 'categorize_complete_meal_type':
+                namespace = {}
+                exec(compile(ast.Module([node], []), path, 'exec'), namespace)
+                return namespace[node.name]
+    raise ValueError(f"{path} defines no categorize_complete_meal_type")
+
+
+def read_sources(sources):
+    """Every source mapped onto the canonical columns, names stripped and incomplete rows dropped."""
+    frames = []
+    for path in sources:
+        schema = _schema(path)
+        frame = pd.read_csv(path, usecols=list(schema)).rename(columns=schema)[['name'] + MACRO_COLS]
+        frame[MACRO_COLS] = frame[MACRO_COLS].apply(pd.to_numeric, errors='coerce')
+        frame = frame.dropna()
+        frame['name'] = frame['name'].astype(str).str.strip()
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def check_classification(names, categorize):
+    expected = np.array([LABELS[categorize({'name': name})] for name in names])
+    found = KeywordMatcher(MEAL_KEYWORDS).classify(names)
+    return int(np.count_nonzero(expected != found))
+
+
+def reference(df, categorize):
+    """The processed dataset and served scaler, from the notebook cells on the pipeline's rows."""
+    df = df.copy()
+    df['Meal Type'] = [LABELS[categorize({'name': name})] for name in df['name']]
+    df = df[df['Meal Type'] >= 0]
+    df = df[~df['name'].str.lower().duplicated()].copy()
+    df[MACRO_COLS] = MinMaxScaler().fit_transform(df[MACRO_COLS])
+    carb_median = df["carbohydrate"].median()
+    protein_median = df["proteins"].median()
+    df["Carb_Level"] = np.where(df["carbohydrate"] >= carb_median, "High-Carb", "Low-Carb")
+    df["Protein_Level"] = np.where(df["proteins"] >= protein_median, "High-Protein", "Low-Protein")
+    df["Nutrient_Density"] = (df["proteins"] + df["carbohydrate"] - df["fat"]) / (df["calories"] + 1e-6)
+    df = df.sort_values(by="Nutrient_Density", ascending=False, kind='stable')
+    df = df[df["calories"] > 0][OUTPUT_COLS].reset_index(drop=True)
+    return df, MinMaxScaler().fit(df[NUMERIC_COLS])
+
+
+def compare(found, scaler, expected, expected_scaler, tolerance):
+    """Problems of a pipeline output against the reference, an empty list when they agree."""
+    if sorted(found['name']) != sorted(expected['name']):
+        missing = set(expected['name']) - set(found['name'])
+        extra = set(found['name']) - set(expected['name'])
+        return [f"rows differ: {len(missing)} missing, {len(extra)} extra"]
+    problems = []
+    aligned = expected.set_index('name').loc[found['name']].reset_index()
+    for col in ['Meal Type', 'Carb_Level', 'Protein_Level']:
+        differing = int((aligned[col].to_numpy() != found[col].to_numpy()).sum())
+        if differing:
+            problems.append(f"{col} differs on {differing} rows")
+    for col in MACRO_COLS + ['Nutrient_Density']:
+        error = float(np.abs(aligned[col].to_numpy() - found[col].to_numpy()).max(initial=0))
+        if error > tolerance:
+            problems.append(f"{col} differs by up to {error:.3g}")
+    if not found['name'].equals(expected['name']):
+        # the pipeline's order must be the reference's up to ties in density
+        if (np.diff(aligned['Nutrient_Density'].to_numpy()) > tolerance).any():
+            problems.append("rows are not sorted by density")
+    for attribute in ('data_min_', 'data_max_'):
+        error = float(np.abs(getattr(scaler, attribute) - getattr(expected_scaler, attribute)).max())
+        if error > tolerance:
+            problems.append(f"scaler {attribute} differs by up to {error:.3g}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    parser.add_argument('--notebook', default=NOTEBOOK)
+    parser.add_argument('--chunk-sizes', type=int, nargs='+', default=[97, 100000])
+    parser.add_argument('--tolerance', type=float, default=1e-9, help='largest difference between values')
+    args = parser.parse_args()
+
+    categorize = notebook_categorize(args.notebook)
+    df = read_sources(args.sources)
+    failed = False
+    differing = check_classification(df['name'].tolist(), categorize)
+    print(f"classification: {differing} of {len(df)} names differ from the notebook")
+    failed |= differing > 0
+
+    expected, expected_scaler = reference(df, categorize)
+    for chunk_size in args.chunk_sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            out, scaler_path = os.path.join(tmp, 'processed_dataset.csv'), os.path.join(tmp, 'scaler.pkl')
+            build(args.sources, os.path.join(tmp, 'work'), out, scaler_path, chunk_size=chunk_size, log=lambda _: None)
+            problems = compare(pd.read_csv(out), joblib.load(scaler_path), expected, expected_scaler, args.tolerance)
+        print(f"chunk size {chunk_size}: {len(expected)} foods, {'; '.join(problems) or 'same as the reference'}")
+        failed |= bool(problems)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Cold start time and memory of the server, CSV + pickled scaler against the lean artifact.
+
+Every run starts a fresh interpreter that imports the app, loads the catalog
+and answers one recommendation, and reports the time of each step, its
+resident memory and whether pandas, scikit-learn, scipy or joblib got
+imported. The ``csv`` mode serves ``RECOMMENDER_DATASET`` with ``scaler.pkl``;
+the ``lean`` mode serves a catalog artifact carrying its scaler, built into a
+temporary directory unless ``--catalog`` names one::
+
+    python -m benchmarks.startup_bench --runs 5 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HEAVY_MODULES = ['pandas', 'sklearn', 'scipy', 'joblib']
+MODES = ['csv', 'lean']
+
+# runs in the child interpreter, which must not import anything the app would not
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import deployment
+imported = time.perf_counter()
+client = deployment.app.test_client()
+response = client.post('/api/v1/recommendations',
+                       json={'userid': 0, 'calories': 300, 'fat': 10, 'proteins': 5, 'carbohydrate': 40})
+answered = time.perf_counter()
+# VmHWM is this image's peak, getrusage would report the forking parent's
+memory = {}
+with open('/proc/self/status') as f:
+    for line in f:
+        if line.startswith(('VmRSS:', 'VmHWM:')):
+            memory[line.split(':')[0]] = int(line.split()[1])
+print(json.dumps({
+    'ok': response.status_code == 200 and response.get_json()['success'],
+    'import_load_s': imported - start,
+    'first_request_s': answered - imported,
+    'rss_mb': memory.get('VmRSS', 0) / 1024,
+    'peak_rss_mb': memory.get('VmHWM', 0) / 1024,
+    'heavy_modules': [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def build_lean_catalog(root):
+    # only the parent pays for these imports
+    import joblib
+    import pandas as pd
+
+    from recommender import config
+    from recommender.artifact import build_artifact
+
+    build_artifact(pd.read_csv(config.DATASET_PATH), joblib.load(config.SCALER_PATH), root)
+    return root
+
+
+def run_once(mode, catalog):
+    env = dict(os.environ, PYTHONWARNINGS='ignore', RECOMMENDER_CATALOG=catalog if mode == 'lean' else '',
+               RECOMMENDER_WATCH_INTERVAL='0')
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, '-c', CHILD], env=env, capture_output=True, text=True, check=True)
+    result = json.loads(output.stdout.strip().splitlines()[-1])
+    result['process_s'] = time.perf_counter() - start
+    return result
+
+
+def run(modes, runs, catalog):
+    rows = []
+    for mode in modes:
+        results = [run_once(mode, catalog) for _ in range(runs)]
+        row = {'mode': mode, 'runs': runs, 'ok': all(result['ok'] for result in results),
+               'heavy_modules': results[-1]['heavy_modules']}
+        for key in ('process_s', 'import_load_s', 'first_request_s', 'rss_mb', 'peak_rss_mb'):
+            row[key] = statistics.median(result[key] for result in results)
+        rows.append(row)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--catalog', help='artifact root for the lean mode (default: build a temporary one)')
+    parser.add_argument('--json', help='write the report rows to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog = args.catalog or ('lean' in args.modes and build_lean_catalog(os.path.join(tmp, 'catalog'))) or ''
+        rows = run(args.modes, args.runs, catalog)
+
+    print(f"{'mode':>5} {'process s':>10} {'import+load s':>14} {'first req ms':>13} {'rss MB':>7} "
+          f"{'peak MB':>8}  heavy modules")
+    for row in rows:
+        print(f"{row['mode']:>5} {row['process_s']:>10.3f} {row['import_load_s']:>14.3f} "
+              f"{row['first_request_s'] * 1e3:>13.2f} {row['rss_mb']:>7.1f} {row['peak_rss_mb']:>8.1f}  "
+              f"{', '.join(row['heavy_modules']) or '-'}{'' if row['ok'] else '  (FAILED)'}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,112 +1,616 @@
-from flask import Flask, request, jsonify, Response
+from flask import Blueprint, Flask, g, request, jsonify, Response
 import uuid
+import hmac
 import datetime
+import time
 import numpy as np
-import pandas as pd
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics.pairwise import cosine_similarity
-import joblib
 from collections import OrderedDict
-import json
+from recommender import config
+from recommender.cache import quantize
+from recommender import metrics
+from recommender.batching import MicroBatcher
+from recommender.engine import NUMERIC_COLS, MEAL_TYPE_NAMES, nutrient_density
+from recommender.filters import filter_key
+from recommender.history import HistoryStore
+from recommender.metrics import span
+from recommender.profiler import SamplingProfiler
+from recommender.registry import CatalogRegistry
+from recommender.responses import dumps
 
-df = pd.read_csv('Dataset/processed_dataset.csv')
-scaler = joblib.load('scaler.pkl')
+numeric_cols = NUMERIC_COLS
+meal_type_names = MEAL_TYPE_NAMES
 
-if not isinstance(scaler, MinMaxScaler):
-    raise ValueError("Loaded scaler is not a MinMaxScaler instance")
+# holds the catalog version currently being served, see load_catalog()
+registry = CatalogRegistry()
+profiler = SamplingProfiler()
+# shared scoring of concurrent recommendation queries, see RECOMMENDER_MICROBATCH
+batcher = MicroBatcher(config.MICROBATCH_MAX_SIZE, config.MICROBATCH_MAX_WAIT_US) if config.MICROBATCH else None
+# served and eaten foods per user, left out of their next recommendations, see RECOMMENDER_HISTORY
+history = HistoryStore(
+    config.HISTORY_PATH, config.HISTORY_WINDOW_DAYS, config.HISTORY_RETENTION_DAYS, config.HISTORY_CACHE_SIZE,
+    config.HISTORY_CACHE_TTL, config.HISTORY_FLUSH_INTERVAL, config.HISTORY_FLUSH_ROWS,
+) if config.HISTORY_PATH else None
 
-# normalize the dataset
-numeric_cols = ['calories', 'fat', 'proteins', 'carbohydrate', 'Nutrient_Density']
-df_scaled = pd.DataFrame(scaler.transform(df[numeric_cols]), columns=numeric_cols)
-meal_type_names = {0: 'Breakfast', 1: 'Carbs', 2: 'Drink', 3: 'Lunch_Dinner', 4: 'Snack'}
+def _cache_stat(name):
+    def collect():
+        snapshot = registry.current
+        return [((), snapshot.cache.stats()[name])] if snapshot else []
+    return collect
 
-app = Flask(__name__)
+metrics.registry.register(metrics.Gauge(
+    "recommender_catalog_rows", "Foods in the served catalog.",
+    lambda: [((), len(registry.current.engine))] if registry.current else []))
+metrics.registry.register(metrics.Gauge(
+    "recommender_catalog_info", "Version of the served catalog.",
+    lambda: [((registry.current.version,), 1)] if registry.current else [], labels=["version"]))
+metrics.registry.register(metrics.Gauge(
+    "recommender_cache_entries", "Entries in the recommendation cache.", _cache_stat("size")))
+for _stat in ("hits", "misses", "evictions", "expirations"):
+    metrics.registry.register(metrics.Gauge(
+        f"recommender_cache_{_stat}_total", f"Recommendation cache {_stat} of the served catalog version.",
+        _cache_stat(_stat), kind="counter"))
+for _stat in ("batches", "queries"):
+    metrics.registry.register(metrics.Gauge(
+        f"recommender_microbatch_{_stat}_total", f"Micro-batched scoring {_stat}.",
+        lambda stat=_stat: [((), batcher.stats()[stat])] if batcher else [], kind="counter"))
+metrics.registry.register(metrics.Gauge(
+    "recommender_history_pending", "History events waiting to be written.",
+    lambda: [((), history.stats()["pending"])] if history else []))
+metrics.registry.register(metrics.Gauge(
+    "recommender_history_written_total", "History events written to the database.",
+    lambda: [((), history.stats()["written"])] if history else [], kind="counter"))
+
+api = Blueprint("api", __name__)
+
+def _snapshot():
+    # read once per request, so a reload never changes the catalog mid-request
+    if "snapshot" not in g:
+        g.snapshot = registry.current
+    return g.snapshot
+
+@api.before_request
+def _start_timer():
+    g.started = time.perf_counter()
+
+@api.after_request
+def _after_request(response):
+    snapshot = g.get("snapshot")
+    if snapshot is not None:
+        response.headers["X-Catalog-Version"] = snapshot.version
+    endpoint = request.endpoint or "unknown"
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.started, endpoint)
+    metrics.REQUESTS.inc(endpoint, response.status_code)
+    if g.get("failed"):
+        metrics.ERRORS.inc(endpoint)
+    return response
+
+def _nutrients(data):
+    nutrients = [data["calories"], data["fat"], data["proteins"], data["carbohydrate"]]
+    # null, strings and booleans would otherwise be coerced into NaN or garbage by numpy
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in nutrients):
+        raise ValueError("calories, fat, proteins and carbohydrate must be numbers")
+    if not np.isfinite(nutrients).all():
+        raise ValueError("calories, fat, proteins and carbohydrate must be finite")
+    return nutrients
+
+def _input_features(calories, fat, proteins, carbohydrate):
+    return [calories, fat, proteins, carbohydrate, nutrient_density(calories, fat, proteins, carbohydrate)]
+
+def _recommendation_items(snapshot, results):
+    with span("materialize"):
+        return snapshot.columns.food_items(results, meal_type_names)
+
+def _json_response(payload, status=200):
+    # compact by default, indented with ?pretty=1
+    pretty = request.args.get("pretty", "").lower() in ("1", "true", "yes")
+    with span("serialize"):
+        body = dumps(payload, pretty)
+    return Response(body, status=status, mimetype="application/json")
+
+def _error_response(e, status=200):
+    # errors keep the historical 200 + success false, they are counted in /metrics
+    g.failed = True
+    error_response = {"success": False, "error": str(e)}
+    return _json_response(error_response, status=status)
+
+def _diversity(data):
+    # optional MMR re-ranking: {"lambda": 0.7, "pool": 25}, or true for the configured defaults
+    diversity = data.get("diversity")
+    if diversity is None or diversity is False:
+        return None
+    if diversity is True:
+        diversity = {}
+    if not isinstance(diversity, dict):
+        raise ValueError("diversity must be an object with lambda and pool, or true")
+    lambda_ = float(diversity.get("lambda", config.MMR_LAMBDA))
+    pool = int(diversity.get("pool", config.MMR_POOL))
+    if not 0 <= lambda_ <= 1:
+        raise ValueError("diversity lambda must be between 0 and 1")
+    if not 5 <= pool <= config.MMR_MAX_POOL:
+        raise ValueError(f"diversity pool must be between 5 and {config.MMR_MAX_POOL}")
+    return lambda_, pool
+
+def _recommend_nutrients(snapshot, nutrients, mask=None, diversity=None):
+    if batcher is not None:
+        with span("batch"):
+            results = batcher.recommend(snapshot, _input_features(*nutrients), 5, mask, diversity)
+        return _recommendation_items(snapshot, results)
+    with span("scale"):
+        input_scaled = snapshot.scaler.transform(np.array([_input_features(*nutrients)]))
+    return _recommendation_items(snapshot, snapshot.engine.recommend(input_scaled, k=5, mask=mask, diversity=diversity))
+
+def _history_mask(snapshot, user_id, mask=None):
+    # the user's recently served and eaten foods are left out, None keeps every row
+    if history is None:
+        return mask
+    with span("history"):
+        allowed = history.mask(snapshot, user_id)
+    if allowed is None or mask is None:
+        return mask if allowed is None else allowed
+    return mask & allowed
+
+def _record_served(user_id, recommendations):
+    if history is not None:
+        history.record(user_id, [item["food"]["name"] for item in recommendations])
+
+def _user_recommendations(user_id, date, recommendations):
+    return OrderedDict([
+        ("userID", user_id),
+        ("date", date),
+        ("status", "success"),
+        ("data", recommendations)
+    ])
 
 # endpoint to get food recommendations
-@app.route("/api/v1/recommendations", methods=["POST"])
+@api.route("/api/v1/recommendations", methods=["POST"])
 def recommend():
     try:
+        snapshot = _snapshot()
+        with span("parse"):
+            data = request.get_json()
+            user_id = data["userid"]
+            # the recommendation list is shared by all users asking for the same nutrients and filters
+            key, nutrients = quantize(_nutrients(data), config.CACHE_GRID)
+            filters = data.get("filters")
+            diversity = _diversity(data)
+        excluded = _history_mask(snapshot, user_id)
+        if excluded is None:
+            recommendations = snapshot.cache.get_or_compute(
+                (key, filter_key(filters), diversity),
+                lambda: _recommend_nutrients(snapshot, nutrients, snapshot.filters.mask(filters), diversity))
+        else:
+            # a list without the user's recent foods is theirs alone and skips the shared cache
+            mask = snapshot.filters.mask(filters)
+            recommendations = _recommend_nutrients(
+                snapshot, nutrients, excluded if mask is None else mask & excluded, diversity)
+        _record_served(user_id, recommendations)
+
+        response_data = OrderedDict([
+            ("success", True),
+            ("data", _user_recommendations(user_id, datetime.datetime.now().strftime("%d-%m-%Y"), recommendations))
+        ])
+        return _json_response(response_data)
+
+    except Exception as e:
+        return _error_response(e)
+
+# endpoint to get food recommendations for many users at once
+@api.route("/api/v1/recommendations/batch", methods=["POST"])
+def recommend_batch():
+    try:
+        snapshot = _snapshot()
+        with span("parse"):
+            users = request.get_json()
+            if not isinstance(users, list):
+                raise ValueError("Expected a JSON array of users")
+            user_ids = [user["userid"] for user in users]
+            diversity = [_diversity(user) for user in users]
+            input_features = np.array([_input_features(*_nutrients(user)) for user in users], dtype=np.float64).reshape(-1, len(numeric_cols))
+        with span("scale"):
+            input_scaled = snapshot.scaler.transform(input_features) if users else input_features
+        date = datetime.datetime.now().strftime("%d-%m-%Y")
+        recommendations = []
+        # a catalog-sized mask per user, so they only exist for one chunk of users at a time
+        for start in range(0, len(users), config.BATCH_CHUNK_SIZE):
+            chunk = slice(start, start + config.BATCH_CHUNK_SIZE)
+            masks = [_history_mask(snapshot, user_id, snapshot.filters.mask(user.get("filters")))
+                     for user_id, user in zip(user_ids[chunk], users[chunk])]
+            results = snapshot.engine.recommend_batch(input_scaled[chunk], k=5, masks=masks,
+                                                      diversity=diversity[chunk])
+            recommendations.extend(_recommendation_items(snapshot, user_results) for user_results in results)
+        for user_id, user_recommendations in zip(user_ids, recommendations):
+            _record_served(user_id, user_recommendations)
+
+        response_data = OrderedDict([
+            ("success", True),
+            ("data", [
+                _user_recommendations(user_id, date, user_recommendations)
+                for user_id, user_recommendations in zip(user_ids, recommendations)
+            ])
+        ])
+        return _json_response(response_data)
+
+    except Exception as e:
+        return _error_response(e)
+
+# endpoint to get food recommendations matching micronutrient targets
+@api.route("/api/v1/recommendations/micronutrients", methods=["POST"])
+def recommend_micronutrients():
+    try:
+        snapshot = _snapshot()
+        with span("parse"):
+            data = request.get_json()
+            user_id = data["userid"]
+            targets = data["targets"]
+            weights = data.get("weights")
+            k = min(int(data.get("k", 5)), 50)
+
+        if snapshot.micronutrients is None:
+            raise ValueError("Micronutrient profiles are unavailable, check RECOMMENDER_MICRO_SOURCES")
+        with span("similarity"):
+            results = snapshot.micronutrients.recommend(targets, weights, k)
+        with span("materialize"):
+            recommendations = []
+            for meal_type, rows, scores in results:
+                recommendations.extend(snapshot.columns.similar_items(rows, scores, meal_type_names[meal_type]))
+
+        response_data = OrderedDict([
+            ("success", True),
+            ("data", _user_recommendations(user_id, datetime.datetime.now().strftime("%d-%m-%Y"), recommendations))
+        ])
+        return _json_response(response_data)
+
+    except Exception as e:
+        return _error_response(e)
+
+def _meal_slots(items):
+    # meal type of every item in a day, one per meal type unless the request asks for more
+    counts = {meal_category: 1 for meal_category in meal_type_names.values()}
+    items = {} if items is None else items
+    if not isinstance(items, dict):
+        raise ValueError("items must be an object of counts per meal type")
+    for meal_category, count in items.items():
+        if meal_category not in counts:
+            raise ValueError(f"Unknown meal type {meal_category!r}")
+        if isinstance(count, bool) or not isinstance(count, int) or not 0 <= count <= config.PLANNER_MAX_ITEMS:
+            raise ValueError(f"items of {meal_category!r} must be a whole number "
+                             f"between 0 and {config.PLANNER_MAX_ITEMS}")
+        counts[meal_category] = count
+    slots = [meal_type for meal_type, meal_category in meal_type_names.items() for _ in range(counts[meal_category])]
+    if not slots:
+        raise ValueError("items must ask for at least one food")
+    return slots
+
+# endpoint to get a daily or multi-day meal plan that fits the user's targets
+@api.route("/api/v1/mealPlan", methods=["POST"])
+def meal_plan():
+    try:
+        snapshot = _snapshot()
         data = request.get_json()
         user_id = data["userid"]
-        calories = data["calories"]
-        fat = data["fat"]
-        proteins = data["proteins"]
-        carbohydrate = data["carbohydrate"]
+        target = _nutrients(data)
+        slots = _meal_slots(data.get("items"))
+        days = int(data.get("days", 1))
+        if not 1 <= days <= config.PLANNER_MAX_DAYS:
+            raise ValueError(f"days must be between 1 and {config.PLANNER_MAX_DAYS}")
+        tolerance = float(data.get("tolerance", 0.1))
+        time_budget = min(float(data.get("time_budget_ms", config.PLANNER_TIME_BUDGET_MS)),
+                          config.PLANNER_MAX_TIME_BUDGET_MS) / 1000
 
-        # density calculation
-        nutrient_density = (proteins + carbohydrate - fat) / (calories + 1e-6)
-        input_features = np.array([[calories, fat, proteins, carbohydrate, nutrient_density]])
-        input_scaled = scaler.transform(input_features)
-        sim_scores = cosine_similarity(input_scaled, df_scaled).flatten()
+        with span("plan"):
+            plan, complete = snapshot.planner.plan(target, slots, days, time_budget, tolerance)
 
-        recommendations = []
-        for meal_type, meal_category in meal_type_names.items():
-            meal_indices = df[df['Meal Type'] == meal_type].index
-            meal_similarities = sorted(
-                [(idx, sim_scores[idx]) for idx in meal_indices], key=lambda x: x[1], reverse=True
-            )[:5]
-
-            for idx, _ in meal_similarities:
-                food_item = {
-                    "type": meal_category,
-                    "food": {
-                        "name": df.iloc[idx]["name"],
-                        "proteins": df.iloc[idx]["proteins"],
-                        "calories": df.iloc[idx]["calories"],
-                        "fat": df.iloc[idx]["fat"],
-                        "carbo": df.iloc[idx]["carbohydrate"],
-                        "nutrient_density": df.iloc[idx]["Nutrient_Density"]
-                    }
-                }
-                recommendations.append(food_item)
+        day_plans = []
+        for day, (rows, totals, _) in enumerate(plan.days, start=1):
+            errors = np.abs(totals - target) / np.maximum(np.abs(target), 1e-6)
+            day_plans.append(OrderedDict([
+                ("day", day),
+                ("within_tolerance", bool((errors <= tolerance).all())),
+                ("totals", OrderedDict(zip(["calories", "fat", "proteins", "carbo"], totals.tolist()))),
+                ("data", _recommendation_items(snapshot, [(meal_type, [row]) for meal_type, row in zip(slots, rows)]))
+            ]))
 
         response_data = OrderedDict([
             ("success", True),
             ("data", OrderedDict([
                 ("userID", user_id),
                 ("date", datetime.datetime.now().strftime("%d-%m-%Y")),
+                ("status", "success" if complete else "partial"),
+                ("data", day_plans)
+            ]))
+        ])
+        return _json_response(response_data)
+
+    except (KeyError, TypeError, ValueError) as e:
+        # targets, items or settings the planner cannot work with
+        return _error_response(e, status=400)
+    except Exception as e:
+        return _error_response(e)
+
+# endpoint to get the foods most similar to a given food
+@api.route("/api/v1/foods/similar", methods=["GET"])
+def similar_foods():
+    try:
+        snapshot = _snapshot()
+        name = request.args["name"]
+        if name not in snapshot.name_rows:
+            raise ValueError(f"Unknown food {name!r}")
+        row = snapshot.name_rows[name]
+        k = int(request.args.get("k", 5))
+        requested_type = request.args.get("type")
+
+        similar = []
+        for meal_type, meal_category in meal_type_names.items():
+            if requested_type not in (None, meal_category):
+                continue
+            rows, scores = snapshot.neighbours.similar(row, meal_type, k)
+            similar.extend(snapshot.columns.similar_items(rows, scores, meal_category))
+
+        response_data = OrderedDict([
+            ("success", True),
+            ("data", OrderedDict([
+                ("name", name),
                 ("status", "success"),
-                ("data", recommendations)
+                ("data", similar)
             ]))
         ])
-        return Response(json.dumps(response_data, indent=4, sort_keys=False), mimetype="application/json")
+        return _json_response(response_data)
 
     except Exception as e:
-        error_response = {"success": False, "error": str(e)}
-        return Response(json.dumps(error_response, indent=4, sort_keys=False), mimetype="application/json")
+        return _error_response(e)
+
+# endpoint to search foods by name, for type-ahead
+@api.route("/api/v1/foods/search", methods=["GET"])
+def search_foods():
+    try:
+        snapshot = _snapshot()
+        query = request.args["q"]
+        limit = min(int(request.args.get("limit", 10)), 100)
+        requested_type = request.args.get("type")
+        meal_type = None
+        if requested_type is not None:
+            codes = {meal_category: code for code, meal_category in meal_type_names.items()}
+            if requested_type not in codes:
+                raise ValueError(f"Unknown meal type {requested_type!r}")
+            meal_type = codes[requested_type]
+
+        with span("search"):
+            rows, scores, matches = snapshot.names.search(query, limit, meal_type)
+
+        response_data = OrderedDict([
+            ("success", True),
+            ("data", OrderedDict([
+                ("query", query),
+                ("status", "success"),
+                ("data", snapshot.columns.search_items(rows, scores, matches, meal_type_names))
+            ]))
+        ])
+        return _json_response(response_data)
+
+    except Exception as e:
+        return _error_response(e)
+
+def _history_enabled():
+    if history is None:
+        raise ValueError("User history is disabled, set RECOMMENDER_HISTORY to a database path")
+    return history
+
+# endpoint to record foods a user ate, which are then left out of their recommendations for a few days
+@api.route("/api/v1/history", methods=["POST"])
+def record_history():
+    try:
+        store = _history_enabled()
+        snapshot = _snapshot()
+        data = request.get_json()
+        user_id = data["userid"]
+        foods = data["foods"]
+        event = data.get("event", "eaten")
+        if not isinstance(foods, list) or not all(isinstance(food, str) for food in foods):
+            raise ValueError("foods must be a list of food names")
+        unknown = [food for food in foods if food not in snapshot.name_rows]
+        if unknown:
+            raise ValueError(f"Unknown foods: {', '.join(map(repr, unknown))}")
+        store.record(user_id, foods, event)
+
+        response_data = OrderedDict([
+            ("success", True),
+            ("data", OrderedDict([
+                ("userID", user_id),
+                ("status", "success"),
+                ("data", {"event": event, "recorded": len(foods)})
+            ]))
+        ])
+        return _json_response(response_data)
+
+    except Exception as e:
+        return _error_response(e)
+
+# endpoint to get the foods a user was recently served and ate
+@api.route("/api/v1/history", methods=["GET"])
+def user_history():
+    try:
+        store = _history_enabled()
+        user_id = request.args["userid"]
+
+        response_data = OrderedDict([
+            ("success", True),
+            ("data", OrderedDict([
+                ("userID", user_id),
+                ("status", "success"),
+                ("data", store.recent(user_id))
+            ]))
+        ])
+        return _json_response(response_data)
+
+    except Exception as e:
+        return _error_response(e)
+
+# endpoint to get recommendation cache counters
+@api.route("/api/v1/cache", methods=["GET"])
+def cache_stats():
+    response_data = OrderedDict([
+        ("success", True),
+        ("data", _snapshot().cache.stats())
+    ])
+    return _json_response(response_data)
+
+# endpoint to list the attribute values recommendations can be filtered on
+@api.route("/api/v1/filters", methods=["GET"])
+def filter_values():
+    response_data = OrderedDict([
+        ("success", True),
+        ("data", _snapshot().filters.attributes())
+    ])
+    return _json_response(response_data)
 
 # endpoint to get optimal meal plan
-@app.route("/api/v1/dailyMeal", methods=["GET"])
+@api.route("/api/v1/dailyMeal", methods=["GET"])
 def optimal_meal():
     try:
-        daily_meal_plan = []
-        for meal_type, meal_category in meal_type_names.items():
-            top_meal = df[df['Meal Type'] == meal_type].nlargest(1, 'Nutrient_Density')
-            if not top_meal.empty:
-                meal = top_meal.iloc[0]
-                daily_meal_plan.append({
-                    "type": meal_category,
-                    "food": {
-                        "name": meal["name"],
-                        "calories": meal["calories"],
-                        "fat": meal["fat"],
-                        "carbo": meal["carbohydrate"],
-                        "nutrient_density": meal["Nutrient_Density"]
-                    }
-                })
         response_data = OrderedDict([
             ("success", True),
             ("data", OrderedDict([
                 ("date", datetime.datetime.now().strftime("%d-%m-%Y")),
                 ("status", "success"),
-                ("data", daily_meal_plan)
+                ("data", _snapshot().daily_meal_plan)
             ]))
         ])
-        return Response(json.dumps(response_data, indent=4, sort_keys=False), mimetype="application/json")
+        return _json_response(response_data)
+
+    except Exception as e:
+        return _error_response(e)
+
+# liveness: the process is up and serving requests
+@api.route("/healthz", methods=["GET"])
+def healthz():
+    return _json_response({"status": "ok"})
+
+# readiness: the catalog and scaler are loaded and requests can be answered
+@api.route("/readyz", methods=["GET"])
+def readyz():
+    ready = registry.current is not None
+    return _json_response({"status": "ready" if ready else "loading"}, status=200 if ready else 503)
+
+def _admin_denied():
+    # closed unless a token is configured, compared in constant time
+    if not config.ADMIN_TOKEN:
+        return _json_response({"success": False, "error": "Admin endpoints are disabled, set RECOMMENDER_ADMIN_TOKEN"},
+                              status=403)
+    token = request.headers.get("X-Admin-Token", "")
+    if not hmac.compare_digest(token.encode("utf-8"), config.ADMIN_TOKEN.encode("utf-8")):
+        return _json_response({"success": False, "error": "Invalid admin token"}, status=403)
+    return None
+
+# endpoint to reload the dataset and scaler without a restart
+@api.route("/api/v1/admin/reload", methods=["POST"])
+def reload_catalog():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    try:
+        if request.args.get("wait", "").lower() in ("1", "true", "yes"):
+            registry.reload()
+            status = 200
+        else:
+            status = 202 if registry.reload_in_background() else 409
+        return _json_response(OrderedDict([("success", status != 409), ("data", registry.status())]), status=status)
+
+    except Exception as e:
+        return _error_response(e, status=500)
+
+# endpoint to get the catalog version being served
+@api.route("/api/v1/admin/catalog", methods=["GET"])
+def catalog_status():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    return _json_response(OrderedDict([("success", True), ("data", registry.status())]))
+
+def _edit_catalog(entry):
+    denied = _admin_denied()
+    if denied:
+        return denied
+    try:
+        registry.edit(entry)
+        return _json_response(OrderedDict([("success", True), ("data", registry.status())]))
+
+    except ValueError as e:
+        return _error_response(e, status=400)
+    except Exception as e:
+        return _error_response(e, status=500)
+
+# endpoint to add foods or replace the foods with the same names, without a reload
+@api.route("/api/v1/admin/foods", methods=["POST"])
+def upsert_foods():
+    data = request.get_json(silent=True)
+    return _edit_catalog({"op": "upsert", "foods": data.get("foods") if isinstance(data, dict) else None})
+
+# endpoint to remove foods by name, without a reload
+@api.route("/api/v1/admin/foods", methods=["DELETE"])
+def delete_foods():
+    data = request.get_json(silent=True)
+    return _edit_catalog({"op": "delete", "names": data.get("names") if isinstance(data, dict) else None})
+
+# endpoint to fold the edited foods into a freshly indexed catalog now
+@api.route("/api/v1/admin/compact", methods=["POST"])
+def compact_catalog():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    try:
+        if request.args.get("wait", "").lower() in ("1", "true", "yes"):
+            registry.compact()
+            status = 200
+        else:
+            status = 202 if registry.compact_in_background() else 409
+        return _json_response(OrderedDict([("success", status != 409), ("data", registry.status())]), status=status)
 
     except Exception as e:
-        error_response = {"success": False, "error": str(e)}
-        return Response(json.dumps(error_response, indent=4, sort_keys=False), mimetype="application/json")
+        return _error_response(e, status=500)
+
+# endpoint to get metrics in the Prometheus text format
+@api.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+# endpoints to capture a flame graph with the sampling profiler
+@api.route("/api/v1/admin/profile/start", methods=["POST"])
+def start_profiler():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    if not config.PROFILER_ENABLED:
+        return _error_response("Profiler is disabled, set RECOMMENDER_PROFILER=1", status=404)
+    started = profiler.start(float(request.args.get("interval", 0.005)))
+    return _json_response({"success": started, "data": {"running": profiler.running}}, status=200 if started else 409)
+
+@api.route("/api/v1/admin/profile/stop", methods=["POST"])
+def stop_profiler():
+    denied = _admin_denied()
+    if denied:
+        return denied
+    # folded stacks, feed to flamegraph.pl or speedscope
+    return Response(profiler.stop(), mimetype="text/plain")
+
+def load_catalog():
+    """Load the catalog and scaler into the registry.
+
+    The file watcher is started by the serving process, gunicorn's post_fork
+    in every worker or the development server below, never in a preloading
+    master whose locks the workers would inherit.
+    """
+    registry.reload()
+
+def create_app(load=True):
+    """Build the Flask app; the catalog is loaded once per process and shared by every app."""
+    if load and registry.current is None:
+        load_catalog()
+    app = Flask(__name__)
+    app.register_blueprint(api)
+    return app
+
+app = create_app()
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=4000, debug=True)
+    registry.start_watching(config.WATCH_INTERVAL)
+    app.run(host='0.0.0.0', port=config.PORT, debug=config.DEBUG)
\ No newline at end of file
@@ -0,0 +1,35 @@
+import gc
+import multiprocessing
+
+from recommender.config import MICROBATCH, MICROBATCH_MAX_SIZE, PORT, THREADS, WATCH_INTERVAL, WORKERS
+
+bind = f"0.0.0.0:{PORT}"
+workers = WORKERS or multiprocessing.cpu_count()
+# a micro-batch can only fill up with as many requests as a worker handles at once
+threads = max(THREADS, MICROBATCH_MAX_SIZE) if MICROBATCH else THREADS
+worker_class = "gthread"
+# load the catalog in the master before forking so workers share its pages; threads and database
+# connections do not survive the fork, so each worker starts its own: the catalog watcher in
+# post_fork, the micro-batcher and history writer lazily on first use
+preload_app = True
+accesslog = "-"
+
+
+def when_ready(server):
+    # keep the garbage collector from touching (and copying) the preloaded objects in workers
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # the watcher thread, see preload_app; the master never starts one
+    from deployment import registry
+
+    registry.start_watching(WATCH_INTERVAL)
+
+
+def worker_exit(server, worker):
+    # write the history events still queued in this worker
+    from deployment import history
+
+    if history is not None:
+        history.flush()
@@ -0,0 +1 @@
+from recommender.engine import RecommendationEngine, MEAL_TYPE_NAMES, NUMERIC_COLS
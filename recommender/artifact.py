@@ -0,0 +1,220 @@
+"""Versioned binary catalog artifact, memory-mapped at server startup.
+
+Layout of an artifact root::
+
+    <root>/current                  name of the active version
+    <root>/<version>/manifest.json  format, row count, columns, categories, scaler, nutrient ranges
+    <root>/<version>/features.npy   unit-normalized scaled features, float32
+    <root>/<version>/nutrients.npy  raw NUMERIC_COLS values, float64
+    <root>/<version>/meal_types.npy Meal Type codes, int64
+    <root>/<version>/names.npy      utf-8 bytes of every name, concatenated
+    <root>/<version>/name_offsets.npy  int64 offsets into names.npy, rows + 1
+    <root>/<version>/<column>.codes.npy  codes of each other text column
+
+Every ``.npy`` file is opened with ``mmap_mode='r'`` so worker processes share
+the same page cache instead of each holding a pandas copy. The manifest also
+holds the fitted min/max scaler parameters, so a server started from an
+artifact imports neither pandas nor scikit-learn nor joblib, and the raw ranges the
+nutrients were min-max scaled from when the builder knows them, which the meal
+planner needs to work in kcal and grams. Artifacts of an older ``FORMAT_VERSION`` are rejected rather than served
+without what the current format adds; rebuild them. Build one with::
+
+    python -m recommender.artifact --out Dataset/catalog
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from recommender import config
+from recommender.engine import MEAL_TYPE_NAMES, NUMERIC_COLS
+from recommender.index import unit_rows
+from recommender.scaling import LinearScaler
+
+# 2: the manifest carries the scaler and nutrient ranges
+FORMAT_VERSION = 2
+MANIFEST = 'manifest.json'
+CURRENT = 'current'
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def encode_strings(values):
+    """Pack strings into a ``(uint8 data, int64 offsets)`` string table."""
+    encoded = [str(value).encode('utf-8') for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in encoded], out=offsets[1:])
+    return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+class StringTable:
+    """Read-only sequence of strings over an offsets-encoded byte buffer."""
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return self.offsets.shape[0] - 1
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.data[start:end].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+def _atomic_write_text(path, text):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(text)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def _format_version(path):
+    try:
+        with open(os.path.join(path, MANIFEST)) as f:
+            return json.load(f).get('format_version')
+    except (OSError, ValueError):
+        return None
+
+
+def build_artifact(df, scaler, root, version=None, sources=None, nutrient_ranges=None):
+    """Write ``df`` scaled by ``scaler`` as a new version under ``root`` and make it current.
+
+    ``nutrient_ranges`` are the raw ``[minimum, maximum]`` of calories, fat,
+    proteins and carbohydrate that ``df`` was scaled from, if known.
+    """
+    text_cols = [col for col in df.columns if col not in NUMERIC_COLS + ['name', 'Meal Type']]
+    if version is None:
+        # the format is part of the version, so a rebuild in a new format never reuses an old directory
+        digest = hashlib.sha256(f'format {FORMAT_VERSION}\n'.encode('utf-8'))
+        digest.update(df.to_csv(index=False).encode('utf-8'))
+        digest.update(np.asarray(scaler.scale_).tobytes() + np.asarray(scaler.min_).tobytes())
+        if nutrient_ranges is not None:
+            digest.update(json.dumps(nutrient_ranges).encode('utf-8'))
+        version = digest.hexdigest()[:12]
+
+    os.makedirs(root, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=root, prefix='.build-')
+    os.chmod(staging, 0o755)
+    features = np.asfortranarray(unit_rows(scaler.transform(df[NUMERIC_COLS])).astype(np.float32))
+    np.save(os.path.join(staging, 'features.npy'), features)
+    np.save(os.path.join(staging, 'nutrients.npy'), df[NUMERIC_COLS].to_numpy(dtype=np.float64))
+    np.save(os.path.join(staging, 'meal_types.npy'), df['Meal Type'].to_numpy(dtype=np.int64))
+    names, offsets = encode_strings(df['name'])
+    np.save(os.path.join(staging, 'names.npy'), names)
+    np.save(os.path.join(staging, 'name_offsets.npy'), offsets)
+    categories = {}
+    for col in text_cols:
+        values = df[col].astype(str)
+        categories[col] = sorted(values.unique().tolist())
+        codes = np.searchsorted(np.array(categories[col], dtype=object), values.to_numpy(dtype=object))
+        np.save(os.path.join(staging, f'{col}.codes.npy'), codes.astype(np.int16))
+
+    manifest = {
+        'format_version': FORMAT_VERSION,
+        'version': version,
+        'rows': len(df),
+        'columns': list(df.columns),
+        'numeric_cols': NUMERIC_COLS,
+        'meal_type_names': {str(code): name for code, name in MEAL_TYPE_NAMES.items()},
+        'categories': categories,
+        'scaler': LinearScaler.from_fitted(scaler).to_dict(),
+        'nutrient_ranges': nutrient_ranges,
+        'sources': sources or {},
+    }
+    with open(os.path.join(staging, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    target = os.path.join(root, version)
+    if _format_version(target) == FORMAT_VERSION:
+        shutil.rmtree(staging)
+    else:
+        # missing, or an older format under an explicitly given version
+        shutil.rmtree(target, ignore_errors=True)
+        os.replace(staging, target)
+    _atomic_write_text(os.path.join(root, CURRENT), version + '\n')
+    return target
+
+
+class CatalogArtifact:
+    def __init__(self, path, mmap_mode='r'):
+        with open(os.path.join(path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest['format_version'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported catalog format {self.manifest['format_version']} in {path}, "
+                             f"expected {FORMAT_VERSION}: rebuild it with python -m recommender.artifact")
+        self.path = path
+        self.version = self.manifest['version']
+        self.meal_type_names = {int(code): name for code, name in self.manifest['meal_type_names'].items()}
+        self.scaler = LinearScaler.from_dict(self.manifest['scaler'])
+        self.nutrient_ranges = self.manifest.get('nutrient_ranges')
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+
+        self.features = load('features.npy')
+        self.nutrients = load('nutrients.npy')
+        self.meal_types = load('meal_types.npy')
+        self.names = StringTable(load('names.npy'), load('name_offsets.npy'))
+        self.codes = {col: load(f'{col}.codes.npy') for col in self.manifest['categories']}
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    def column(self, col):
+        """Values of a text column, decoded from its category codes."""
+        categories = np.array(self.manifest['categories'][col], dtype=object)
+        return categories[self.codes[col]]
+
+    def to_frame(self):
+        import pandas as pd
+
+        data = {'name': list(self.names), 'Meal Type': np.asarray(self.meal_types)}
+        data.update(zip(NUMERIC_COLS, np.asarray(self.nutrients).T))
+        data.update((col, self.column(col)) for col in self.codes)
+        return pd.DataFrame(data)[self.manifest['columns']]
+
+
+def resolve_version(root):
+    """Directory of the current version under ``root``, or ``root`` itself if it is one."""
+    if os.path.exists(os.path.join(root, MANIFEST)):
+        return root
+    with open(os.path.join(root, CURRENT)) as f:
+        return os.path.join(root, f.read().strip())
+
+
+def load_artifact(root, mmap_mode='r'):
+    return CatalogArtifact(resolve_version(root), mmap_mode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the binary serving catalog from the processed dataset.')
+    parser.add_argument('--dataset', default=config.DATASET_PATH)
+    parser.add_argument('--scaler', default=config.SCALER_PATH)
+    parser.add_argument('--out', default=config.CATALOG_PATH or 'Dataset/catalog')
+    args = parser.parse_args()
+
+    import joblib
+    import pandas as pd
+
+    sources = {args.dataset: file_digest(args.dataset), args.scaler: file_digest(args.scaler)}
+    path = build_artifact(pd.read_csv(args.dataset), joblib.load(args.scaler), args.out, sources=sources)
+    print(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Micro-batching of concurrent recommendation queries.
+
+Every request pays the fixed cost of its own NumPy calls (argument checks,
+temporaries, dispatch into BLAS) for one ``scaler.transform``, one
+matrix-vector product over the catalog and the per-meal-type top-k, which at
+high concurrency costs more than the arithmetic itself. With micro-batching on,
+request threads hand their raw query features to a :class:`MicroBatcher` and
+block on a future. A single batching thread takes the first queued query and
+keeps collecting until ``max_batch`` are queued or ``max_wait_us``
+microseconds have passed since it arrived; that wait is skipped while the
+previous batch held a single query, so a lone request is not delayed. Queries
+of the same snapshot are scaled with one ``transform`` and scored with one
+matrix multiply via :meth:`RecommendationEngine.recommend_batch`, and the
+results are fanned back out. The engine keeps single and batched queries on
+the same BLAS kernel, so the results do not depend on how requests were
+grouped.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from recommender.metrics import span
+
+
+class MicroBatcher:
+    def __init__(self, max_batch=64, max_wait_us=200):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_us / 1e6
+        self.batches = 0
+        self.queries = 0
+        self._concurrent = False
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _started(self):
+        # one thread per process, started after the fork (see gunicorn.conf.py)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._queue = queue.SimpleQueue()
+                    self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                    self._thread.start()
+                    self._pid = os.getpid()
+        return self._queue
+
+    def recommend(self, snapshot, features, k=5, mask=None, diversity=None):
+        """``snapshot.engine.recommend`` of one unscaled feature row, computed in a shared batch."""
+        future = Future()
+        self._started().put((snapshot, features, k, mask, diversity, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        # queries already queued are always taken, the window is only waited for under concurrency
+        deadline = time.perf_counter() + (self.max_wait if self._concurrent else 0)
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        self._concurrent = len(batch) > 1
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.batches += 1
+            self.queries += len(batch)
+            # a reload can swap the snapshot mid-batch, every snapshot is scored on its own
+            groups = {}
+            for item in batch:
+                groups.setdefault((item[0], item[2]), []).append(item)
+            for (snapshot, k), items in groups.items():
+                self._score(snapshot, k, items)
+
+    def _score(self, snapshot, k, items):
+        try:
+            with span("scale"):
+                queries = snapshot.scaler.transform(np.array([item[1] for item in items], dtype=np.float64))
+            masks = [item[3] for item in items]
+            results = snapshot.engine.recommend_batch(queries, k, None if all(m is None for m in masks) else masks,
+                                                      [item[4] for item in items])
+        except Exception as e:
+            for item in items:
+                item[5].set_exception(e)
+            return
+        for item, result in zip(items, results):
+            item[5].set_result(result)
+
+    def stats(self):
+        return {"batches": self.batches, "queries": self.queries}
@@ -0,0 +1,78 @@
+"""Bounded in-process LRU cache with per-entry TTL for computed responses."""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def quantize(values, grid):
+    """Snap ``values`` to multiples of ``grid``; returns ``(key, snapped values)``.
+
+    A grid of 0 keeps the inputs as they are, so only identical inputs share a key.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if grid <= 0:
+        return tuple(values.tolist()), values
+    steps = np.round(values / grid).astype(np.int64)
+    return tuple(steps.tolist()), steps * grid
+
+
+class LRUCache:
+    def __init__(self, maxsize=4096, ttl=300.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if self.ttl <= 0 or self.clock() < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (value, self.clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,106 @@
+"""Serving settings, overridable through environment variables."""
+import os
+
+
+def _flag(value):
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name)
+    return default if value in (None, '') else cast(value)
+
+
+PORT = _env('PORT', 4000, int)
+DEBUG = _env('RECOMMENDER_DEBUG', False, _flag)
+# gunicorn pre-fork workers (0: one per CPU) and threads per worker
+WORKERS = _env('RECOMMENDER_WORKERS', 0, int)
+THREADS = _env('RECOMMENDER_THREADS', 4, int)
+
+DATASET_PATH = _env('RECOMMENDER_DATASET', 'Dataset/processed_dataset.csv')
+SCALER_PATH = _env('RECOMMENDER_SCALER', 'scaler.pkl')
+# binary catalog built by ``python -m recommender.artifact``, used instead of the CSV when set; it
+# carries its scaler, so serving from it imports neither pandas nor scikit-learn
+CATALOG_PATH = _env('RECOMMENDER_CATALOG', '')
+
+# seconds between checks of the dataset/scaler files for changes, 0 disables watching
+WATCH_INTERVAL = _env('RECOMMENDER_WATCH_INTERVAL', 0.0, float)
+# shared secret for the admin endpoints (X-Admin-Token header), empty disables them
+ADMIN_TOKEN = _env('RECOMMENDER_ADMIN_TOKEN', '')
+
+# JSON-lines journal of food upserts and deletes, replayed on every load and tailed by the file
+# watcher so all workers apply the same edits; empty keeps edits in memory only
+EDIT_LOG = _env('RECOMMENDER_EDIT_LOG', '')
+# buffered plus deleted rows that trigger a compaction, and seconds after an edit before one runs anyway
+COMPACT_ROWS = _env('RECOMMENDER_COMPACT_ROWS', 1024, int)
+COMPACT_INTERVAL = _env('RECOMMENDER_COMPACT_INTERVAL', 300.0, float)
+
+# per-user history of served and eaten foods (SQLite database, empty disables it): days a food stays
+# out of a user's recommendations, days rows are kept, hot users held in memory and seconds before
+# their entry is reread, and the write-behind flush interval in seconds and rows per transaction
+HISTORY_PATH = _env('RECOMMENDER_HISTORY', '')
+HISTORY_WINDOW_DAYS = _env('RECOMMENDER_HISTORY_WINDOW_DAYS', 3, int)
+HISTORY_RETENTION_DAYS = _env('RECOMMENDER_HISTORY_RETENTION_DAYS', 90, int)
+HISTORY_CACHE_SIZE = _env('RECOMMENDER_HISTORY_CACHE_SIZE', 10000, int)
+HISTORY_CACHE_TTL = _env('RECOMMENDER_HISTORY_CACHE_TTL', 60.0, float)
+HISTORY_FLUSH_INTERVAL = _env('RECOMMENDER_HISTORY_FLUSH_INTERVAL', 0.5, float)
+HISTORY_FLUSH_ROWS = _env('RECOMMENDER_HISTORY_FLUSH_ROWS', 512, int)
+
+# allow starting the sampling profiler through the admin endpoints (staging only)
+PROFILER_ENABLED = _env('RECOMMENDER_PROFILER', False, _flag)
+
+# similarity index: "exact" brute force or "ivf" approximate search
+INDEX_BACKEND = _env('RECOMMENDER_INDEX', 'exact')
+# inverted lists per meal type, 0 picks roughly sqrt(rows) lists
+IVF_LISTS = _env('RECOMMENDER_IVF_LISTS', 0, int)
+IVF_PROBES = _env('RECOMMENDER_IVF_PROBES', 4, int)
+
+# queries scored per matrix multiply in batch requests
+BATCH_CHUNK_SIZE = _env('RECOMMENDER_BATCH_CHUNK_SIZE', 256, int)
+
+# coalesce concurrent /recommendations queries into one scoring call, at most MICROBATCH_MAX_SIZE
+# queries waiting at most MICROBATCH_MAX_WAIT_US microseconds for the batch to fill
+MICROBATCH = _env('RECOMMENDER_MICROBATCH', False, _flag)
+MICROBATCH_MAX_SIZE = _env('RECOMMENDER_MICROBATCH_MAX_SIZE', 64, int)
+MICROBATCH_MAX_WAIT_US = _env('RECOMMENDER_MICROBATCH_MAX_WAIT_US', 200.0, float)
+
+# diversity re-ranking of /recommendations: default MMR lambda (1 keeps the plain ranking) and
+# candidates per meal type, and the largest candidate pool a request may ask for
+MMR_LAMBDA = _env('RECOMMENDER_MMR_LAMBDA', 0.7, float)
+MMR_POOL = _env('RECOMMENDER_MMR_POOL', 25, int)
+MMR_MAX_POOL = _env('RECOMMENDER_MMR_MAX_POOL', 200, int)
+
+# neighbours kept per food and meal type, and the memory budget of the graph builder
+NEIGHBOURS_K = _env('RECOMMENDER_NEIGHBOURS_K', 10, int)
+NEIGHBOURS_MEMORY_MB = _env('RECOMMENDER_NEIGHBOURS_MEMORY_MB', 64, int)
+
+# micronutrient mode: comma-separated vitamin-rich source CSVs, projection ("none", "pca" or "random"),
+# projected dimensions and rows per meal type rescored exactly after the projected pass
+MICRO_SOURCES = _env('RECOMMENDER_MICRO_SOURCES', 'Dataset/drink-nutrition.csv,Dataset/fruit-nutrition.csv,'
+                     'Dataset/snack-nutrition.csv,Dataset/ingridient-nutrition.csv')
+MICRO_PROJECTION = _env('RECOMMENDER_MICRO_PROJECTION', 'pca')
+MICRO_COMPONENTS = _env('RECOMMENDER_MICRO_COMPONENTS', 16, int)
+MICRO_RERANK = _env('RECOMMENDER_MICRO_RERANK', 256, int)
+
+# meal planner: default and maximum search time, candidates per meal type, days and items per meal type
+PLANNER_TIME_BUDGET_MS = _env('RECOMMENDER_PLANNER_TIME_BUDGET_MS', 30.0, float)
+PLANNER_MAX_TIME_BUDGET_MS = _env('RECOMMENDER_PLANNER_MAX_TIME_BUDGET_MS', 200.0, float)
+PLANNER_CANDIDATES = _env('RECOMMENDER_PLANNER_CANDIDATES', 256, int)
+PLANNER_MAX_DAYS = _env('RECOMMENDER_PLANNER_MAX_DAYS', 14, int)
+PLANNER_MAX_ITEMS = _env('RECOMMENDER_PLANNER_MAX_ITEMS', 5, int)
+# raw "min:max" of calories, fat, proteins and carbohydrate the catalog was min-max scaled from, those of
+# food-nutrition.csv by default; catalog artifacts built by the pipeline carry their own
+NUTRIENT_RANGES = _env('RECOMMENDER_NUTRIENT_RANGES', [[0.0, 1010.0], [0.0, 100.0], [0.0, 175.0], [0.0, 647.0]],
+                       lambda value: [[float(bound) for bound in pair.split(':')] for pair in value.split(',')])
+
+# recommendation cache: entries, lifetime in seconds and input quantization step; the step is opt-in,
+# inputs snapped to it are scored as snapped and can rank differently (see benchmarks/evaluate.py)
+CACHE_SIZE = _env('RECOMMENDER_CACHE_SIZE', 4096, int)
+CACHE_TTL = _env('RECOMMENDER_CACHE_TTL', 300.0, float)
+CACHE_GRID = _env('RECOMMENDER_CACHE_GRID', 0.0, float)
+
+
+def index_options():
+    if INDEX_BACKEND == 'ivf':
+        return {'index': 'ivf', 'lists': IVF_LISTS, 'probes': IVF_PROBES}
+    return {'index': INDEX_BACKEND, 'chunk_size': BATCH_CHUNK_SIZE}
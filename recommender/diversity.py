@@ -0,0 +1,86 @@
+"""Maximal marginal relevance (MMR) re-ranking of recommendation candidates.
+
+The plain top ``k`` of a meal type are the foods closest to the query, which
+are often near-duplicates of each other. MMR takes a larger pool of the best
+candidates and picks ``k`` of them greedily, each time the food maximising::
+
+    lambda * similarity(query, food) - (1 - lambda) * max similarity(food, picked)
+
+so ``lambda=1`` keeps the plain ranking and lower values trade relevance for
+variety. Every pool of a request (each meal type of each query) is padded into
+one array: the pairwise similarities are a single batched matrix multiply and
+the ``k`` greedy steps update all pools at once.
+"""
+import numpy as np
+
+from recommender.metrics import span
+
+
+def mmr(relevance, similarity, sizes, k, lambdas):
+    """Positions greedily picked from padded pools, shape (pools, min(k, width)).
+
+    ``relevance`` is (pools, width) and ``similarity`` (pools, width, width);
+    only the first ``sizes[i]`` entries of pool ``i`` are candidates, so only
+    its first ``min(k, sizes[i])`` picks are meaningful.
+    """
+    pools, width = relevance.shape
+    lambdas = np.asarray(lambdas, dtype=relevance.dtype)[:, None]
+    # padding and picked candidates drop out through a -inf relevance term
+    weighted = lambdas * relevance
+    weighted[np.arange(width) >= np.asarray(sizes)[:, None]] = -np.inf
+    penalty = 1 - lambdas
+    redundancy = np.zeros_like(relevance)
+    picks = np.empty((pools, min(k, width)), dtype=np.intp)
+    every = np.arange(pools)
+    for step in range(picks.shape[1]):
+        # ties go to the earliest, i.e. most relevant, candidate
+        best = np.argmax(weighted - penalty * redundancy, axis=1)
+        picks[:, step] = best
+        weighted[every, best] = -np.inf
+        np.maximum(redundancy, similarity[every, best], out=redundancy)
+    return picks
+
+
+def rerank(pools, queries, vectors, k, lambdas):
+    """MMR top ``k`` of every pool of catalog rows, scored against the matching unit ``queries`` row.
+
+    ``vectors(rows)`` returns the unit feature rows of catalog rows.
+    """
+    sizes = np.array([len(rows) for rows in pools], dtype=np.intp)
+    width = int(sizes.max(initial=0))
+    valid = np.arange(width) < sizes[:, None]
+    padded = np.zeros((len(pools), width, queries.shape[1]), dtype=np.float32)
+    if width:
+        padded[valid] = vectors(np.concatenate(pools))
+    relevance = np.matmul(padded, queries[:, :, None])[:, :, 0]
+    similarity = np.matmul(padded, padded.transpose(0, 2, 1))
+    picks = mmr(relevance, similarity, sizes, k, lambdas)
+    return [rows[picks[i, :min(k, len(rows))]] for i, rows in enumerate(pools)]
+
+
+def diverse_search(search, vectors, queries, k=5, masks=None, diversity=None):
+    """``search(queries, k, masks)`` with optional per-query ``(lambda, pool)`` MMR settings.
+
+    Queries whose setting is None keep the plain top ``k``; the others are
+    searched with their pool size and re-ranked.
+    """
+    settings = [setting for setting in diversity or () if setting is not None]
+    if not settings:
+        return search(queries, k, masks)
+    results = search(queries, max(k, *(pool for _, pool in settings)), masks)
+    pools, owners, lambdas = [], [], []
+    for i, (result, setting) in enumerate(zip(results, diversity)):
+        if setting is None:
+            results[i] = [(meal_type, rows[:k]) for meal_type, rows in result]
+            continue
+        lambda_, pool = setting
+        for meal_type, rows in result:
+            pools.append(rows[:pool])
+            owners.append(i)
+            lambdas.append(lambda_)
+    with span('diversify'):
+        reranked = iter(rerank(pools, queries[owners], vectors, k, lambdas))
+    for i, (result, setting) in enumerate(zip(results, diversity)):
+        if setting is not None:
+            results[i] = [(meal_type, next(reranked)) for meal_type, _ in result]
+    return results
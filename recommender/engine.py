@@ -0,0 +1,78 @@
+"""Immutable in-memory engine over the scaled food catalog.
+
+The catalog is loaded once into a contiguous float32 matrix whose rows are
+normalized to unit length, so cosine similarity against a query is a single
+matrix-vector product. Row positions per meal type are precomputed, and the
+top results per meal type come from ``argpartition`` instead of a full sort.
+Searching is delegated to a pluggable backend from :mod:`recommender.index`,
+optionally followed by a diversity re-ranking from :mod:`recommender.diversity`.
+"""
+import numpy as np
+
+from recommender.diversity import diverse_search
+from recommender.index import build_index, unit_rows
+
+NUMERIC_COLS = ['calories', 'fat', 'proteins', 'carbohydrate', 'Nutrient_Density']
+MEAL_TYPE_NAMES = {0: 'Breakfast', 1: 'Carbs', 2: 'Drink', 3: 'Lunch_Dinner', 4: 'Snack'}
+
+
+def nutrient_density(calories, fat, proteins, carbohydrate):
+    return (proteins + carbohydrate - fat) / (calories + 1e-6)
+
+
+def _frozen(array, order='C'):
+    array = np.require(array, requirements=[order])
+    array.flags.writeable = False
+    return array
+
+
+class RecommendationEngine:
+    def __init__(self, features, meal_types, meal_type_names=MEAL_TYPE_NAMES, index='exact',
+                 normalized=False, **index_options):
+        if not normalized:
+            features = unit_rows(features).astype(np.float32)
+        # column-major, so ``features.T`` is a C-contiguous operand and a single
+        # query and a batch go through the same BLAS kernel with identical results
+        self.features = _frozen(features, order='F')
+        self.meal_types = _frozen(np.asarray(meal_types, dtype=np.int64))
+        self.meal_type_names = dict(meal_type_names)
+        self.meal_indices = {
+            meal_type: _frozen(np.flatnonzero(self.meal_types == meal_type))
+            for meal_type in self.meal_type_names
+        }
+        self.index = build_index(index, self.features, self.meal_indices, **index_options)
+
+    @classmethod
+    def from_frame(cls, df, scaler, meal_type_names=MEAL_TYPE_NAMES, **options):
+        return cls(scaler.transform(df[NUMERIC_COLS]), df['Meal Type'].to_numpy(), meal_type_names, **options)
+
+    @classmethod
+    def from_artifact(cls, artifact, **options):
+        """Serve straight from the memory-mapped matrix of a :class:`~recommender.artifact.CatalogArtifact`."""
+        return cls(artifact.features, artifact.meal_types, artifact.meal_type_names, normalized=True, **options)
+
+    def __len__(self):
+        return self.features.shape[0]
+
+    def scores(self, queries_scaled):
+        """Cosine similarity of scaled queries against every catalog row, shape (queries, foods)."""
+        queries = unit_rows(np.atleast_2d(queries_scaled)).astype(np.float32)
+        return queries @ self.features.T
+
+    def vectors(self, rows):
+        return self.features[rows]
+
+    def recommend(self, query_scaled, k=5, mask=None, diversity=None):
+        """Return ``[(meal_type, row_indices), ...]`` with the best ``k`` rows per meal type.
+
+        Only rows set in the boolean ``mask`` are considered when one is given.
+        A ``(lambda, pool)`` ``diversity`` re-ranks the best ``pool`` rows with MMR.
+        """
+        return self.recommend_batch(np.atleast_2d(query_scaled)[:1], k, None if mask is None else [mask],
+                                    None if diversity is None else [diversity])[0]
+
+    def recommend_batch(self, queries_scaled, k=5, masks=None, diversity=None):
+        """Per-query results of :meth:`recommend` for a stack of scaled queries and optional per-query
+        masks and diversity settings."""
+        queries = unit_rows(np.atleast_2d(queries_scaled)).astype(np.float32)
+        return diverse_search(self.index.search, self.vectors, queries, k, masks, diversity)
@@ -0,0 +1,110 @@
+"""Bitmap indexes over the catalog's text attributes for request-level filters.
+
+Every value of every text attribute (``Carb_Level``, ``Protein_Level``,
+``Diet_Category`` when the dataset has it, ...) gets a bitset with one bit per
+catalog row, packed eight rows to a byte. A filter ORs the bitsets of the
+values it accepts within an attribute and ANDs the attributes together, so
+combining filters costs a few byte-wise operations over ``rows / 8`` bytes.
+Nutrient bounds are in kcal and grams, like the meal planner's targets: each
+is mapped into the catalog's min-max scaled units through the raw ``ranges``
+of its column and compared against that column in one vectorized step
+(``nutrient_density`` bounds are on the catalog's own density score).
+Excluded foods clear the bits of their rows.
+
+Filters arrive as a JSON object keyed by the lower-cased column name::
+
+    {"carb_level": "Low-Carb", "diet_category": ["Keto-Friendly", "Low-Fat"],
+     "max_calories": 250, "min_proteins": 10, "exclude": ["Nasi Goreng"]}
+"""
+import numpy as np
+
+from recommender.engine import NUMERIC_COLS
+
+_NUTRIENT_KEYS = {'calories': 'calories', 'fat': 'fat', 'proteins': 'proteins', 'carbo': 'carbohydrate',
+                  'carbohydrate': 'carbohydrate', 'nutrient_density': 'Nutrient_Density'}
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple)) else [value]
+
+
+def filter_key(filters):
+    """Canonical, hashable form of ``filters`` for cache keys."""
+    if not filters:
+        return ()
+    return tuple(sorted((key, tuple(sorted(map(str, _as_list(value))))) for key, value in filters.items()))
+
+
+class FilterIndex:
+    def __init__(self, columns, ranges=None):
+        self.size = len(columns)
+        self.nutrients = columns.nutrients
+        # raw (minimum, maximum) of calories, fat, proteins and carbohydrate, None when bounds are already scaled
+        self.ranges = None if ranges is None else np.asarray(ranges, dtype=np.float64)
+        # attribute -> value -> packed bitset of the rows having that value
+        self.bitsets = {}
+        for col, (codes, categories) in columns.attributes.items():
+            codes = np.asarray(codes)
+            self.bitsets[col.lower()] = {
+                value: np.packbits(codes == code) for code, value in enumerate(categories)
+            }
+        self.name_rows = {}
+        for row, name in enumerate(columns.names):
+            self.name_rows.setdefault(name, []).append(row)
+
+    def attributes(self):
+        return {attribute: sorted(values) for attribute, values in self.bitsets.items()}
+
+    def _bounds(self, key):
+        for prefix, compare in (('max_', np.less_equal), ('min_', np.greater_equal)):
+            if key.startswith(prefix) and key[len(prefix):] in _NUTRIENT_KEYS:
+                return NUMERIC_COLS.index(_NUTRIENT_KEYS[key[len(prefix):]]), compare
+        return None
+
+    def _scaled(self, col, limit):
+        if self.ranges is None or col >= len(self.ranges):
+            return limit
+        low, high = self.ranges[col]
+        return (limit - low) / (high - low) if high > low else limit - low
+
+    def mask(self, filters, strict=True):
+        """Boolean row mask of the foods passing every filter, None when there are none.
+
+        Unknown attribute values raise, unless ``strict`` is off and they just match no row.
+        """
+        if not filters:
+            return None
+        if not isinstance(filters, dict):
+            raise ValueError("filters must be a JSON object")
+        bits = np.full((self.size + 7) // 8, 0xFF, dtype=np.uint8)
+        bounds = []
+        excluded = []
+        for key, value in filters.items():
+            if key == 'exclude':
+                excluded.extend(_as_list(value))
+            elif key in self.bitsets:
+                values = self.bitsets[key]
+                accepted = np.zeros_like(bits)
+                for item in _as_list(value):
+                    if item not in values:
+                        if not strict:
+                            continue
+                        raise ValueError(f"Unknown {key} {item!r}, expected one of {sorted(values)}")
+                    np.bitwise_or(accepted, values[item], out=accepted)
+                np.bitwise_and(bits, accepted, out=bits)
+            elif self._bounds(key):
+                col, compare = self._bounds(key)
+                bounds.append((col, compare, self._scaled(col, float(value))))
+            else:
+                raise ValueError(f"Unknown filter {key!r}, expected one of {sorted(self._keys())}")
+        mask = np.unpackbits(bits, count=self.size).view(bool)
+        for col, compare, limit in bounds:
+            mask &= compare(self.nutrients[:, col], limit)
+        for name in excluded:
+            mask[self.name_rows.get(name, [])] = False
+        return mask
+
+    def _keys(self):
+        return list(self.bitsets) + ['exclude'] + [
+            prefix + key for prefix in ('max_', 'min_') for key in _NUTRIENT_KEYS
+        ]
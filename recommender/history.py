@@ -0,0 +1,217 @@
+"""Per-user history of served and eaten foods, used to vary recommendations.
+
+History is kept in a local SQLite database, by food name so it survives
+catalog reloads and edits. A food is left out of a user's recommendations
+when they ate it in the last ``window_days`` days, or when it was served to
+them on one of those days before today (so repeated requests on the same day
+stay stable).
+
+Requests never wait on the database for writes: events go to a queue that a
+background thread inserts in batches. Hot users stay in an in-memory LRU with
+their recent events and a bitset over the catalog rows (``np.packbits``, one
+bit per row) per catalog version and day. A request unpacks that bitset into
+the boolean mask the engine applies before top-k. Events recorded through a
+worker update its LRU entry in place; entries expire after ``cache_ttl``
+seconds so the other workers pick up those events from the database.
+"""
+import atexit
+import datetime
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from recommender.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+EVENTS = ('served', 'eaten')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    user_id TEXT NOT NULL,
+    food TEXT NOT NULL,
+    event TEXT NOT NULL,
+    day INTEGER NOT NULL,
+    at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_user_day ON history (user_id, day);
+"""
+
+
+def _today():
+    return datetime.date.today().toordinal()
+
+
+class UserHistory:
+    """Latest day every food was served to and eaten by one user, within the window."""
+
+    def __init__(self, days=None):
+        self.days = {event: {} for event in EVENTS}
+        for food, event, day in days or ():
+            self.days[event][food] = max(day, self.days[event].get(food, day))
+        # bumped by every event that changes today's exclusions
+        self.generation = 0
+        self.bits = None
+
+    def add(self, foods, event, day):
+        latest = self.days[event]
+        for food in foods:
+            latest[food] = day
+        if event == 'eaten':
+            self.generation += 1
+
+    def excluded(self, today, window_days):
+        first = today - window_days
+        # list() copies in one step, request threads may be adding events
+        foods = {food for food, day in list(self.days['eaten'].items()) if day > first}
+        foods.update(food for food, day in list(self.days['served'].items()) if first < day < today)
+        return foods
+
+
+class HistoryStore:
+    def __init__(self, path, window_days=3, retention_days=90, cache_size=10000, cache_ttl=60.0,
+                 flush_interval=0.5, flush_rows=512):
+        self.path = path
+        self.window_days = window_days
+        self.retention_days = retention_days
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.users = LRUCache(cache_size, cache_ttl)
+        self.written = 0
+        self._pid = None
+        self._conn = None
+        self._queue = None
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        # held by the writer while it has a batch in hand
+        self._writing = threading.Lock()
+        self._pruned = None
+
+    def _started(self):
+        # one connection and writer per process, opened after the fork (see gunicorn.conf.py)
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                                 isolation_level=None)
+                    # WAL lets the workers read while one of them writes
+                    self._conn.execute("PRAGMA journal_mode=WAL")
+                    self._conn.execute("PRAGMA synchronous=NORMAL")
+                    self._conn.executescript(_SCHEMA)
+                    self._queue = queue.SimpleQueue()
+                    threading.Thread(target=self._write_behind, name="history-writer", daemon=True).start()
+                    atexit.register(self.flush)
+                    self._pid = os.getpid()
+        return self._conn
+
+    def _load(self, user_id):
+        conn = self._started()
+        with self._db_lock:
+            days = conn.execute(
+                "SELECT food, event, MAX(day) FROM history WHERE user_id = ? AND day >= ? GROUP BY food, event",
+                (str(user_id), _today() - self.window_days)).fetchall()
+        return UserHistory(days)
+
+    def user(self, user_id):
+        history = self.users.get(str(user_id))
+        if history is None:
+            history = self._load(user_id)
+            self.users.put(str(user_id), history)
+        return history
+
+    def mask(self, snapshot, user_id):
+        """Boolean mask of the rows of ``snapshot`` the user may be recommended, None when all of them."""
+        history = self.user(user_id)
+        today = _today()
+        key = (snapshot.version, today, history.generation)
+        bits = history.bits
+        if bits is None or bits[0] != key:
+            # a name may be on several rows, every one of them is excluded
+            rows = [row for food in history.excluded(today, self.window_days) for row in snapshot.rows_named(food)]
+            packed = None
+            if rows:
+                excluded = np.zeros(len(snapshot.columns), dtype=bool)
+                excluded[rows] = True
+                packed = np.packbits(excluded)
+            bits = history.bits = (key, packed)
+        if bits[1] is None:
+            return None
+        return ~np.unpackbits(bits[1], count=len(snapshot.columns)).view(bool)
+
+    def record(self, user_id, foods, event='served'):
+        """Queue ``event`` for every food name; a loaded user entry sees it right away."""
+        if event not in EVENTS:
+            raise ValueError(f"event must be one of {', '.join(EVENTS)}")
+        now, today = time.time(), _today()
+        history = self.users.get(str(user_id))
+        if history is not None:
+            history.add(foods, event, today)
+        self._started()
+        for food in foods:
+            self._queue.put((str(user_id), food, event, today, now))
+
+    def recent(self, user_id):
+        """``{"served": {food: date}, "eaten": {food: date}}`` of the user within the window."""
+        history = self.user(user_id)
+        return {
+            event: {
+                food: datetime.date.fromordinal(day).strftime("%d-%m-%Y") for food, day in sorted(list(days.items()))
+            }
+            for event, days in history.days.items()
+        }
+
+    def _insert(self, rows):
+        with self._db_lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany("INSERT INTO history VALUES (?, ?, ?, ?, ?)", rows)
+                today = _today()
+                if self._pruned != today:
+                    self._conn.execute("DELETE FROM history WHERE day < ?", (today - self.retention_days,))
+                    self._pruned = today
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.written += len(rows)
+
+    def _write_behind(self):
+        while True:
+            rows = [self._queue.get()]
+            with self._writing:
+                # keep collecting for one interval so a burst of events becomes a single transaction
+                deadline = time.perf_counter() + self.flush_interval
+                while len(rows) < self.flush_rows:
+                    timeout = deadline - time.perf_counter()
+                    try:
+                        rows.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                try:
+                    self._insert(rows)
+                except sqlite3.Error:
+                    # history is best effort, a failed batch is dropped rather than piling up
+                    logger.exception("Dropped %d history events", len(rows))
+
+    def flush(self):
+        """Write every queued event now, e.g. before the process exits."""
+        if self._pid != os.getpid():
+            return
+        with self._writing:
+            rows = []
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if rows:
+                self._insert(rows)
+
+    def stats(self):
+        return {"pending": self._queue.qsize() if self._pid == os.getpid() else 0, "written": self.written,
+                **{f"users_{stat}": value for stat, value in self.users.stats().items()}}
@@ -0,0 +1,169 @@
+"""Similarity index backends over the unit-normalized catalog matrix.
+
+Every backend answers the same question as the engine: for each query, the
+best ``k`` catalog rows of every meal type, best first. ``exact`` scores the
+whole catalog; ``ivf`` clusters each meal type with spherical k-means and only
+scores the rows of the ``probes`` clusters closest to the query.
+
+``search`` optionally takes one boolean row mask per query (or None); masked
+out rows are dropped before top-k selection.
+"""
+import numpy as np
+
+from recommender.metrics import span
+
+
+def unit_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _allowed(rows, mask):
+    return rows if mask is None else rows[mask[rows]]
+
+
+def top_k(scores, k):
+    """Positions of the ``k`` highest scores, best first.
+
+    Equal scores keep their original order, matching a stable descending sort.
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k < n:
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        # keep every row tied with the k-th score so the earliest ones win
+        candidates = np.flatnonzero(scores >= kth)
+    else:
+        candidates = np.arange(n)
+    return candidates[np.lexsort((candidates, -scores[candidates]))][:k]
+
+
+class BruteForceIndex:
+    name = 'exact'
+
+    def __init__(self, features, meal_indices, chunk_size=256):
+        self.features = features
+        self.meal_indices = meal_indices
+        self.chunk_size = chunk_size
+
+    def search(self, queries, k=5, masks=None):
+        """Results for unit-length float32 ``queries``, one (chunk x foods) multiply per chunk."""
+        results = []
+        for start in range(0, queries.shape[0], self.chunk_size):
+            with span('similarity'):
+                block = queries[start:start + self.chunk_size] @ self.features.T
+            with span('select'):
+                for i, sims in enumerate(block, start):
+                    mask = None if masks is None else masks[i]
+                    result = []
+                    for meal_type, rows in self.meal_indices.items():
+                        rows = _allowed(rows, mask)
+                        result.append((meal_type, rows[top_k(sims[rows], k)]))
+                    results.append(result)
+        return results
+
+
+def _assign(points, centroids, chunk_size=65536):
+    assignment = np.empty(points.shape[0], dtype=np.intp)
+    for start in range(0, points.shape[0], chunk_size):
+        block = points[start:start + chunk_size] @ centroids.T
+        assignment[start:start + chunk_size] = np.argmax(block, axis=1)
+    return assignment
+
+
+def spherical_kmeans(points, n_clusters, n_iter=10, sample_size=None, seed=0):
+    """Cluster unit-length rows by cosine similarity, returns (centroids, assignment)."""
+    rng = np.random.default_rng(seed)
+    n_clusters = min(n_clusters, points.shape[0])
+    train = points
+    if sample_size and points.shape[0] > sample_size:
+        train = points[rng.choice(points.shape[0], sample_size, replace=False)]
+    centroids = train[rng.choice(train.shape[0], n_clusters, replace=False)]
+    for _ in range(n_iter):
+        assignment = _assign(train, centroids)
+        sums = np.stack([
+            np.bincount(assignment, weights=train[:, dim], minlength=n_clusters)
+            for dim in range(train.shape[1])
+        ], axis=1)
+        # empty clusters keep their previous centroid
+        empty = np.bincount(assignment, minlength=n_clusters) == 0
+        sums[empty] = centroids[empty]
+        centroids = unit_rows(sums).astype(np.float32)
+    return centroids, _assign(points, centroids)
+
+
+class _InvertedLists:
+    def __init__(self, rows, features, n_lists, seed):
+        self.centroids, assignment = spherical_kmeans(
+            features[rows], n_lists, sample_size=n_lists * 64, seed=seed
+        )
+        order = np.argsort(assignment, kind='stable')
+        self.rows = rows[order]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=len(self.centroids)))))
+
+    def candidates(self, centroid_sims, probes):
+        lists = top_k(centroid_sims, probes)
+        rows = np.concatenate([self.rows[self.offsets[i]:self.offsets[i + 1]] for i in lists])
+        # catalog order keeps tie-breaking identical to the exact backend
+        return np.sort(rows)
+
+
+class IVFIndex:
+    """Inverted-file index partitioned by meal type."""
+
+    name = 'ivf'
+
+    def __init__(self, features, meal_indices, lists=0, probes=4, seed=0):
+        self.features = features
+        self.meal_indices = meal_indices
+        self.probes = probes
+        self.meal_lists = {}
+        for meal_type, rows in meal_indices.items():
+            if len(rows) == 0:
+                continue
+            n_lists = lists or max(1, int(np.sqrt(len(rows))))
+            self.meal_lists[meal_type] = _InvertedLists(rows, features, n_lists, seed)
+        self.meal_types = list(meal_indices)
+
+    def search(self, queries, k=5, masks=None):
+        with span('similarity'):
+            centroid_sims = {
+                meal_type: queries @ lists.centroids.T
+                for meal_type, lists in self.meal_lists.items()
+            }
+        with span('select'):
+            return self._probe(queries, centroid_sims, k, masks)
+
+    def _probe(self, queries, centroid_sims, k, masks):
+        results = []
+        for i, query in enumerate(queries):
+            mask = None if masks is None else masks[i]
+            result = []
+            for meal_type in self.meal_types:
+                lists = self.meal_lists.get(meal_type)
+                if lists is None:
+                    result.append((meal_type, np.empty(0, dtype=np.intp)))
+                    continue
+                rows = _allowed(lists.candidates(centroid_sims[meal_type][i], self.probes), mask)
+                if mask is not None and len(rows) < k:
+                    # a narrow filter can empty the probed lists, score every allowed row instead
+                    rows = _allowed(self.meal_indices[meal_type], mask)
+                sims = self.features[rows] @ query
+                result.append((meal_type, rows[top_k(sims, k)]))
+            results.append(result)
+        return results
+
+
+INDEX_BACKENDS = {
+    BruteForceIndex.name: BruteForceIndex,
+    IVFIndex.name: IVFIndex,
+}
+
+
+def build_index(backend, features, meal_indices, **options):
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown index backend {backend!r}, expected one of {sorted(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](features, meal_indices, **options)
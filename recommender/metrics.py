@@ -0,0 +1,138 @@
+"""Request and stage metrics rendered in the Prometheus text format.
+
+Stage timings are collected with :func:`span`, a plain context manager around
+two ``perf_counter`` calls and a bucket increment. Metrics live in the memory
+of each process, so under gunicorn every worker reports its own series.
+"""
+import bisect
+import threading
+import time
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                   0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _with_label(labels, name, value):
+    pair = f'{name}="{value}"'
+    return '{' + (labels[1:-1] + ',' if labels else '') + pair + '}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.labels, key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def samples(self):
+        rows = []
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                labels = _labels(self.labels, key)
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    rows.append((f'{self.name}_bucket', _with_label(labels, 'le', bound), cumulative))
+                rows.append((f'{self.name}_sum', labels, total))
+                rows.append((f'{self.name}_count', labels, cumulative))
+        return rows
+
+
+class Gauge:
+    """Value read from ``collect()`` at scrape time, as ``[(label_values, value), ...]``."""
+
+    kind = 'gauge'
+
+    def __init__(self, name, help, collect, labels=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.kind = kind
+        self._collect = collect
+
+    def samples(self):
+        return [(self.name, _labels(self.labels, key), value) for key, value in self._collect()]
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name}{labels} {value}' for name, labels, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+STAGE_SECONDS = registry.register(Histogram(
+    'recommender_stage_seconds', 'Time spent in each stage of a request.', ['stage']))
+REQUEST_SECONDS = registry.register(Histogram(
+    'recommender_request_seconds', 'End-to-end request handling time.', ['endpoint']))
+REQUESTS = registry.register(Counter(
+    'recommender_requests_total', 'Requests handled.', ['endpoint', 'status']))
+ERRORS = registry.register(Counter(
+    'recommender_errors_total', 'Requests answered with success false.', ['endpoint']))
+
+
+class span:
+    """``with span('similarity'):`` records the block's duration under that stage."""
+
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.observe(time.perf_counter() - self.start, self.stage)
+        return False
@@ -0,0 +1,179 @@
+"""Similarity over the full micronutrient profile of the foods that have one.
+
+The vitamin-rich source datasets (drink, fruit, snack and ingredient
+nutrition) carry ~30 columns of vitamins, minerals, fats, fibre and sugars
+besides the macros. Catalog rows whose name matches one of those foods get a
+float32 profile, each feature divided by its largest value so no unit
+dominates. A request names the features it targets and optionally weights
+them; features it leaves out get weight zero.
+
+Ranking is weighted cosine similarity. Only the targeted features have a
+weight, so the dot products and the weighted row norms are computed over
+those columns alone and per-request weights need no rebuild. With
+``projection='pca'`` or ``'random'`` the profiles and their squares are also
+projected to a few dimensions once. A request targeting more features than
+there are components is first scored on those small matrices, which
+approximate both the weighted dot products and the weighted norms, and only
+the best ``rerank`` rows of each meal type are rescored exactly.
+"""
+import csv
+
+import numpy as np
+
+from recommender import config
+from recommender.index import top_k
+from recommender.search import normalize
+
+# source column -> request feature name
+SOURCE_COLUMNS = {
+    'Caloric Value': 'calories', 'Fat': 'fat', 'Protein': 'proteins', 'Carbohydrates': 'carbohydrate',
+    'Saturated Fats': 'saturated_fats', 'Monounsaturated Fats': 'monounsaturated_fats',
+    'Polyunsaturated Fats': 'polyunsaturated_fats', 'Sugars': 'sugars', 'Dietary Fiber': 'dietary_fiber',
+    'Cholesterol': 'cholesterol', 'Sodium': 'sodium', 'Water': 'water',
+    'Vitamin A': 'vitamin_a', 'Vitamin B1': 'vitamin_b1', 'Vitamin B11': 'vitamin_b11', 'Vitamin B12': 'vitamin_b12',
+    'Vitamin B2': 'vitamin_b2', 'Vitamin B3': 'vitamin_b3', 'Vitamin B5': 'vitamin_b5', 'Vitamin B6': 'vitamin_b6',
+    'Vitamin C': 'vitamin_c', 'Vitamin D': 'vitamin_d', 'Vitamin E': 'vitamin_e', 'Vitamin K': 'vitamin_k',
+    'Calcium': 'calcium', 'Copper': 'copper', 'Iron': 'iron', 'Magnesium': 'magnesium', 'Manganese': 'manganese',
+    'Phosphorus': 'phosphorus', 'Potassium': 'potassium', 'Selenium': 'selenium', 'Zinc': 'zinc',
+}
+FEATURES = list(SOURCE_COLUMNS.values())
+PROJECTIONS = ('none', 'pca', 'random')
+
+
+def _number(text):
+    # what pandas.to_numeric(errors='coerce') followed by fillna(0) gives
+    try:
+        value = float(text)
+    except ValueError:
+        return 0.0
+    return 0.0 if value != value else value
+
+
+def load_profiles(paths, names):
+    """``(rows, values)``: catalog rows with a source profile and their raw FEATURES values."""
+    profiles = {}
+    for path in paths:
+        # the csv module rather than pandas, lean serving builds this too
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            missing = sorted({'food', *SOURCE_COLUMNS} - set(reader.fieldnames or ()))
+            if missing:
+                raise ValueError(f"{path}: missing columns {missing}")
+            for record in reader:
+                profiles.setdefault(normalize(record['food']), [_number(record[col]) for col in SOURCE_COLUMNS])
+    rows = [row for row, name in enumerate(names) if normalize(name) in profiles]
+    values = np.array([profiles[normalize(names[row])] for row in rows], dtype=np.float32)
+    return np.array(rows, dtype=np.int64), values.reshape(len(rows), len(FEATURES))
+
+
+def projection_matrix(features, method, components, seed=0):
+    """(features, components) matrix, or None for ``method='none'``."""
+    if method == 'none' or components >= features.shape[1]:
+        return None
+    if method == 'pca':
+        # uncentered, so inner products with the query are what is approximated
+        _, _, vt = np.linalg.svd(features, full_matrices=False)
+        return np.ascontiguousarray(vt[:components].T, dtype=np.float32)
+    if method == 'random':
+        rng = np.random.default_rng(seed)
+        return (rng.standard_normal((features.shape[1], components)) / np.sqrt(components)).astype(np.float32)
+    raise ValueError(f"Unknown projection {method!r}, expected one of {list(PROJECTIONS)}")
+
+
+class MicronutrientIndex:
+    @classmethod
+    def build(cls, columns, meal_type_names):
+        """Index of the catalog ``columns`` over the configured sources and projection."""
+        rows, values = load_profiles(config.MICRO_SOURCES.split(','), columns.names)
+        return cls(rows, values, columns.meal_types, meal_type_names, config.MICRO_PROJECTION,
+                   config.MICRO_COMPONENTS, config.MICRO_RERANK)
+
+    def __init__(self, rows, values, meal_types, meal_type_names, projection='pca', components=16, rerank=256):
+        # grouped by meal type so each one is a contiguous slice of the matrices
+        meal_types = np.asarray(meal_types)[np.asarray(rows, dtype=np.int64)]
+        order = np.argsort(meal_types, kind='stable')
+        self.rows = np.asarray(rows, dtype=np.int64)[order]
+        values = np.asarray(values, dtype=np.float32).reshape(-1, len(FEATURES))[order]
+        meal_types = meal_types[order]
+        self.scale = np.abs(values).max(axis=0) if len(values) else np.ones(len(FEATURES), np.float32)
+        self.scale[self.scale == 0] = 1.0
+        self.features = np.asfortranarray(values / self.scale)
+        self.squared = np.asfortranarray(self.features * self.features)
+        self.meal_slices = {
+            meal_type: slice(*np.searchsorted(meal_types, [meal_type, meal_type + 1])) for meal_type in meal_type_names
+        }
+        self.projection = self.squared_projection = None
+        if len(values):
+            self.projection = projection_matrix(self.features, projection, components)
+            self.squared_projection = projection_matrix(self.squared, projection, components, seed=1)
+        if self.projection is not None:
+            self.reduced = np.asfortranarray(self.features @ self.projection)
+            self.reduced_squared = np.asfortranarray(self.squared @ self.squared_projection)
+        self.rerank = rerank
+
+    def __len__(self):
+        return self.rows.shape[0]
+
+    def nbytes(self):
+        arrays = [self.features, self.squared, self.rows]
+        if self.projection is not None:
+            arrays += [self.reduced, self.reduced_squared]
+        return sum(array.nbytes for array in arrays)
+
+    def query(self, targets, weights=None):
+        """Scaled target vector and per-feature weights of a request."""
+        weights = weights or {}
+        unknown = sorted(set(targets) - set(FEATURES)) + sorted(set(weights) - set(targets))
+        if unknown:
+            raise ValueError(f"Unknown or untargeted features {unknown}, expected targets among {FEATURES}")
+        if not targets:
+            raise ValueError("At least one micronutrient target is required")
+        target = np.zeros(len(FEATURES), dtype=np.float32)
+        weight = np.zeros(len(FEATURES), dtype=np.float32)
+        for i, feature in enumerate(FEATURES):
+            if feature in targets:
+                target[i] = float(targets[feature]) / self.scale[i]
+                weight[i] = float(weights.get(feature, 1.0))
+        if (weight < 0).any():
+            raise ValueError("Feature weights must not be negative")
+        return target, weight
+
+    @staticmethod
+    def _cosine(dots, squared_norms, target, weight):
+        norms = np.sqrt(np.maximum(squared_norms, 0)) * np.sqrt((weight * target) @ target)
+        return np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
+
+    def similarity(self, target, weight, rows=slice(None)):
+        """Weighted cosine similarity of the target with every profile, or the ones at ``rows``."""
+        targeted = np.flatnonzero(weight)
+        features, squared = self.features[rows], self.squared[rows]
+        dots = features[:, targeted] @ (weight * target)[targeted]
+        return self._cosine(dots, squared[:, targeted] @ weight[targeted], target, weight)
+
+    def approximate_similarity(self, target, weight):
+        """:meth:`similarity` of every profile from the projected matrices."""
+        dots = self.reduced @ (self.projection.T @ (weight * target))
+        return self._cosine(dots, self.reduced_squared @ (self.squared_projection.T @ weight), target, weight)
+
+    def recommend(self, targets, weights=None, k=5, allowed=None):
+        """``[(meal_type, catalog_rows, scores), ...]`` of the best ``k`` profiles per meal type, among ``allowed``."""
+        target, weight = self.query(targets, weights)
+        coarse = None
+        if self.projection is not None and np.count_nonzero(weight) > self.projection.shape[1]:
+            coarse = self.approximate_similarity(target, weight)
+        else:
+            exact = self.similarity(target, weight)
+        results = []
+        for meal_type, rows in self.meal_slices.items():
+            positions = np.arange(rows.start, rows.stop)
+            if allowed is not None:
+                positions = positions[allowed[self.rows[positions]]]
+            if coarse is None:
+                scores = exact[positions]
+            else:
+                if len(positions) > self.rerank:
+                    positions = np.sort(positions[top_k(coarse[positions], self.rerank)])
+                scores = self.similarity(target, weight, positions)
+            best = top_k(scores, k)
+            results.append((meal_type, self.rows[positions[best]], scores[best]))
+        return results
@@ -0,0 +1,459 @@
+"""Incremental catalog edits: an append buffer and tombstones over a snapshot.
+
+Upserting a food appends a row to buffers that extend the base snapshot's
+columns in place, and deleting one clears its bit in the ``live`` mask; an
+upsert of an existing name does both. Each edit publishes an
+:class:`OverlaySnapshot` that reuses the base engine, filter bitmaps and name
+index as they are:
+
+* recommendations search the base matrix with tombstoned rows masked out,
+  score the buffered rows by brute force and merge the two top-k lists;
+* filters and name search query the base indexes and small ones built over
+  the buffered rows only;
+* similar foods are scored exactly against both, since the neighbour graph
+  only knows the base rows, and micronutrient profiles of new foods are
+  joined at the next compaction.
+
+The registry folds the buffer into a fresh :class:`CatalogSnapshot` in the
+background (see :meth:`CatalogRegistry.compact`). A food outside the range the
+``MinMaxScaler`` was fitted on marks the overlay ``refit_pending``, and that
+compaction refits the scaler on the live rows.
+
+Edits are kept in an :class:`EditLog`, optionally journaled to a JSON-lines
+file so they survive restarts and reach every worker.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+from recommender import config
+from recommender.cache import LRUCache
+from recommender.diversity import diverse_search
+from recommender.engine import nutrient_density
+from recommender.filters import FilterIndex
+from recommender.index import BruteForceIndex, unit_rows
+from recommender.planner import MealPlanner
+from recommender.responses import DAILY_MEAL_FIELDS, CatalogColumns
+from recommender.search import NameIndex, normalize
+
+FOOD_FIELDS = ['calories', 'fat', 'proteins', 'carbohydrate']
+
+
+def parse_food(food, columns, meal_type_names):
+    """``(name, nutrients, meal_type, {column: value})`` of an upserted food."""
+    if not isinstance(food, dict):
+        raise ValueError("Each food must be a JSON object")
+    attributes = {col.lower(): col for col in columns.attributes}
+    expected = ['name', 'type'] + FOOD_FIELDS + list(attributes)
+    unknown = sorted(set(food) - set(expected))
+    missing = [key for key in expected if key not in food]
+    if unknown or missing:
+        raise ValueError(f"Food {food.get('name')!r} has unknown fields {unknown} and lacks {missing}, "
+                         f"expected {expected}")
+    name = food['name']
+    if not isinstance(name, str) or not name.strip():
+        raise ValueError("Food names must be non-empty strings")
+    codes = {meal_category: code for code, meal_category in meal_type_names.items()}
+    if food['type'] not in codes:
+        raise ValueError(f"Unknown meal type {food['type']!r}")
+    try:
+        values = [float(food[key]) for key in FOOD_FIELDS]
+    except (TypeError, ValueError):
+        # null, lists and objects, or strings that are not numbers
+        values = None
+    if values is None or not np.isfinite(values).all():
+        raise ValueError(f"Nutrients of {name!r} must be finite numbers")
+    nutrients = values + [nutrient_density(*values)]
+    return name, nutrients, codes[food['type']], {col: str(food[key]) for key, col in attributes.items()}
+
+
+def parse_edit(entry, snapshot):
+    """Check an ``{"op": "upsert", "foods": [...]}`` or ``{"op": "delete", "names": [...]}`` edit against ``snapshot``."""
+    if entry.get('op') == 'upsert':
+        if not isinstance(entry.get('foods'), list) or not entry['foods']:
+            raise ValueError("Expected a non-empty list of foods")
+        for food in entry['foods']:
+            parse_food(food, snapshot.columns, snapshot.meal_type_names)
+    elif entry.get('op') == 'delete':
+        if not isinstance(entry.get('names'), list) or not entry['names']:
+            raise ValueError("Expected a non-empty list of names")
+        for name in entry['names']:
+            if name not in snapshot.name_rows:
+                raise ValueError(f"Unknown food {name!r}")
+    else:
+        raise ValueError(f"Unknown edit {entry.get('op')!r}, expected 'upsert' or 'delete'")
+    return entry
+
+
+class EditLog:
+    """Catalog edits in the order they were made.
+
+    With a ``path`` every edit is appended to that journal, and :meth:`sync`
+    reads the entries written since the last call by this or any other process.
+    """
+
+    def __init__(self, path=''):
+        self.path = path
+        self.entries = []
+        self._offset = 0
+
+    def append(self, entry):
+        if not self.path:
+            self.entries.append(entry)
+            return
+        line = (json.dumps(entry, separators=(',', ':')) + '\n').encode('utf-8')
+        # one O_APPEND write, so lines of concurrent workers never interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def _size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def truncated(self):
+        """The journal was shortened or removed, so the edits it held must be dropped."""
+        return bool(self.path) and self._size() < self._offset
+
+    def reset(self):
+        """Forget journaled entries so the next :meth:`sync` reads the journal from the start."""
+        if self.path:
+            self.entries = []
+            self._offset = 0
+
+    def sync(self):
+        """Read complete journal lines appended since the last call, returns how many."""
+        if not self.path or self._size() <= self._offset:
+            return 0
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        lines = [line for line in data[:end].splitlines() if line.strip()]
+        self.entries.extend(json.loads(line) for line in lines)
+        self._offset += end
+        return len(lines)
+
+
+class AppendBuffer:
+    """Rows appended in place with amortized growth; a view of a filled prefix never changes."""
+
+    def __init__(self, rows):
+        rows = np.asarray(rows)
+        self.size = len(rows)
+        self.data = np.empty((self.size + max(64, self.size // 8),) + rows.shape[1:], dtype=rows.dtype)
+        self.data[:self.size] = rows
+
+    def append(self, rows):
+        rows = np.asarray(rows, dtype=self.data.dtype)
+        end = self.size + len(rows)
+        if end > len(self.data):
+            # a new array, views handed out earlier keep reading the old one
+            grown = np.empty((max(end, len(self.data) * 3 // 2),) + self.data.shape[1:], dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:end] = rows
+        self.size = end
+
+    def view(self, start=0):
+        return self.data[start:self.size]
+
+
+def _merge(first, first_scores, second, second_scores, k):
+    """Best ``k`` of two best-first lists, keeping each list's order and the first list on ties."""
+    at = np.searchsorted(-first_scores, -second_scores, side='right')
+    return np.insert(first, at, second)[:k]
+
+
+class OverlayEngine:
+    """The base engine with tombstoned rows masked out, plus the buffered rows."""
+
+    def __init__(self, base, features, meal_types, live):
+        self.base = base
+        self.offset = len(base)
+        self.features = features
+        self.meal_types = meal_types
+        self.meal_type_names = base.meal_type_names
+        self.live = live
+        self.size = int(np.count_nonzero(live))
+        self.index = BruteForceIndex(features, {
+            meal_type: np.flatnonzero(meal_types == meal_type) for meal_type in self.meal_type_names
+        })
+        self._meal_indices = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def meal_indices(self):
+        """Live rows of every meal type, base and buffered."""
+        if self._meal_indices is None:
+            meal_types = np.concatenate([self.base.meal_types, self.meal_types])
+            self._meal_indices = {
+                meal_type: np.flatnonzero((meal_types == meal_type) & self.live) for meal_type in self.meal_type_names
+            }
+        return self._meal_indices
+
+    def vectors(self, rows):
+        base = rows < self.offset
+        vectors = np.empty((len(rows), self.features.shape[1]), dtype=np.float32)
+        vectors[base] = self.base.features[rows[base]]
+        vectors[~base] = self.features[rows[~base] - self.offset]
+        return vectors
+
+    def recommend(self, query_scaled, k=5, mask=None, diversity=None):
+        return self.recommend_batch(np.atleast_2d(query_scaled)[:1], k, None if mask is None else [mask],
+                                    None if diversity is None else [diversity])[0]
+
+    def recommend_batch(self, queries_scaled, k=5, masks=None, diversity=None):
+        queries = unit_rows(np.atleast_2d(queries_scaled)).astype(np.float32)
+        return diverse_search(self._search, self.vectors, queries, k, masks, diversity)
+
+    def _search(self, queries, k, masks):
+        masks = [self.live if mask is None else mask & self.live for mask in (masks or [None] * len(queries))]
+        # the base index gets the same normalized queries as RecommendationEngine.recommend_batch
+        base = self.base.index.search(queries, k, [mask[:self.offset] for mask in masks])
+        buffered = self.index.search(queries, k, [mask[self.offset:] for mask in masks])
+        results = []
+        for query, base_result, buffered_result in zip(queries, base, buffered):
+            result = []
+            for (meal_type, rows), (_, extra) in zip(base_result, buffered_result):
+                if len(extra):
+                    rows = _merge(rows, self.base.features[rows] @ query,
+                                  extra + self.offset, self.features[extra] @ query, k)
+                result.append((meal_type, rows))
+            results.append(result)
+        return results
+
+    def similar(self, row, meal_type, k=None):
+        """``(rows, scores)`` of the live foods of ``meal_type`` most similar to ``row``, best first."""
+        k = config.NEIGHBOURS_K if k is None else min(k, config.NEIGHBOURS_K)
+        query = self.base.features[row] if row < self.offset else self.features[row - self.offset]
+        mask = self.live.copy()
+        mask[row] = False
+        rows = dict(self.recommend_batch(query[None], k, [mask])[0])[meal_type]
+        return rows, self.vectors(rows) @ query
+
+
+class _OverlayFilters:
+    def __init__(self, base, buffered):
+        self.base = base
+        self.buffered = buffered
+
+    def attributes(self):
+        # the buffered index has a bitset for every value, old and new
+        return self.buffered.attributes()
+
+    def mask(self, filters):
+        buffered = self.buffered.mask(filters)
+        if buffered is None:
+            return None
+        return np.concatenate([self.base.mask(filters, strict=False), buffered])
+
+
+class _OverlayNames:
+    def __init__(self, base, buffered, live, names):
+        self.base = base
+        self.buffered = buffered
+        self.offset = len(base)
+        self.live = live
+        self.names = names
+
+    def search(self, text, limit=10, meal_type=None, threshold=0.3):
+        rows, scores, matches = self.base.search(text, limit, meal_type, threshold, self.live[:self.offset])
+        extra, extra_scores, extra_matches = self.buffered.search(text, limit, meal_type, threshold,
+                                                                  self.live[self.offset:])
+        if not len(extra):
+            return rows, scores, matches
+        rows = np.concatenate([rows, extra + self.offset])
+        scores = np.concatenate([scores, extra_scores])
+        matches = matches + extra_matches
+        # the ranking of NameIndex.search: prefix matches by whole-name prefix, length and row, then fuzzy ones
+        query = normalize(text)
+        keys = []
+        for row, score, match in zip(rows.tolist(), scores.tolist(), matches):
+            name = normalize(self.names[row])
+            keys.append((0, 0.0, not name.startswith(query), len(name), row) if match == 'prefix' else
+                        (1, -score, 0, 0, row))
+        order = sorted(range(len(keys)), key=keys.__getitem__)[:limit]
+        return rows[order], scores[order], [matches[i] for i in order]
+
+
+class _NameRows:
+    """``name -> first live row`` from the base mapping and the names edited since."""
+
+    def __init__(self, base, touched):
+        self.base = base
+        self.touched = touched
+
+    def get(self, name, default=None):
+        if name in self.touched:
+            rows = self.touched[name]
+            return rows[0] if rows else default
+        return self.base.get(name, default)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        row = self.get(name)
+        if row is None:
+            raise KeyError(name)
+        return row
+
+
+class _LiveMicronutrients:
+    def __init__(self, index, live):
+        self.index = index
+        self.live = live
+
+    def recommend(self, targets, weights=None, k=5):
+        return self.index.recommend(targets, weights, k, allowed=self.live)
+
+
+class OverlaySnapshot:
+    """One published state of a :class:`CatalogOverlay`, used by requests like a CatalogSnapshot."""
+
+    def __init__(self, version, overlay):
+        base = overlay.base
+        offset = overlay.offset
+        self.version = version
+        self.base = base
+        self.scaler = base.scaler
+        self.meal_type_names = base.meal_type_names
+        self.nutrient_ranges = base.nutrient_ranges
+        self.live = overlay.live
+        self.refit_pending = overlay.refit_pending
+        categories = {col: list(values) for col, values in overlay.categories.items()}
+        # the names list only grows, this snapshot reads its first len(columns) entries
+        self.columns = CatalogColumns(overlay.names, overlay.nutrients.view(), overlay.meal_types.view(), {
+            col: (codes.view(), categories[col]) for col, codes in overlay.codes.items()
+        })
+        buffered = CatalogColumns(overlay.names[offset:], overlay.nutrients.view(offset),
+                                  overlay.meal_types.view(offset), {
+                                      col: (codes.view(offset), categories[col])
+                                      for col, codes in overlay.codes.items()
+                                  })
+        self.engine = OverlayEngine(base.engine, overlay.features.view(), buffered.meal_types, self.live)
+        self.filters = _OverlayFilters(base.filters, FilterIndex(buffered, base.nutrient_ranges))
+        self.names = _OverlayNames(base.names, NameIndex(buffered.names, buffered.meal_types), self.live,
+                                   self.columns.names)
+        self.name_rows = _NameRows(base.name_rows, dict(overlay.touched))
+        self._base_rows = base.filters.name_rows
+        self.cache = LRUCache(config.CACHE_SIZE, config.CACHE_TTL)
+        self.loaded_at = time.time()
+        # built on first use, racing requests at worst build them twice
+        self._planner = None
+        self._daily_meal_plan = None
+
+    @property
+    def planner(self):
+        if self._planner is None:
+            self._planner = MealPlanner(self.columns.nutrients, self.engine.meal_indices, config.PLANNER_CANDIDATES,
+                                        ranges=self.nutrient_ranges)
+        return self._planner
+
+    def rows_named(self, name):
+        """Every live row named ``name``; rows of an edited name are all listed by the overlay."""
+        touched = self.name_rows.touched
+        return touched[name] if name in touched else self._base_rows.get(name, [])
+
+    @property
+    def daily_meal_plan(self):
+        if self._daily_meal_plan is None:
+            best = self.columns.best_per_meal_type(self.meal_type_names, allowed=self.live)
+            self._daily_meal_plan = self.columns.food_items(best, self.meal_type_names, DAILY_MEAL_FIELDS)
+        return self._daily_meal_plan
+
+    @property
+    def neighbours(self):
+        """Exact neighbours from the engine, the base graph does not know the buffered rows."""
+        return self.engine
+
+    @property
+    def micronutrients(self):
+        """The base profiles without the deleted foods; buffered foods are joined when compacted."""
+        if self.base.micronutrients is None:
+            return None
+        return _LiveMicronutrients(self.base.micronutrients, self.live)
+
+
+class CatalogOverlay:
+    """Edit state over one base :class:`CatalogSnapshot`; not thread-safe, the registry serializes edits."""
+
+    def __init__(self, base):
+        columns = base.columns
+        self.base = base
+        self.offset = len(columns)
+        self.names = list(columns.names)
+        self.nutrients = AppendBuffer(columns.nutrients)
+        self.meal_types = AppendBuffer(np.asarray(columns.meal_types, dtype=np.int64))
+        self.codes = {col: AppendBuffer(np.asarray(codes, dtype=np.int64))
+                      for col, (codes, _) in columns.attributes.items()}
+        self.categories = {col: list(categories) for col, (_, categories) in columns.attributes.items()}
+        self.features = AppendBuffer(np.empty((0, base.engine.features.shape[1]), dtype=np.float32))
+        self.live = np.ones(self.offset, dtype=bool)
+        # name -> live rows, for every name edited since the base was built
+        self.touched = {}
+        self.refit_pending = False
+
+    def pending_rows(self):
+        """Buffered plus deleted rows, what a compaction would fold away."""
+        return len(self.live) - self.offset + int(np.count_nonzero(~self.live))
+
+    def _rows(self, name):
+        return self.touched[name] if name in self.touched else self.base.filters.name_rows.get(name, [])
+
+    def apply(self, entry):
+        """Apply a logged edit; an invalid one raises ValueError and changes nothing."""
+        if entry.get('op') == 'upsert':
+            foods = [parse_food(food, self.base.columns, self.base.meal_type_names) for food in entry['foods']]
+            self._upsert(foods)
+        elif entry.get('op') == 'delete':
+            # copy on write, published snapshots keep their mask
+            self.live = self.live.copy()
+            for name in entry['names']:
+                self.live[self._rows(name)] = False
+                self.touched[name] = []
+        else:
+            raise ValueError(f"Unknown edit {entry.get('op')!r}")
+
+    def _upsert(self, foods):
+        start = len(self.names)
+        self.live = np.concatenate([self.live, np.ones(len(foods), dtype=bool)])
+        for row, (name, _, _, _) in enumerate(foods, start):
+            self.live[self._rows(name)] = False
+            self.touched[name] = [row]
+        nutrients = np.array([food[1] for food in foods], dtype=np.float64)
+        self.names.extend(food[0] for food in foods)
+        self.nutrients.append(nutrients)
+        self.meal_types.append([food[2] for food in foods])
+        for col, codes in self.codes.items():
+            categories = self.categories[col]
+            for _, _, _, attributes in foods:
+                if attributes[col] not in categories:
+                    categories.append(attributes[col])
+            codes.append([categories.index(food[3][col]) for food in foods])
+        scaler = self.base.scaler
+        self.features.append(unit_rows(scaler.transform(nutrients)).astype(np.float32))
+        if ((nutrients < scaler.data_min_) | (nutrients > scaler.data_max_)).any():
+            self.refit_pending = True
+
+    def publish(self, version):
+        return OverlaySnapshot(version, self)
+
+
+def compacted_columns(snapshot):
+    """:class:`CatalogColumns` of the live rows of an :class:`OverlaySnapshot`."""
+    live = np.flatnonzero(snapshot.live)
+    columns = snapshot.columns
+    attributes = {col: (codes[live], categories) for col, (codes, categories) in columns.attributes.items()}
+    return CatalogColumns([columns.names[row] for row in live.tolist()], columns.nutrients[live],
+                          columns.meal_types[live], attributes)
+
@@ -0,0 +1,228 @@
+"""Sparse top-k item-to-item neighbour graph.
+
+Instead of a dense N x N similarity matrix, the builder scores the catalog in
+blocks sized to a fixed memory budget and keeps only the ``k`` most similar
+foods of every meal type for each food. The result is stored CSR-style: one
+row per (food, meal type) pair, int32 neighbour indices and float16 or float32
+scores, so a lookup is two offset reads and a slice.
+
+Build it next to the current catalog artifact with::
+
+    python -m recommender.neighbours --catalog Dataset/catalog -k 10 --dtype float16
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from recommender import config
+
+GRAPH_FILE = 'neighbours.json'
+
+
+def _merge_top_k(best_idx, best_val, idx, val, k):
+    """Row-wise top ``k`` of two candidate sets; equal scores prefer the lower index."""
+    idx = np.concatenate([best_idx, idx], axis=1)
+    val = np.concatenate([best_val, val], axis=1)
+    by_index = np.argsort(idx, axis=1, kind='stable')
+    idx = np.take_along_axis(idx, by_index, axis=1)
+    val = np.take_along_axis(val, by_index, axis=1)
+    order = np.argsort(-val, axis=1, kind='stable')[:, :k]
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(val, order, axis=1)
+
+
+def _block_top_k(sims, columns, k):
+    if sims.shape[1] > k:
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    else:
+        part = np.broadcast_to(np.arange(sims.shape[1]), sims.shape)
+    return columns[part], np.take_along_axis(sims, part, axis=1)
+
+
+def _blocks(n, memory_mb):
+    """Query and candidate block sizes whose scored pairs fit in ``memory_mb``."""
+    # per scored pair: the float32 similarity, its negation and an int64 argpartition index
+    budget = max(1, memory_mb * (1 << 20) // 16)
+    row_block = int(min(n, max(1, np.sqrt(budget)))) or 1
+    return row_block, max(1, budget // row_block)
+
+
+def _top_k_among(features, query_rows, rows, k, col_block):
+    """Row-wise top ``k`` (indices, scores) of ``query_rows`` among the sorted ``rows``, -inf padded."""
+    queries = np.asarray(features[query_rows], dtype=np.float32)
+    best_idx = np.empty((len(query_rows), 0), dtype=np.int64)
+    best_val = np.empty((len(query_rows), 0), dtype=np.float32)
+    for col in range(0, len(rows), col_block):
+        columns = rows[col:col + col_block]
+        sims = queries @ np.asarray(features[columns], dtype=np.float32).T
+        # a food is not its own neighbour
+        pos = np.minimum(np.searchsorted(columns, query_rows), len(columns) - 1)
+        own = np.flatnonzero(columns[pos] == query_rows)
+        sims[own, pos[own]] = -np.inf
+        idx, val = _block_top_k(sims, columns, k)
+        best_idx, best_val = _merge_top_k(best_idx, best_val, idx, val, k)
+    return best_idx, best_val
+
+
+def _assemble(n, n_types, pieces, dtype):
+    """CSR ``(indptr, indices, scores)`` from ``(query_rows, slot, indices, scores, keep)`` pieces."""
+    counts = np.zeros((n, n_types), dtype=np.int64)
+    for query_rows, m, _, _, keep in pieces:
+        counts[query_rows, m] = keep.sum(axis=1)
+    indptr = np.zeros(n * n_types + 1, dtype=np.int64)
+    np.cumsum(counts.ravel(), out=indptr[1:])
+    indices = np.empty(indptr[-1], dtype=np.int32)
+    scores = np.empty(indptr[-1], dtype=dtype)
+    for query_rows, m, best_idx, best_val, keep in pieces:
+        pos = indptr[query_rows * n_types + m][:, None] + np.cumsum(keep, axis=1) - 1
+        indices[pos[keep]] = best_idx[keep]
+        scores[pos[keep]] = best_val[keep]
+    return indptr, indices, scores
+
+
+def _kept(best_val, k):
+    keep = np.isfinite(best_val)
+    keep &= np.cumsum(keep, axis=1) <= k
+    return keep
+
+
+def _scored_pieces(features, meal_indices, query_rows, k, memory_mb):
+    row_block, col_block = _blocks(features.shape[0], memory_mb)
+    pieces = []
+    for start in range(0, len(query_rows), row_block):
+        block = query_rows[start:start + row_block]
+        for m, meal_type in enumerate(meal_indices):
+            best_idx, best_val = _top_k_among(features, block, np.asarray(meal_indices[meal_type]), k + 1, col_block)
+            pieces.append((block, m, best_idx, best_val, _kept(best_val, k)))
+    return pieces
+
+
+def build_neighbours(features, meal_indices, k=10, memory_mb=64, dtype=np.float16):
+    """Top-``k`` neighbours per food and meal type, computed block by block.
+
+    ``features`` are unit-length rows; ``memory_mb`` bounds the similarity
+    block held at once, so memory stays fixed while time grows with N^2.
+    Returns ``(indptr, indices, scores)``.
+    """
+    n = features.shape[0]
+    pieces = _scored_pieces(features, meal_indices, np.arange(n), k, memory_mb)
+    return _assemble(n, len(meal_indices), pieces, dtype)
+
+
+def patch_neighbours(graph, features, meal_indices, origins, k=10, memory_mb=64):
+    """:func:`build_neighbours` of a catalog derived from ``graph``'s by deleting and adding foods.
+
+    ``origins[row]`` is the row of the food in ``graph``'s catalog, -1 for an
+    added one; kept foods stay in their order and the features are unchanged.
+    A kept food's list stays exact unless it was full and lost a neighbour, so
+    those lists only take in the added foods that score higher. The added foods
+    and the foods that lost a neighbour are scored against the whole catalog.
+    """
+    origins = np.asarray(origins, dtype=np.int64)
+    n, n_types = len(origins), len(graph.meal_types)
+    remap = np.full((len(graph.indptr) - 1) // n_types, -1, dtype=np.int64)
+    kept = np.flatnonzero(origins >= 0)
+    remap[origins[kept]] = kept
+    added = {meal_type: np.intersect1d(rows, np.flatnonzero(origins < 0)) for meal_type, rows in meal_indices.items()}
+    row_block, col_block = _blocks(n, memory_mb)
+    width = np.arange(k)
+    pieces, stale = [], [np.flatnonzero(origins < 0)]
+    for start in range(0, len(kept), row_block):
+        block = kept[start:start + row_block]
+        lists, lost = [], np.zeros(len(block), dtype=bool)
+        for meal_type in meal_indices:
+            slots = origins[block] * n_types + graph._slot[meal_type]
+            starts = np.asarray(graph.indptr[slots])
+            lengths = np.asarray(graph.indptr[slots + 1]) - starts
+            valid = width < lengths[:, None]
+            idx = remap[np.asarray(graph.indices)[np.where(valid, starts[:, None] + width, 0)]]
+            lost |= (lengths == k) & (valid & (idx < 0)).any(axis=1)
+            lists.append((idx, valid & (idx >= 0)))
+        fresh = ~lost
+        stale.append(block[lost])
+        block = block[fresh]
+        queries = np.asarray(features[block], dtype=np.float32)
+        for m, meal_type in enumerate(meal_indices):
+            idx, valid = lists[m][0][fresh], lists[m][1][fresh]
+            # rescored in float32, the stored scores may be rounded
+            val = np.einsum('ij,ikj->ik', queries, np.asarray(features[np.where(valid, idx, 0)], dtype=np.float32))
+            val[~valid] = -np.inf
+            idx = np.where(valid, idx, -1)
+            new_idx, new_val = _top_k_among(features, block, added[meal_type], k + 1, col_block)
+            best_idx, best_val = _merge_top_k(idx, val, new_idx, new_val, k + 1)
+            pieces.append((block, m, best_idx, best_val, _kept(best_val, k)))
+    stale = np.sort(np.concatenate(stale))
+    pieces += _scored_pieces(features, meal_indices, stale, k, memory_mb)
+    return _assemble(n, n_types, pieces, graph.scores.dtype)
+
+
+class NeighbourGraph:
+    def __init__(self, indptr, indices, scores, meal_types, k=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.scores = scores
+        self.meal_types = list(meal_types)
+        self.k = k
+        self._slot = {meal_type: i for i, meal_type in enumerate(self.meal_types)}
+
+    @classmethod
+    def build(cls, engine, k=10, memory_mb=64, dtype=np.float16):
+        return cls(*build_neighbours(engine.features, engine.meal_indices, k, memory_mb, dtype), engine.meal_indices,
+                   k)
+
+    def patched(self, engine, origins, memory_mb=64):
+        """This graph carried over to ``engine``'s catalog, see :func:`patch_neighbours`."""
+        return type(self)(*patch_neighbours(self, engine.features, engine.meal_indices, origins, self.k, memory_mb),
+                          engine.meal_indices, self.k)
+
+    def similar(self, row, meal_type, k=None):
+        """``(neighbour rows, scores)`` of ``row`` within ``meal_type``, best first."""
+        i = row * len(self.meal_types) + self._slot[meal_type]
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        if k is not None:
+            hi = min(hi, lo + k)
+        return np.asarray(self.indices[lo:hi]), np.asarray(self.scores[lo:hi], dtype=np.float32)
+
+    def save(self, path):
+        np.save(os.path.join(path, 'neighbours.indptr.npy'), self.indptr)
+        np.save(os.path.join(path, 'neighbours.indices.npy'), self.indices)
+        np.save(os.path.join(path, 'neighbours.scores.npy'), self.scores)
+        with open(os.path.join(path, GRAPH_FILE), 'w') as f:
+            json.dump({'k': self.k, 'meal_types': self.meal_types, 'dtype': str(self.scores.dtype)}, f)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """The graph stored in ``path``, or None if it was never built there."""
+        if not os.path.exists(os.path.join(path, GRAPH_FILE)):
+            return None
+        with open(os.path.join(path, GRAPH_FILE)) as f:
+            meta = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+
+        return cls(load('neighbours.indptr.npy'), load('neighbours.indices.npy'), load('neighbours.scores.npy'),
+                   meta['meal_types'], meta['k'])
+
+
+def main():
+    from recommender.artifact import load_artifact
+    from recommender.engine import RecommendationEngine
+
+    parser = argparse.ArgumentParser(description='Build the top-k neighbour graph of a catalog artifact.')
+    parser.add_argument('--catalog', default=config.CATALOG_PATH or 'Dataset/catalog')
+    parser.add_argument('-k', type=int, default=config.NEIGHBOURS_K)
+    parser.add_argument('--memory-mb', type=int, default=config.NEIGHBOURS_MEMORY_MB)
+    parser.add_argument('--dtype', choices=['float16', 'float32'], default='float16')
+    args = parser.parse_args()
+
+    artifact = load_artifact(args.catalog)
+    engine = RecommendationEngine.from_artifact(artifact)
+    graph = NeighbourGraph.build(engine, args.k, args.memory_mb, np.dtype(args.dtype))
+    graph.save(artifact.path)
+    print(f"{artifact.path}: {len(graph.indices)} neighbours")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,365 @@
+"""Streaming build of the processed dataset from the raw nutrition sources.
+
+Reproducible replacement for the preprocessing notebooks. Every stage reads
+its input in chunks, so memory stays bounded by the chunk size, the set of
+name hashes and a few histograms, whatever the size of the sources:
+
+1. stage: each source is mapped onto the canonical columns, classified into a
+   meal type and deduplicated by name. Staged files are named by the source's
+   digest, so an unchanged source is not staged again.
+2. merge: staged sources are concatenated in order, dropping names already
+   seen in an earlier source, while the column ranges are accumulated.
+3. medians: the carbohydrate and protein medians behind ``Carb_Level`` and
+   ``Protein_Level`` are found exactly with a histogram pass and a pass over
+   the median's bin.
+4. write: columns are min-max scaled, ``Nutrient_Density`` and the levels are
+   added, and chunks sorted by density are merged into the output CSV. The
+   serving scaler is fitted on the way and the binary catalog built last.
+
+Intermediate files are streams of pickled DataFrame chunks, which are much
+cheaper to write and read back than CSV.
+
+Outputs go under the work directory unless ``--out`` and ``--scaler`` name
+other paths, so a run never replaces the tracked dataset and scaler. Serve a
+build by pointing ``RECOMMENDER_CATALOG`` at the catalog, or
+``RECOMMENDER_DATASET`` and ``RECOMMENDER_SCALER`` at the CSV and scaler along
+with the logged ``RECOMMENDER_NUTRIENT_RANGES``. Run it with::
+
+    python -m recommender.pipeline --work Dataset/.build --catalog Dataset/catalog
+"""
+import argparse
+import csv
+import hashlib
+import heapq
+import json
+import os
+import pickle
+import re
+import shutil
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+from recommender.artifact import _atomic_write_text, build_artifact, file_digest
+from recommender.engine import NUMERIC_COLS, nutrient_density
+
+MACRO_COLS = ['calories', 'fat', 'proteins', 'carbohydrate']
+STAGED_COLS = ['name'] + MACRO_COLS + ['Meal Type']
+OUTPUT_COLS = ['name'] + MACRO_COLS + ['Meal Type', 'Carb_Level', 'Protein_Level', 'Nutrient_Density']
+# food-nutrition.csv is not a source: it is the notebooks' concatenation of these
+# files, with the drink rows standing in for fruit, ingredient and snack ones,
+# so adding it would only repeat rows under their first-seen names
+DEFAULT_SOURCES = [
+    'Dataset/fruit-nutrition.csv',
+    'Dataset/drink-nutrition.csv',
+    'Dataset/indonesia-food-nutrition.csv',
+    'Dataset/snack-nutrition.csv',
+    'Dataset/ingridient-nutrition.csv',
+]
+# source header -> canonical column, the first schema whose columns are all present wins
+SCHEMAS = [
+    {'food': 'name', 'Caloric Value': 'calories', 'Fat': 'fat', 'Protein': 'proteins', 'Carbohydrates': 'carbohydrate'},
+    {col: col for col in ['name'] + MACRO_COLS},
+]
+# meal type code -> name keywords, earlier groups win when a name matches several
+MEAL_KEYWORDS = [
+    (2, ['juice', 'coffee', 'tea', 'milk', 'soda', 'beer', 'wine', 'drink', 'beverage', 'kopi', 'teh', 'sirup',
+         'sari kedelai', 'es', 'jus', 'susu', 'cendol', 'daun teh', 'bir', 'limun', 'bandrek', 'kelapa', 'nectar',
+         'fruit', 'cola', 'coke', 'tonic', 'water', 'coconut', 'sprite', 'limeade', 'lemonade']),
+    (1, ['rice', 'corn', 'potato', 'bread', 'pasta', 'noodle', 'cereal', 'oat', 'wheat', 'barley', 'nasi', 'roti',
+         'kentang', 'jagung', 'beras', 'kacang', 'talas', 'sukun', 'ubi', 'umbi', 'bihun', 'makaroni', 'tapioka',
+         'singkong', 'emping', 'gaplek', 'tepung', 'ketan', 'sagu', 'mie', 'bakso', 'lontong']),
+    (0, ['oat', 'cereal', 'bread', 'toast', 'pancake', 'waffle', 'muffin', 'yogurt', 'egg', 'ketan', 'bubur',
+         'biskuit', 'kue', 'martabak', 'serabi', 'lupis', 'roti bakar', 'peuyeum']),
+    (3, ['rice', 'pasta', 'noodle', 'beef', 'chicken', 'fish', 'soup', 'vegetable', 'lentil', 'stew', 'bebek',
+         'ayam', 'ikan', 'sop', 'mi', 'mie', 'sayur', 'rendang', 'soto', 'telur', 'tahu', 'tempe', 'gulai',
+         'sayur asem', 'bakmi', 'pecel', 'opor', 'lodeh', 'rawon', 'tongseng', 'gudeg', 'salad', 'grilled', 'steak',
+         'seafood', 'sup', 'gado-gado', 'capcay', 'asinan', 'karedok', 'urap', 'daging', 'sapi', 'sate', 'abon',
+         'empal', 'belut', 'kangkung', 'coto', 'koro', 'teri', 'sphagetty', 'semur']),
+    (4, ['cookie', 'candy', 'chocolate', 'ice cream', 'cracker', 'chip', 'bar', 'snack', 'popcorn', 'keripik',
+         'kerupuk', 'kue', 'pisang', 'jambu', 'jeruk', 'karoket', 'kelepon', 'kembang', 'ketela', 'onde-onde', 'bika',
+         'dodol', 'wingko', 'es', 'lemper', 'arem-arem', 'kue cubit', 'nastar', 'kastengel', 'lapis legit', 'mochi',
+         'getuk', 'cucur', 'biji salak', 'misro', 'combro', 'pudding', 'buah', 'mangga', 'markisa', 'ongol',
+         'pepaya', 'rambutan', 'siomay', 'tahu', 'tempe', 'granola', 'alpukat', 'pempek', 'oncom', 'lopis',
+         'manggis', 'nanas', 'nangka', 'olah-olah', 'papeda', 'pastel', 'ongol-ongol', 'sawo', 'srikaya',
+         'semangka', 'peanuts', 'seed', 'roasted', 'kelapa', 'wortel']),
+]
+STATE = 'state.json'
+# rows per block of a sorted run, the merge holds one block of every run
+RUN_BLOCK = 4096
+
+
+class KeywordMatcher:
+    """Classify names by the highest-priority keyword they contain, in one regex scan per name.
+
+    Keywords match anywhere in the lower-cased name, like ``keyword in name``.
+    All keywords are compiled into one prefix-trie pattern inside a lookahead,
+    so overlapping matches are found and each position costs a walk down the
+    trie rather than a try of every keyword. The trie reports the longest
+    keyword starting at a position; every shorter one matching there is a
+    prefix of it, so each keyword is ranked by the best of its prefixes.
+    """
+
+    def __init__(self, groups):
+        self.codes = [code for code, _ in groups]
+        rank = {}
+        for position, (_, keywords) in enumerate(groups):
+            for keyword in keywords:
+                rank.setdefault(keyword, position)
+        self.rank = {
+            keyword: min(rank[keyword[:end]] for end in range(1, len(keyword) + 1) if keyword[:end] in rank)
+            for keyword in rank
+        }
+        self.pattern = re.compile('(?=(' + _trie_pattern(rank) + '))')
+
+    def classify(self, names):
+        """Meal type code of every name, -1 where no keyword matches."""
+        codes = np.array(self.codes + [-1], dtype=np.int64)
+        rank, unmatched = self.rank, len(self.codes)
+        ranks = [min((rank[keyword] for keyword in self.pattern.findall(name)), default=unmatched)
+                 for name in pd.Series(names, dtype=object).str.lower().tolist()]
+        return codes[np.asarray(ranks, dtype=np.intp)]
+
+
+def _trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def pattern(node):
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        # greedy, so the longest keyword wins
+        return f'(?:{body})?' if '' in node else body
+
+    return pattern(trie)
+
+
+def _write_chunk(f, chunk):
+    pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _read_chunks(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def _first_seen(names, seen):
+    """Mask of the names whose hash is not in ``seen`` yet, adding them to it."""
+    # duplicates differ at most in case and surrounding whitespace
+    hashes = pd.util.hash_pandas_object(names.astype(str).str.strip().str.lower(), index=False).tolist()
+    keep = np.zeros(len(hashes), dtype=bool)
+    for i, value in enumerate(hashes):
+        if value not in seen:
+            seen.add(value)
+            keep[i] = True
+    return keep
+
+
+def _schema(path):
+    header = set(pd.read_csv(path, nrows=0).columns)
+    for schema in SCHEMAS:
+        if header.issuperset(schema):
+            return schema
+    raise ValueError(f"{path}: columns {sorted(header)} match no known source schema")
+
+
+def stage_source(path, out, matcher, chunk_size):
+    """Canonical, classified rows of one source, unique by name. Returns the rows written."""
+    schema = _schema(path)
+    seen = set()
+    written = 0
+    tmp = out + '.tmp'
+    with open(tmp, 'wb') as f:
+        for chunk in pd.read_csv(path, usecols=list(schema), chunksize=chunk_size):
+            chunk = chunk.rename(columns=schema)[['name'] + MACRO_COLS]
+            chunk[MACRO_COLS] = chunk[MACRO_COLS].apply(pd.to_numeric, errors='coerce')
+            chunk = chunk.dropna()
+            chunk['name'] = chunk['name'].astype(str).str.strip()
+            chunk['Meal Type'] = matcher.classify(chunk['name'])
+            # rows no keyword classifies are ingredients, not served
+            chunk = chunk[chunk['Meal Type'] >= 0]
+            keep = _first_seen(chunk['name'], seen)
+            _write_chunk(f, chunk[keep].reset_index(drop=True))
+            written += int(keep.sum())
+    os.replace(tmp, out)
+    return written
+
+
+def merge_staged(staged, out):
+    """Concatenate staged sources in order, first occurrence of a name wins.
+
+    Returns ``(rows, minimum, maximum)`` of the MACRO_COLS.
+    """
+    seen = set()
+    rows = 0
+    minimum = np.full(len(MACRO_COLS), np.inf)
+    maximum = np.full(len(MACRO_COLS), -np.inf)
+    with open(out, 'wb') as f:
+        for path in staged:
+            for chunk in _read_chunks(path):
+                chunk = chunk[_first_seen(chunk['name'], seen)]
+                if len(chunk):
+                    values = chunk[MACRO_COLS].to_numpy(dtype=np.float64)
+                    np.minimum(minimum, values.min(axis=0), out=minimum)
+                    np.maximum(maximum, values.max(axis=0), out=maximum)
+                _write_chunk(f, chunk)
+                rows += len(chunk)
+    return rows, minimum, maximum
+
+
+def streaming_median(path, col, rows, low, high, bins=1 << 16):
+    """Exact median of ``col``, holding only a histogram and one bin of values."""
+    if rows == 0:
+        return np.nan
+    if low == high:
+        return low
+    edges = np.linspace(low, high, bins + 1)
+    counts = np.zeros(bins, dtype=np.int64)
+    for chunk in _read_chunks(path):
+        counts += np.bincount(np.clip(np.searchsorted(edges, chunk[col].to_numpy(), 'right') - 1, 0, bins - 1),
+                              minlength=bins)
+    cumulative = np.cumsum(counts)
+    # the middle one or two order statistics and the bins holding them
+    ranks = sorted({(rows - 1) // 2, rows // 2})
+    wanted = np.searchsorted(cumulative, np.array(ranks) + 1)
+    values = []
+    for chunk in _read_chunks(path):
+        column = chunk[col].to_numpy()
+        where = np.clip(np.searchsorted(edges, column, 'right') - 1, 0, bins - 1)
+        values.append(column[np.isin(where, wanted)])
+    values = np.sort(np.concatenate(values))
+    before = np.concatenate(([0], cumulative))[wanted[0]]
+    return float(np.mean([values[rank - before] for rank in ranks]))
+
+
+def _sorted_runs(merged, runs_dir, minimum, maximum, medians, scaler):
+    span = np.where(maximum > minimum, maximum - minimum, 1.0)
+    carb_median, protein_median = ((medians - minimum[[3, 2]]) / span[[3, 2]])
+    runs = []
+    for i, chunk in enumerate(_read_chunks(merged)):
+        chunk[MACRO_COLS] = (chunk[MACRO_COLS].to_numpy(dtype=np.float64) - minimum) / span
+        chunk = chunk[chunk['calories'] > 0].copy()
+        chunk['Carb_Level'] = np.where(chunk['carbohydrate'] >= carb_median, 'High-Carb', 'Low-Carb')
+        chunk['Protein_Level'] = np.where(chunk['proteins'] >= protein_median, 'High-Protein', 'Low-Protein')
+        chunk['Nutrient_Density'] = nutrient_density(*(chunk[col].to_numpy() for col in MACRO_COLS))
+        if len(chunk):
+            scaler.partial_fit(chunk[NUMERIC_COLS])
+        chunk = chunk.sort_values('Nutrient_Density', ascending=False, kind='stable')[OUTPUT_COLS]
+        path = os.path.join(runs_dir, f'{i:06d}.pkl')
+        with open(path, 'wb') as f:
+            for start in range(0, len(chunk), RUN_BLOCK):
+                _write_chunk(f, chunk.iloc[start:start + RUN_BLOCK])
+        runs.append(path)
+    return runs
+
+
+def _run_rows(path):
+    for block in _read_chunks(path):
+        yield from zip(*(block[col].tolist() for col in OUTPUT_COLS))
+
+
+def _merge_runs(runs, out):
+    """K-way merge of density-sorted runs, stable across runs like one global sort."""
+    tmp = out + '.tmp'
+    with open(tmp, 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(OUTPUT_COLS)
+        writer.writerows(heapq.merge(*map(_run_rows, runs), key=lambda row: -row[-1]))
+    os.replace(tmp, out)
+
+
+def _settings_digest():
+    settings = json.dumps([SCHEMAS, MEAL_KEYWORDS, STAGED_COLS, OUTPUT_COLS])
+    return hashlib.sha256(settings.encode('utf-8')).hexdigest()[:12]
+
+
+def _load_state(work):
+    try:
+        with open(os.path.join(work, STATE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build(sources, work, out, scaler_path, catalog=None, chunk_size=100000, force=False, log=print):
+    """Run the pipeline, skipping it when neither the sources nor the settings changed."""
+    state = _load_state(work)
+    settings = _settings_digest()
+    if state.get('settings') != settings:
+        state = {}
+    staged_dir = os.path.join(work, 'staged', settings)
+    os.makedirs(staged_dir, exist_ok=True)
+    digests = {path: file_digest(path) for path in sources}
+    outputs = [out, scaler_path] + ([catalog] if catalog else [])
+    if (not force and state.get('sources') == digests and state.get('catalog') == catalog
+            and all(os.path.exists(path) for path in outputs)):
+        log("sources unchanged, nothing to do")
+        return False
+
+    matcher = KeywordMatcher(MEAL_KEYWORDS)
+    staged = []
+    for path in sources:
+        target = os.path.join(staged_dir, f'{digests[path][:16]}.pkl')
+        if not force and os.path.exists(target):
+            log(f"{path}: unchanged")
+        else:
+            log(f"{path}: {stage_source(path, target, matcher, chunk_size)} rows")
+        staged.append(target)
+
+    merged = os.path.join(work, 'merged.pkl')
+    rows, minimum, maximum = merge_staged(staged, merged)
+    medians = np.array([
+        streaming_median(merged, col, rows, minimum[MACRO_COLS.index(col)], maximum[MACRO_COLS.index(col)])
+        for col in ('carbohydrate', 'proteins')
+    ])
+    runs_dir = os.path.join(work, 'runs')
+    shutil.rmtree(runs_dir, ignore_errors=True)
+    os.makedirs(runs_dir)
+    scaler = MinMaxScaler()
+    _merge_runs(_sorted_runs(merged, runs_dir, minimum, maximum, medians, scaler), out)
+    shutil.rmtree(runs_dir)
+    joblib.dump(scaler, scaler_path)
+    log(f"{out}: {int(scaler.n_samples_seen_)} foods from {rows} unique names")
+    # the served CSV needs them in the environment, the catalog carries them
+    ranges = [[float(low), float(high)] for low, high in zip(minimum, maximum)]
+    log(f"RECOMMENDER_NUTRIENT_RANGES={','.join(f'{low}:{high}' for low, high in ranges)}")
+
+    if catalog:
+        source_digests = {out: file_digest(out), scaler_path: file_digest(scaler_path)}
+        log(build_artifact(pd.read_csv(out), scaler, catalog, sources=source_digests,
+                           nutrient_ranges=ranges))
+
+    state = {'settings': settings, 'sources': digests, 'catalog': catalog}
+    _atomic_write_text(os.path.join(work, STATE), json.dumps(state, indent=4))
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the processed dataset, scaler and catalog from the raw sources.')
+    parser.add_argument('sources', nargs='*', default=DEFAULT_SOURCES)
+    parser.add_argument('--work', default='Dataset/.build', help='staging directory kept between runs')
+    parser.add_argument('--out', help='processed dataset CSV (default: processed_dataset.csv in --work)')
+    parser.add_argument('--scaler', help='fitted scaler (default: scaler.pkl in --work)')
+    parser.add_argument('--catalog', default=None, help='also build the binary catalog under this root')
+    parser.add_argument('--chunk-size', type=int, default=100000)
+    parser.add_argument('--force', action='store_true', help='rebuild even if no source changed')
+    args = parser.parse_args()
+    out = args.out or os.path.join(args.work, 'processed_dataset.csv')
+    scaler = args.scaler or os.path.join(args.work, 'scaler.pkl')
+    build(args.sources, args.work, out, scaler, args.catalog, args.chunk_size, args.force)
+
+
+if __name__ == '__main__':
+    main()
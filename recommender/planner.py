@@ -0,0 +1,196 @@
+"""Meal planner that fits daily calorie and macro targets.
+
+A plan is a list of slots (one or more per meal type). For each day a beam
+search fills the slots in order and keeps the ``width`` partial plans whose
+totals, plus the expected contribution of the slots still empty, are closest
+to the targets. Every expansion scores all candidates of the slot against all
+beams at once with NumPy broadcasting.
+
+Targets are in kcal and grams while the catalog holds min-max scaled values,
+so foods are planned on their raw amounts, mapped back through the raw
+``(minimum, maximum)`` of every target column the catalog was scaled with.
+Targets outside what the slots can add up to are rejected rather than planned.
+
+The search is anytime: a greedy pass (width 1) comes first, and wider beams
+then run only while the time budget allows, keeping the best complete plan
+found. Each day's result is then refined by swapping single items while that
+lowers the error. Across days, foods already used are removed from the pools
+so a multi-day plan has no repeats. The clock is checked between slots, swaps
+and days; once the budget is spent the best plan so far is returned, which is
+at least the first greedy day.
+"""
+import time
+
+import numpy as np
+
+from recommender.engine import NUMERIC_COLS
+
+TARGET_COLS = ['calories', 'fat', 'proteins', 'carbohydrate']
+_TARGET = [NUMERIC_COLS.index(col) for col in TARGET_COLS]
+_DENSITY = NUMERIC_COLS.index('Nutrient_Density')
+
+
+class Plan:
+    def __init__(self, days, error):
+        self.days = days
+        self.error = error
+
+
+class MealPlanner:
+    def __init__(self, nutrients, meal_indices, candidates=256, widths=(1, 16, 64), ranges=None):
+        nutrients = np.asarray(nutrients, dtype=np.float64)
+        self.values = np.nan_to_num(nutrients[:, _TARGET])
+        if ranges is not None:
+            ranges = np.asarray(ranges, dtype=np.float64)
+            self.values = ranges[:, 0] + self.values * (ranges[:, 1] - ranges[:, 0])
+        self.density = np.nan_to_num(nutrients[:, _DENSITY])
+        self.meal_indices = meal_indices
+        self.candidates = candidates
+        self.widths = widths
+
+    def bounds(self, slots):
+        """Lowest and highest daily totals the ``slots`` can add up to, one food per slot."""
+        low = np.zeros(len(TARGET_COLS))
+        high = np.zeros(len(TARGET_COLS))
+        for meal_type in set(slots):
+            values = self.values[np.asarray(self.meal_indices[meal_type], dtype=np.intp)]
+            count = slots.count(meal_type)
+            if len(values) < count:
+                raise ValueError("Not enough foods to fill every meal")
+            values = np.sort(values, axis=0)
+            low += values[:count].sum(axis=0)
+            high += values[len(values) - count:].sum(axis=0)
+        return low, high
+
+    def _pools(self, slots, target, scale, used):
+        """Candidate rows per meal type, pre-filtered to those nearest a per-slot share of the target."""
+        share = target / len(slots)
+        pools = {}
+        for meal_type in set(slots):
+            rows = np.asarray(self.meal_indices[meal_type])
+            rows = rows[~used[rows]]
+            if len(rows) > self.candidates:
+                distance = self._error(self.values[rows], share, scale)
+                rows = rows[np.argpartition(distance, self.candidates - 1)[:self.candidates]]
+            pools[meal_type] = np.sort(rows)
+        return pools
+
+    def _error(self, totals, target, scale):
+        return (np.abs(totals - target) / scale).sum(axis=-1)
+
+    def _plan_day(self, slots, target, scale, used, width, deadline):
+        pools = self._pools(slots, target, scale, used)
+        if any(len(pools[meal_type]) == 0 for meal_type in slots):
+            raise ValueError("Not enough foods left to fill every meal")
+        expected = [self.values[pools[meal_type]].mean(axis=0) for meal_type in slots]
+        remaining = np.cumsum(expected[::-1], axis=0)[::-1].tolist() + [[0.0] * len(TARGET_COLS)]
+
+        totals = np.zeros((1, len(TARGET_COLS)))
+        chosen = np.empty((1, 0), dtype=np.intp)
+        started = time.perf_counter()
+        for depth, meal_type in enumerate(slots):
+            # the greedy pass always finishes its day, wider ones give up when the next slot would overrun
+            now = time.perf_counter()
+            if width > 1 and now + ((now - started) / depth if depth else 0.0) > deadline:
+                return None
+            pool = pools[meal_type]
+            candidate_totals = totals[:, None, :] + self.values[pool][None, :, :]
+            score = self._error(candidate_totals + np.asarray(remaining[depth + 1]), target, scale)
+            # prefer denser foods among equally good fits
+            score = score - 1e-6 * self.density[pool][None, :]
+            # a food appears at most once per day
+            score[(chosen[:, :, None] == pool[None, None, :]).any(axis=1)] = np.inf
+            flat = score.ravel()
+            keep = min(width, np.isfinite(flat).sum())
+            if keep == 0:
+                raise ValueError("Not enough foods left to fill every meal")
+            best = np.argpartition(flat, keep - 1)[:keep]
+            best = best[np.argsort(flat[best], kind='stable')]
+            beam, position = np.divmod(best, len(pool))
+            totals = candidate_totals[beam, position]
+            chosen = np.column_stack([chosen[beam], pool[position]])
+        return self._improve(chosen[0], totals[0], slots, pools, target, scale, deadline)
+
+    def _improve(self, rows, totals, slots, pools, target, scale, deadline, max_swaps=20):
+        """Swap single items for better-fitting foods of the same meal type until none helps or time is up."""
+        rows = rows.copy()
+        error = self._error(totals, target, scale)
+        for _ in range(max_swaps):
+            if time.perf_counter() > deadline:
+                break
+            best = (error, None, None)
+            for slot, meal_type in enumerate(slots):
+                pool = pools[meal_type]
+                swapped = totals - self.values[rows[slot]] + self.values[pool]
+                swapped_error = self._error(swapped, target, scale)
+                swapped_error[np.isin(pool, rows)] = np.inf
+                i = int(np.argmin(swapped_error))
+                if swapped_error[i] < best[0] - 1e-12:
+                    best = (swapped_error[i], slot, pool[i])
+            if best[1] is None:
+                break
+            error, slot, row = best
+            totals = totals - self.values[rows[slot]] + self.values[row]
+            rows[slot] = row
+        return rows, totals, error
+
+    def _plan(self, slots, target, scale, days, width, deadline):
+        """Plan of ``days`` days, None if a wider pass ran out of time; the greedy pass stops early instead."""
+        used = np.zeros(len(self.values), dtype=bool)
+        plan, total_error = [], 0.0
+        for _ in range(days):
+            if plan and time.perf_counter() > deadline:
+                if width > 1:
+                    return None
+                break
+            day = self._plan_day(slots, target, scale, used, width, deadline)
+            if day is None:
+                return None
+            rows, totals, error = day
+            used[rows] = True
+            plan.append((rows, totals, error))
+            total_error += error
+        return Plan(plan, total_error)
+
+    def plan(self, target, slots, days=1, time_budget=0.05, tolerance=0.0):
+        """Best plan found within ``time_budget`` seconds.
+
+        ``target`` holds daily calories, fat, proteins and carbohydrate and
+        ``slots`` lists the meal type of every item in a day. Returns
+        ``(plan, complete)``, where ``complete`` is False if the budget cut
+        the search short, in which case the plan may have fewer days. Raises
+        ValueError when a target is further than ``tolerance`` (relative)
+        from anything the slots can add up to.
+        """
+        deadline = time.perf_counter() + time_budget
+        target = np.asarray(target, dtype=np.float64)
+        low, high = self.bounds(slots)
+        unreachable = [
+            f"{col} {value:g} (these meals give {lowest:.0f} to {highest:.0f})"
+            for col, value, lowest, highest in zip(TARGET_COLS, target, low, high)
+            if value * (1 + tolerance) < lowest or value * (1 - tolerance) > highest
+        ]
+        if unreachable:
+            raise ValueError(f"Targets out of reach: {', '.join(unreachable)}")
+        scale = np.maximum(np.abs(target), 1e-6)
+        best, complete = None, True
+        day_seconds = 0.0
+        for width in self.widths:
+            started = time.perf_counter()
+            # a wider beam takes at least as long per day, skip it if not even its first day would fit;
+            # the greedy pass always runs, so there is a plan whatever the budget
+            if best is not None and started + day_seconds > deadline:
+                complete = False
+                break
+            plan = self._plan(slots, target, scale, days, width, deadline)
+            if plan is None:
+                complete = False
+                break
+            day_seconds = (time.perf_counter() - started) / len(plan.days)
+            if len(plan.days) < days:
+                complete = False
+            if best is None or plan.error < best.error:
+                best = plan
+            if not complete:
+                break
+        return best, complete
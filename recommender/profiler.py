@@ -0,0 +1,58 @@
+"""Sampling profiler that records collapsed stacks for flame graphs.
+
+A background thread samples the stacks of all other threads every
+``interval`` seconds. :meth:`SamplingProfiler.stop` returns them in the
+folded format (``frame;frame;frame count``) read by flamegraph.pl and
+speedscope.
+"""
+import collections
+import sys
+import threading
+
+
+def _fold(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self._counts = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.005):
+        with self._lock:
+            if self.running:
+                return False
+            self._counts = collections.Counter()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._sample, args=(interval,), name="sampling-profiler",
+                                            daemon=True)
+            self._thread.start()
+            return True
+
+    def _sample(self, interval):
+        own = threading.get_ident()
+        while not self._stop.wait(interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self._counts[_fold(frame)] += 1
+
+    def stop(self):
+        """Stop sampling and return the folded stacks collected since :meth:`start`."""
+        with self._lock:
+            if self._thread is not None:
+                self._stop.set()
+                self._thread.join()
+                self._thread = None
+            return ''.join(f'{stack} {count}\n' for stack, count in self._counts.most_common())
@@ -0,0 +1,375 @@
+"""Versioned catalog snapshots with background reload and atomic swap.
+
+A :class:`CatalogSnapshot` bundles everything derived from one dataset and
+scaler version. The registry builds new snapshots off the request path and
+publishes them with a single reference assignment. A request reads
+``registry.current`` once and keeps using that snapshot, so in-flight requests
+finish on the version they started with.
+
+Reloads happen on demand or when the source files change on disk. Every
+process watches for itself, so with several gunicorn workers the file watcher
+is what refreshes all of them; a reload request only reaches one worker.
+
+Food upserts and deletes go through :meth:`CatalogRegistry.edit` and are
+published as overlay snapshots (see :mod:`recommender.mutations`) until a
+background compaction folds them into a new snapshot. A reload replays every
+logged edit on top of the freshly loaded catalog, and the watcher also picks
+up edits other workers appended to the journal.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from recommender import config
+from recommender.artifact import CURRENT, MANIFEST, file_digest, load_artifact
+from recommender.cache import LRUCache
+from recommender.engine import MEAL_TYPE_NAMES, RecommendationEngine
+from recommender.filters import FilterIndex
+from recommender.micronutrients import MicronutrientIndex
+from recommender.mutations import CatalogOverlay, EditLog, compacted_columns, parse_edit
+from recommender.neighbours import NeighbourGraph
+from recommender.planner import MealPlanner
+from recommender.responses import DAILY_MEAL_FIELDS, CatalogColumns
+from recommender.scaling import LinearScaler
+from recommender.search import NameIndex
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot:
+    """Scaler, engine, response columns, filter bitmaps, name index and caches of one catalog version.
+
+    Everything is built here, in the loading or compacting thread, so a
+    request never waits on an index of the version it reads. The exception
+    is the neighbour graph, quadratic in the catalog size: unless the
+    artifact or a compaction brings one, it is scored on the first
+    ``/foods/similar`` request, so catalogs nobody asks similar foods of
+    never pay for it.
+    """
+
+    def __init__(self, version, scaler, columns, engine, meal_type_names=MEAL_TYPE_NAMES, neighbours=None,
+                 micronutrients=None, nutrient_ranges=None):
+        self.version = version
+        self.scaler = scaler
+        self.columns = columns
+        self.engine = engine
+        self.meal_type_names = meal_type_names
+        # raw ranges the catalog was scaled from, an artifact's own or the configured ones
+        self.nutrient_ranges = nutrient_ranges if nutrient_ranges is not None else config.NUTRIENT_RANGES
+        self.planner = MealPlanner(columns.nutrients, engine.meal_indices, config.PLANNER_CANDIDATES,
+                                   ranges=self.nutrient_ranges)
+        self.filters = FilterIndex(columns, self.nutrient_ranges)
+        self.names = NameIndex(columns.names, columns.meal_types)
+        # the artifact's or a carried-over graph, otherwise scored on first use
+        self._neighbours = neighbours
+        self._neighbours_lock = threading.Lock()
+        self.micronutrients = micronutrients if micronutrients is not None else _micronutrients(columns,
+                                                                                               meal_type_names)
+        self.name_rows = {}
+        for row, name in enumerate(columns.names):
+            self.name_rows.setdefault(name, row)
+        self.cache = LRUCache(config.CACHE_SIZE, config.CACHE_TTL)
+        # the plan only depends on the dataset, so it is built once per version
+        self.daily_meal_plan = columns.food_items(
+            columns.best_per_meal_type(meal_type_names), meal_type_names, DAILY_MEAL_FIELDS
+        )
+        self.loaded_at = time.time()
+
+    @property
+    def neighbours(self):
+        if self._neighbours is None:
+            with self._neighbours_lock:
+                if self._neighbours is None:
+                    self._neighbours = NeighbourGraph.build(self.engine, config.NEIGHBOURS_K,
+                                                            config.NEIGHBOURS_MEMORY_MB)
+        return self._neighbours
+
+    def rows_named(self, name):
+        """Every row named ``name``, a catalog may hold a name more than once."""
+        return self.filters.name_rows.get(name, [])
+
+
+def _micronutrients(columns, meal_type_names):
+    try:
+        return MicronutrientIndex.build(columns, meal_type_names)
+    except (OSError, ValueError) as e:
+        # only the micronutrient mode needs the source datasets, the rest of the catalog still serves
+        logger.warning("micronutrient profiles unavailable: %s", e)
+        return None
+
+
+def source_paths():
+    """Files whose changes mean a new catalog version."""
+    if config.CATALOG_PATH:
+        catalog = config.CATALOG_PATH
+        pointer = os.path.join(catalog, CURRENT)
+        # the artifact carries its scaler, scaler.pkl is not read
+        return [pointer if os.path.exists(pointer) else os.path.join(catalog, MANIFEST)]
+    return [config.DATASET_PATH, config.SCALER_PATH]
+
+
+def _fingerprint(paths):
+    stamps = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            stamps.append((path, stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            stamps.append((path, None, None))
+    return tuple(stamps)
+
+
+def load_scaler(path):
+    """The pickled ``MinMaxScaler`` at ``path`` as a NumPy-only :class:`LinearScaler`."""
+    import joblib
+    from sklearn.preprocessing import MinMaxScaler
+
+    scaler = joblib.load(path)
+
+    if not isinstance(scaler, MinMaxScaler):
+        raise ValueError("Loaded scaler is not a MinMaxScaler instance")
+    return LinearScaler.from_fitted(scaler)
+
+
+def load_snapshot():
+    if config.CATALOG_PATH:
+        # prebuilt binary catalog, its matrix is memory-mapped and shared between workers
+        catalog = load_artifact(config.CATALOG_PATH)
+        # the artifact's own scaler, nothing here needs scikit-learn or pandas
+        scaler, scaler_version = catalog.scaler, _scaler_digest(catalog.scaler)
+        columns = CatalogColumns.from_artifact(catalog)
+        engine = RecommendationEngine.from_artifact(catalog, **config.index_options())
+        neighbours = NeighbourGraph.load(catalog.path)
+        nutrient_ranges = catalog.nutrient_ranges
+        version = catalog.version
+    else:
+        import pandas as pd
+
+        scaler, scaler_version = load_scaler(config.SCALER_PATH), file_digest(config.SCALER_PATH)
+        df = pd.read_csv(config.DATASET_PATH)
+        columns = CatalogColumns.from_frame(df)
+        engine = RecommendationEngine.from_frame(df, scaler, MEAL_TYPE_NAMES, **config.index_options())
+        neighbours = nutrient_ranges = None
+        version = file_digest(config.DATASET_PATH)[:12]
+    return CatalogSnapshot(f"{version}-{scaler_version[:8]}", scaler, columns, engine, neighbours=neighbours,
+                           nutrient_ranges=nutrient_ranges)
+
+
+def _scaler_digest(scaler):
+    return hashlib.sha256(np.concatenate([scaler.data_min_, scaler.data_max_]).tobytes()).hexdigest()
+
+
+class CatalogRegistry:
+    def __init__(self, loader=load_snapshot, paths=source_paths, edits=None):
+        self.current = None
+        self.last_error = None
+        self._loader = loader
+        self._paths = paths
+        self._fingerprint = None
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self.edits = EditLog(config.EDIT_LOG) if edits is None else edits
+        # version of the loaded catalog, edited versions are "<origin>+<edits applied>"
+        self._origin = None
+        self._overlay = None
+        self._applied = 0
+        self._edit_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._compact_timer = None
+
+    @property
+    def reloading(self):
+        return self._reload_lock.locked()
+
+    def reload(self, blocking=True):
+        """Build a snapshot and swap it in. Returns it, or None if another reload was running.
+
+        A failed load raises and leaves the current snapshot serving.
+        """
+        if not self._reload_lock.acquire(blocking):
+            return None
+        try:
+            fingerprint = _fingerprint(self._paths())
+            try:
+                snapshot = self._loader()
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+            with self._edit_lock:
+                self._origin = snapshot.version
+                self._overlay = None
+                self._applied = 0
+                self.current = snapshot
+                self.edits.reset()
+                self.edits.sync()
+                # compacted below in this thread, so a preloading master has no thread left at the fork
+                self._apply_edits(schedule=False)
+            self.last_error = None
+            self._fingerprint = fingerprint
+            logger.info("catalog version %s loaded", snapshot.version)
+            if self._overlay is not None:
+                self.compact()
+            return self.current
+        finally:
+            self._reload_lock.release()
+
+    def _reload_quietly(self):
+        try:
+            self.reload(blocking=False)
+        except Exception:
+            logger.exception("catalog reload failed, still serving %s",
+                             self.current.version if self.current else None)
+
+    def reload_in_background(self):
+        """Start a reload thread; returns False if a reload is already in progress."""
+        if self.reloading:
+            return False
+        threading.Thread(target=self._reload_quietly, name="catalog-reload", daemon=True).start()
+        return True
+
+    def changed(self):
+        return _fingerprint(self._paths()) != self._fingerprint
+
+    def edit(self, entry):
+        """Log an upsert or delete and publish the catalog with it applied.
+
+        Invalid edits raise ValueError before anything is logged.
+        """
+        with self._edit_lock:
+            if self.current is None:
+                raise ValueError("The catalog is not loaded yet")
+            # edits of other workers first, so this one is checked against them
+            self.edits.sync()
+            self._apply_edits()
+            self.edits.append(parse_edit(entry, self.current))
+            self.edits.sync()
+            return self._apply_edits()
+
+    def _apply_edits(self, schedule=True):
+        # called with the edit lock held
+        pending = self.edits.entries[self._applied:]
+        if not pending:
+            return self.current
+        if self._overlay is None:
+            self._overlay = CatalogOverlay(self.current)
+        for entry in pending:
+            try:
+                self._overlay.apply(entry)
+            except (ValueError, KeyError, TypeError) as e:
+                # e.g. an edit logged against a catalog with other attribute columns
+                logger.warning("skipping catalog edit %r: %s", entry, e)
+        self._applied += len(pending)
+        self.current = self._overlay.publish(f"{self._origin}+{self._applied}")
+        if schedule:
+            self._schedule_compaction()
+        return self.current
+
+    def _schedule_compaction(self):
+        if self._overlay.refit_pending or self._overlay.pending_rows() >= config.COMPACT_ROWS:
+            self.compact_in_background()
+        elif self._compact_timer is None and config.COMPACT_INTERVAL > 0:
+            self._compact_timer = threading.Timer(config.COMPACT_INTERVAL, self._compact_quietly)
+            self._compact_timer.daemon = True
+            self._compact_timer.start()
+
+    def compact(self, blocking=True):
+        """Fold the buffered edits into a new snapshot and swap it in.
+
+        Returns the served snapshot, or None if another compaction was running.
+        Edits made while it builds are applied on top of the result.
+        """
+        if not self._compact_lock.acquire(blocking):
+            return None
+        try:
+            with self._edit_lock:
+                if self._compact_timer is not None:
+                    self._compact_timer.cancel()
+                    self._compact_timer = None
+                overlay, snapshot, applied, origin = self._overlay, self.current, self._applied, self._origin
+            if overlay is None:
+                return snapshot
+            columns = compacted_columns(snapshot)
+            scaler = snapshot.scaler
+            if snapshot.refit_pending:
+                # queries are scaled with the snapshot's scaler, so they follow the refit
+                scaler = LinearScaler.fit(columns.nutrients)
+                origin = f"{origin.rsplit('-', 1)[0]}-{_scaler_digest(scaler)[:8]}"
+            engine = RecommendationEngine(scaler.transform(columns.nutrients), columns.meal_types,
+                                          snapshot.meal_type_names, **config.index_options())
+            neighbours = None
+            if not snapshot.refit_pending and snapshot.base._neighbours is not None:
+                # the same features, so a base graph in use only needs the edited foods patched in
+                live = np.flatnonzero(snapshot.live)
+                origins = np.where(live < len(snapshot.base.columns), live, -1)
+                neighbours = snapshot.base.neighbours.patched(engine, origins, config.NEIGHBOURS_MEMORY_MB)
+            # upserted foods are given in catalog units, so a refit keeps the raw ranges
+            compacted = CatalogSnapshot(f"{origin}+{applied}", scaler, columns, engine, snapshot.meal_type_names,
+                                        neighbours, nutrient_ranges=snapshot.base.nutrient_ranges)
+            with self._edit_lock:
+                if self._overlay is not overlay:
+                    # reloaded meanwhile, the reload replayed every edit itself
+                    return self.current
+                self._origin = origin
+                self._overlay = None
+                self.current = compacted
+                self._applied = applied
+                logger.info("catalog version %s compacted", compacted.version)
+                return self._apply_edits()
+        finally:
+            self._compact_lock.release()
+
+    def _compact_quietly(self):
+        try:
+            self.compact(blocking=False)
+        except Exception:
+            logger.exception("catalog compaction failed, still serving %s", self.current.version)
+
+    def compact_in_background(self):
+        """Start a compaction thread; returns False if one is already running."""
+        if self._compact_lock.locked():
+            return False
+        threading.Thread(target=self._compact_quietly, name="catalog-compact", daemon=True).start()
+        return True
+
+    def _sync_quietly(self):
+        try:
+            with self._edit_lock:
+                if self.edits.sync():
+                    self._apply_edits()
+        except Exception:
+            logger.exception("reading the catalog edit log %s failed", self.edits.path)
+
+    def start_watching(self, interval):
+        """Poll the source files every ``interval`` seconds and reload when they change."""
+        if interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+
+        def watch():
+            while True:
+                time.sleep(interval)
+                if self.changed() or self.edits.truncated():
+                    self._reload_quietly()
+                else:
+                    self._sync_quietly()
+
+        self._watcher = threading.Thread(target=watch, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def status(self):
+        current = self.current
+        overlay = self._overlay
+        return {
+            "version": current.version if current else None,
+            "loaded_at": current.loaded_at if current else None,
+            "rows": len(current.engine) if current else 0,
+            "reloading": self.reloading,
+            "last_error": self.last_error,
+            "edits": self._applied,
+            "pending_rows": overlay.pending_rows() if overlay else 0,
+            "refit_pending": overlay.refit_pending if overlay else False,
+            "compacting": self._compact_lock.locked(),
+        }
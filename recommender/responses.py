@@ -0,0 +1,103 @@
+"""Response payloads built from catalog column arrays.
+
+Selected rows are gathered in one fancy-indexing step per column instead of one
+``df.iloc`` lookup per field, and payloads are serialized compactly unless the
+client asks for pretty-printed JSON.
+"""
+import json
+
+import numpy as np
+
+from recommender.engine import NUMERIC_COLS
+
+_COMPACT = (',', ':')
+_COLUMN = {col: i for i, col in enumerate(NUMERIC_COLS)}
+# response field -> catalog column, in response order
+RECOMMENDATION_FIELDS = [
+    ('proteins', 'proteins'),
+    ('calories', 'calories'),
+    ('fat', 'fat'),
+    ('carbo', 'carbohydrate'),
+    ('nutrient_density', 'Nutrient_Density'),
+]
+DAILY_MEAL_FIELDS = [field for field in RECOMMENDATION_FIELDS if field[0] != 'proteins']
+
+
+def dumps(payload, pretty=False):
+    if pretty:
+        return json.dumps(payload, indent=4, sort_keys=False)
+    return json.dumps(payload, separators=_COMPACT, sort_keys=False)
+
+
+class CatalogColumns:
+    """Names, raw nutrient values and text attributes of every catalog row, as arrays.
+
+    ``attributes`` maps each other text column to ``(codes, categories)``.
+    """
+
+    def __init__(self, names, nutrients, meal_types, attributes=None):
+        self.names = names
+        self.nutrients = np.asarray(nutrients, dtype=np.float64)
+        self.meal_types = np.asarray(meal_types)
+        self.attributes = attributes or {}
+
+    @classmethod
+    def from_frame(cls, df):
+        attributes = {}
+        for col in df.columns:
+            if col not in NUMERIC_COLS + ['name', 'Meal Type']:
+                values = df[col].astype(str).to_numpy(dtype=object)
+                categories, codes = np.unique(values, return_inverse=True)
+                attributes[col] = (codes, categories.tolist())
+        return cls(df['name'].tolist(), df[NUMERIC_COLS].to_numpy(dtype=np.float64), df['Meal Type'].to_numpy(),
+                   attributes)
+
+    @classmethod
+    def from_artifact(cls, artifact):
+        attributes = {col: (artifact.codes[col], artifact.manifest['categories'][col]) for col in artifact.codes}
+        return cls(artifact.names, artifact.nutrients, artifact.meal_types, attributes)
+
+    def __len__(self):
+        return self.nutrients.shape[0]
+
+    def food_items(self, results, meal_type_names, fields=RECOMMENDATION_FIELDS):
+        """``{"type", "food"}`` items for ``[(meal_type, rows), ...]`` engine results."""
+        rows = np.concatenate([meal_rows for _, meal_rows in results]).astype(np.intp) if results else np.empty(0, np.intp)
+        types = [meal_type_names[meal_type] for meal_type, meal_rows in results for _ in meal_rows]
+        columns = [_COLUMN[col] for _, col in fields]
+        values = self.nutrients[np.ix_(rows, columns)].tolist()
+        keys = [key for key, _ in fields]
+        items = []
+        for meal_category, row, row_values in zip(types, rows.tolist(), values):
+            food = {"name": self.names[row]}
+            food.update(zip(keys, row_values))
+            items.append({"type": meal_category, "food": food})
+        return items
+
+    def similar_items(self, rows, scores, meal_category):
+        """Recommendation items for neighbour ``rows``, each with its ``similarity``."""
+        items = self.food_items([(None, rows)], {None: meal_category})
+        for item, score in zip(items, np.asarray(scores, dtype=np.float64).tolist()):
+            item["similarity"] = round(score, 4)
+        return items
+
+    def search_items(self, rows, scores, matches, meal_type_names):
+        """Items for name search ``rows`` in rank order, each with its ``match`` kind and ``score``."""
+        rows = np.asarray(rows, dtype=np.intp)
+        results = [(meal_type, rows[i:i + 1]) for i, meal_type in enumerate(self.meal_types[rows].tolist())]
+        items = self.food_items(results, meal_type_names)
+        for item, score, match in zip(items, np.asarray(scores, dtype=np.float64).tolist(), matches):
+            item["match"] = match
+            item["score"] = round(score, 4)
+        return items
+
+    def best_per_meal_type(self, meal_type_names, col='Nutrient_Density', allowed=None):
+        """``[(meal_type, [row])]`` with the first row of highest ``col`` in each meal type, among ``allowed``."""
+        values = self.nutrients[:, _COLUMN[col]]
+        candidates = ~np.isnan(values) if allowed is None else ~np.isnan(values) & allowed
+        results = []
+        for meal_type in meal_type_names:
+            rows = np.flatnonzero((self.meal_types == meal_type) & candidates)
+            if len(rows):
+                results.append((meal_type, rows[np.argmax(values[rows])][None]))
+        return results
@@ -0,0 +1,64 @@
+"""NumPy-only min/max scaling, the serving twin of scikit-learn's ``MinMaxScaler``.
+
+``transform`` computes ``X * scale_ + min_`` with the same operations in the
+same order as ``MinMaxScaler.transform``, so scaled values are identical
+without importing scikit-learn or paying its per-call input validation. The
+parameters round-trip through plain JSON, which is how catalog artifacts carry
+their scaler (see :mod:`recommender.artifact`).
+"""
+import numpy as np
+
+
+class LinearScaler:
+    def __init__(self, data_min, data_max, scale, min_, feature_range=(0, 1), clip=False):
+        self.data_min_ = np.asarray(data_min, dtype=np.float64)
+        self.data_max_ = np.asarray(data_max, dtype=np.float64)
+        self.scale_ = np.asarray(scale, dtype=np.float64)
+        self.min_ = np.asarray(min_, dtype=np.float64)
+        self.feature_range = tuple(feature_range)
+        self.clip = bool(clip)
+
+    @classmethod
+    def from_fitted(cls, scaler):
+        """Copy the parameters of a fitted ``MinMaxScaler`` (or another LinearScaler)."""
+        return cls(scaler.data_min_, scaler.data_max_, scaler.scale_, scaler.min_, scaler.feature_range,
+                   getattr(scaler, 'clip', False))
+
+    @classmethod
+    def fit(cls, X, feature_range=(0, 1), clip=False):
+        """Fit on the rows of ``X`` like ``MinMaxScaler().fit(X)``."""
+        X = np.asarray(X, dtype=np.float64)
+        data_min, data_max = np.nanmin(X, axis=0), np.nanmax(X, axis=0)
+        data_range = data_max - data_min
+        # constant columns are not scaled, as in scikit-learn
+        data_range[data_range < 10 * np.finfo(np.float64).eps] = 1.0
+        scale = (feature_range[1] - feature_range[0]) / data_range
+        return cls(data_min, data_max, scale, feature_range[0] - data_min * scale, feature_range, clip)
+
+    @property
+    def n_features_in_(self):
+        return self.scale_.shape[0]
+
+    def transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        X *= self.scale_
+        X += self.min_
+        if self.clip:
+            np.clip(X, self.feature_range[0], self.feature_range[1], out=X)
+        return X
+
+    def to_dict(self):
+        # json writes floats with repr, so the parameters read back unchanged
+        return {
+            'data_min': self.data_min_.tolist(),
+            'data_max': self.data_max_.tolist(),
+            'scale': self.scale_.tolist(),
+            'min': self.min_.tolist(),
+            'feature_range': list(self.feature_range),
+            'clip': self.clip,
+        }
+
+    @classmethod
+    def from_dict(cls, params):
+        return cls(params['data_min'], params['data_max'], params['scale'], params['min'],
+                   params.get('feature_range', (0, 1)), params.get('clip', False))
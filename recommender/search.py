@@ -0,0 +1,127 @@
+"""Food-name search for type-ahead, built once per catalog version.
+
+Names are normalized (case, accents and runs of whitespace folded) and indexed
+twice:
+
+* a sorted array of every word-suffix of every name, so a prefix query is two
+  binary searches and matches "gabus" in "Ikan Gabus segar" as well as
+  "ikan ga";
+* a character-trigram inverted index in CSR form. The trigram overlap with
+  every name comes from one ``bincount`` over the query's posting lists, and
+  ranking by it tolerates typos ("ayam gorng" still finds "Ayam goreng").
+
+Prefix matches rank first, whole-name prefixes before word prefixes and
+shorter names before longer ones. That order does not depend on the query, so
+it is precomputed and a query only partitions its range of the array. Fuzzy
+matches follow, best similarity first.
+"""
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+def trigrams(text):
+    padded = f' {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    def __init__(self, names, meal_types):
+        normalized = [normalize(name) for name in names]
+        self.meal_types = np.asarray(meal_types)
+        self.lengths = np.array([len(name) for name in normalized], dtype=np.int64)
+
+        suffixes = []
+        for row, name in enumerate(normalized):
+            start = 0
+            for word in name.split(' '):
+                suffixes.append((name[start:], row, start))
+                start += len(word) + 1
+        suffixes.sort()
+        self.keys = [key for key, _, _ in suffixes]
+        self.key_rows = np.array([row for _, row, _ in suffixes], dtype=np.int64)
+        starts = np.array([start for _, _, start in suffixes], dtype=np.int64)
+        order = np.lexsort((self.key_rows, self.lengths[self.key_rows], starts != 0))
+        self.key_ranks = np.empty_like(order)
+        self.key_ranks[order] = np.arange(len(order))
+
+        postings = {}
+        self.trigram_counts = np.zeros(len(normalized), dtype=np.int64)
+        for row, name in enumerate(normalized):
+            grams = trigrams(name)
+            self.trigram_counts[row] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(row)
+        self.vocabulary = {gram: i for i, gram in enumerate(postings)}
+        self.offsets = np.zeros(len(postings) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows in postings.values()], out=self.offsets[1:])
+        # rows were appended in order, so every posting list is sorted
+        self.postings = np.fromiter((row for rows in postings.values() for row in rows), dtype=np.int32,
+                                    count=self.offsets[-1])
+
+    def __len__(self):
+        return self.lengths.shape[0]
+
+    def similarity(self, query, rows=None):
+        """Trigram Jaccard similarity of ``query`` with every name, or with ``rows`` only."""
+        grams = [self.vocabulary[gram] for gram in trigrams(query) if gram in self.vocabulary]
+        lists = [self.postings[self.offsets[i]:self.offsets[i + 1]] for i in grams]
+        if rows is None:
+            counts = self.trigram_counts
+            hits = np.bincount(np.concatenate(lists), minlength=len(self)) if lists else np.zeros(len(self))
+        else:
+            counts = self.trigram_counts[rows]
+            hits = np.zeros(len(rows), dtype=np.int64)
+            for posting in lists:
+                found = np.minimum(np.searchsorted(posting, rows), len(posting) - 1)
+                hits += posting[found] == rows
+        return hits / (len(trigrams(query)) + counts - hits)
+
+    def prefix(self, query, limit, meal_type=None, allowed=None):
+        """The best ``limit`` rows with a word-suffix starting with ``query``."""
+        lo = bisect_left(self.keys, query)
+        hi = bisect_left(self.keys, query + '\U0010ffff', lo)
+        rows, ranks = self.key_rows[lo:hi], self.key_ranks[lo:hi]
+        if meal_type is not None:
+            keep = self.meal_types[rows] == meal_type
+            rows, ranks = rows[keep], ranks[keep]
+        if allowed is not None:
+            keep = allowed[rows]
+            rows, ranks = rows[keep], ranks[keep]
+        # a name can match at several words, widen until enough distinct names are found
+        k = limit
+        while True:
+            best = np.argpartition(ranks, k)[:k] if k < len(ranks) else np.arange(len(ranks))
+            best = rows[best[np.argsort(ranks[best])]]
+            _, first = np.unique(best, return_index=True)
+            if len(first) >= limit or k >= len(ranks):
+                return best[np.sort(first)][:limit]
+            k *= 2
+
+    def search(self, text, limit=10, meal_type=None, threshold=0.3, allowed=None):
+        """``(rows, scores, matches)`` of the best ``limit`` names for ``text``, among ``allowed`` rows."""
+        query = normalize(text)
+        if not query or limit <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0), []
+        rows = self.prefix(query, limit, meal_type, allowed)
+        matches = ['prefix'] * len(rows)
+        if len(rows) == limit:
+            return rows, self.similarity(query, rows), matches
+        similarity = self.similarity(query)
+        candidates = np.flatnonzero(similarity >= threshold)
+        if meal_type is not None:
+            candidates = candidates[self.meal_types[candidates] == meal_type]
+        if allowed is not None:
+            candidates = candidates[allowed[candidates]]
+        candidates = candidates[~np.isin(candidates, rows)]
+        candidates = candidates[np.lexsort((candidates, -similarity[candidates]))][:limit - len(rows)]
+        rows = np.concatenate([rows, candidates])
+        matches += ['fuzzy'] * len(candidates)
+        return rows, similarity[rows], matches
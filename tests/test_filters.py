@@ -0,0 +1,34 @@
+import numpy as np
+
+from recommender.filters import FilterIndex
+from recommender.responses import CatalogColumns
+
+# calories up to 1000 kcal, fat, proteins and carbohydrate up to 100 g
+RANGES = [[0.0, 1000.0], [0.0, 100.0], [0.0, 100.0], [0.0, 100.0]]
+
+
+def _columns():
+    # scaled catalog values: 100, 300 and 500 kcal, 5, 15 and 25 g of proteins
+    nutrients = np.array([
+        [0.1, 0.02, 0.05, 0.2, 2.5],
+        [0.3, 0.05, 0.15, 0.3, 1.33],
+        [0.5, 0.10, 0.25, 0.4, 1.1],
+    ])
+    return CatalogColumns(['a', 'b', 'c'], nutrients, [0, 1, 2])
+
+
+def test_calorie_ceiling_in_kcal_removes_rows():
+    index = FilterIndex(_columns(), RANGES)
+    assert index.mask({'max_calories': 250}).tolist() == [True, False, False]
+    assert index.mask({'max_calories': 1000}).tolist() == [True, True, True]
+
+
+def test_gram_bounds_combine():
+    index = FilterIndex(_columns(), RANGES)
+    assert index.mask({'min_proteins': 10, 'max_carbo': 35}).tolist() == [False, True, False]
+
+
+def test_bounds_follow_the_range_minimum():
+    ranges = [[50.0, 1050.0]] + RANGES[1:]
+    assert FilterIndex(_columns(), ranges).mask({'max_calories': 250}).tolist() == [True, False, False]
+    assert FilterIndex(_columns(), ranges).mask({'max_calories': 400}).tolist() == [True, True, False]
@@ -0,0 +1,40 @@
+import numpy as np
+
+from recommender.engine import RecommendationEngine
+from recommender.history import HistoryStore
+from recommender.mutations import CatalogOverlay
+from recommender.registry import CatalogSnapshot
+from recommender.responses import CatalogColumns
+from recommender.scaling import LinearScaler
+
+
+def _snapshot():
+    # 'dup' is on rows 0 and 2, as when two sources list the same food
+    nutrients = np.array([
+        [0.1, 0.02, 0.05, 0.2, 2.5],
+        [0.3, 0.05, 0.15, 0.3, 1.33],
+        [0.5, 0.10, 0.25, 0.4, 1.1],
+        [0.2, 0.04, 0.10, 0.1, 0.8],
+    ])
+    meal_types = np.array([0, 0, 3, 4])
+    columns = CatalogColumns(['dup', 'b', 'dup', 'd'], nutrients, meal_types)
+    scaler = LinearScaler.fit(nutrients)
+    engine = RecommendationEngine(scaler.transform(nutrients), meal_types)
+    return CatalogSnapshot('v1', scaler, columns, engine, micronutrients={})
+
+
+def test_eaten_name_excludes_every_row(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    snapshot = _snapshot()
+    store.record(7, ['dup'], 'eaten')
+    store.flush()
+    assert store.mask(snapshot, 7).tolist() == [False, True, False, True]
+    assert store.mask(snapshot, 8) is None
+
+
+def test_overlay_excludes_every_row_of_an_untouched_name(tmp_path):
+    store = HistoryStore(str(tmp_path / 'history.db'))
+    snapshot = CatalogOverlay(_snapshot()).publish('v1+0')
+    store.record(7, ['dup'], 'eaten')
+    store.flush()
+    assert store.mask(snapshot, 7).tolist() == [False, True, False, True]
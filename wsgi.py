@@ -0,0 +1,8 @@
+"""WSGI entry point for production serving.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+With ``preload_app`` the catalog is loaded once in the gunicorn master and the
+forked workers share it copy-on-write.
+"""
+from deployment import app